@@ -1,9 +1,8 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-import random
-
-debug = False
-
 n_rows = 10
 n_columns = 10
 n_columns_break = 5
@@ -12,143 +11,149 @@ perc_empty = 0.2
 perc_seats_occupied = 0.3
 online = True
 
-if not debug:
-    n_rows = int(input("Number of rows: "))
-    n_columns = int(input("Number of columns: "))
-    n_rows_break = int(input("Every n seats add an empty row: "))
-    n_columns_break = int(input("Every n seats add an empty column: "))
-    perc_empty = float(input("Percentage of empty spaces: "))
-    perc_seats_occupied = float(input("Percentage of seats occupied: "))
-    online = bool(input("Online(boolean):"))
-
-
-def generate():
-    cinema = np.full((n_rows, n_columns), 1)
-
-    for i in range(n_rows):
-        if((i + 1) % n_rows_break) == 0:
-            for j in range(n_columns):
-                cinema[i, j] = 0
-
-    for i in range(n_columns):
-        if((i + 1) % n_columns_break) == 0:
-            for j in range(n_rows):
-                cinema[j, i] = 0
-
-    for i in range(n_rows):
-        for j in range(n_columns):
-            if cinema[i, j] == 1:
-                temp = random.random()
-                if(temp < perc_empty):
-                    cinema[i, j] = 0
+# Chance that an arriving group has 1, 2, ..., 8 people
+GROUP_SIZE_PROBABILITIES = [0.2, 0.2, 0.2, 0.1, 0.1, 0.1, 0.05, 0.05]
+
+
+def generate(rng, n_rows=n_rows, n_columns=n_columns, n_rows_break=n_rows_break,
+             n_columns_break=n_columns_break, perc_empty=perc_empty):
+    """
+    Hall with every n_rows_break-th row and n_columns_break-th column empty,
+    and perc_empty of the other seats removed at random
+
+    Args:
+        rng: np.random.Generator
+    """
+    cinema = np.ones((n_rows, n_columns), dtype=np.uint8)
+    cinema[(np.arange(n_rows) + 1) % n_rows_break == 0, :] = 0
+    cinema[:, (np.arange(n_columns) + 1) % n_columns_break == 0] = 0
+    cinema[rng.random((n_rows, n_columns)) < perc_empty] = 0
     return cinema
 
 
 def pretty_print(cinema):
-    res = ""
-    for i in range(len(cinema)):
-        for j in range(len(cinema[i])):
-            res += str(cinema[i, j])
-        res += "\n"
-    return res
-
+    # Rows of '0' and '1' characters, each followed by a newline
+    text = np.full((cinema.shape[0], cinema.shape[1] + 1), ord("\n"), dtype=np.uint8)
+    text[:, :-1] = cinema + ord("0")
+    return text.tobytes().decode()
 
-def write_to_file(cinema, group_sizes):
-    pretty_cinema = pretty_print(cinema)
-    f = open("cinema_online.txt" if online else "cinema_offline.txt", "w")
-    f.write(str(n_rows) + "\n")
-    f.write(str(n_columns) + "\n")
-    f.write(pretty_cinema)
 
-    for group in group_sizes:
-        f.write(str(group) + " ")
+def write_to_file(cinema, group_sizes, filename="cinema_online.txt"):
+    with open(filename, "w") as f:
+        f.write(str(cinema.shape[0]) + "\n")
+        f.write(str(cinema.shape[1]) + "\n")
+        f.write(pretty_print(cinema))
+        f.write("".join(str(group) + " " for group in group_sizes))
 
 
 def count_seats(cinema):
-    n_of_people = 0
-    for i in range(len(cinema)):
-        for j in range(len(cinema[i])):
-            if (cinema[i, j] == 1):
-                n_of_people += 1
-    return n_of_people
+    return int(np.count_nonzero(cinema == 1))
 
 
-def generate_groups_offline(cinema):
-    group_sizes = np.full(8, 0)
-    n_of_people = 0
+def generate_groups(rng, cinema, perc_seats_occupied=perc_seats_occupied):
+    """
+    Groups in order of arrival, until perc_seats_occupied of the seats is taken
+    (the last group may go over it)
+    """
     n_of_seats = perc_seats_occupied * count_seats(cinema)
+    mean = np.dot(np.arange(1, 9), GROUP_SIZE_PROBABILITIES)
 
-    while(n_of_people < n_of_seats):
-        rand = random.random()
-
-        if rand < 0.2:
-            group_sizes[0] += 1
-            n_of_people += 1
-        elif rand < 0.4:
-            group_sizes[1] += 1
-            n_of_people += 2
-        elif rand < 0.6:
-            group_sizes[2] += 1
-            n_of_people += 3
-        elif rand < 0.7:
-            group_sizes[3] += 1
-            n_of_people += 4
-        elif rand < 0.8:
-            group_sizes[4] += 1
-            n_of_people += 5
-        elif rand < 0.9:
-            group_sizes[5] += 1
-            n_of_people += 6
-        elif rand < 0.95:
-            group_sizes[6] += 1
-            n_of_people += 7
-        else:
-            group_sizes[7] += 1
-            n_of_people += 8
-
-    return group_sizes
-
-
-def generate_groups_online(cinema):
-    group_sizes = np.full(0, int)
+    group_sizes = np.zeros(0, dtype=int)
     n_of_people = 0
-    n_of_seats = perc_seats_occupied * count_seats(cinema)
-
-    while(n_of_people < n_of_seats):
-        rand = random.random()
-
-        if rand < 0.2:
-            group_sizes = np.append(group_sizes, 1)
-            n_of_people += 1
-        elif rand < 0.4:
-            group_sizes = np.append(group_sizes, 2)
-            n_of_people += 2
-        elif rand < 0.6:
-            group_sizes = np.append(group_sizes, 3)
-            n_of_people += 3
-        elif rand < 0.7:
-            group_sizes = np.append(group_sizes, 4)
-            n_of_people += 4
-        elif rand < 0.8:
-            group_sizes = np.append(group_sizes, 5)
-            n_of_people += 5
-        elif rand < 0.9:
-            group_sizes = np.append(group_sizes, 6)
-            n_of_people += 6
-        elif rand < 0.95:
-            group_sizes = np.append(group_sizes, 7)
-            n_of_people += 7
-        else:
-            group_sizes = np.append(group_sizes, 8)
-            n_of_people += 8
-
-    group_sizes = np.append(group_sizes, 0)
+    while n_of_people < n_of_seats:
+        # Enough groups in one go (almost always)
+        amount = int((n_of_seats - n_of_people) / mean * 1.1) + 16
+        more = rng.choice(np.arange(1, 9), size=amount, p=GROUP_SIZE_PROBABILITIES)
+        people = n_of_people + np.cumsum(more)
+        enough = np.flatnonzero(people >= n_of_seats)
+        if len(enough) > 0:
+            more = more[: enough[0] + 1]
+        group_sizes = np.concatenate([group_sizes, more])
+        n_of_people += int(np.sum(more))
     return group_sizes
 
 
-cinema = generate()
-groups = generate_groups_online(
-    cinema) if online else generate_groups_offline(cinema)
-write_to_file(cinema, groups)
-
-print("Done")
+def generate_groups_offline(rng, cinema, perc_seats_occupied=perc_seats_occupied):
+    """Amount of groups of every size"""
+    return np.bincount(generate_groups(rng, cinema, perc_seats_occupied) - 1, minlength=8)
+
+
+def generate_groups_online(rng, cinema, perc_seats_occupied=perc_seats_occupied):
+    """Group sizes in order of arrival, ending with 0"""
+    return np.append(generate_groups(rng, cinema, perc_seats_occupied), 0)
+
+
+def generate_instance(seed, filename, online=online, **hall):
+    """
+    Writes one instance to filename
+
+    Args:
+        seed: Seed of the random generator
+        online: Online (groups in order of arrival) or offline (amount per size) instance
+        hall: generate parameters, and perc_seats_occupied
+    """
+    rng = np.random.default_rng(seed)
+    occupied = hall.pop("perc_seats_occupied", perc_seats_occupied)
+    cinema = generate(rng, **hall)
+    groups = (generate_groups_online if online else generate_groups_offline)(rng, cinema, occupied)
+    write_to_file(cinema, groups, filename)
+    return filename
+
+
+def generate_batch(amount, directory, seed=0, workers=None, **hall):
+    """
+    Writes amount offline and amount online instances to directory, in parallel.
+    Instance i uses the same hall for cinema_offline_{i}.txt and cinema_online_{i}.txt
+
+    Args:
+        seed: Seed for the whole batch, every instance gets its own seed from it
+        workers: Amount of processes (default: one per core)
+    """
+    os.makedirs(directory, exist_ok=True)
+    seeds = np.random.SeedSequence(seed).spawn(amount)
+    with ProcessPoolExecutor(workers) as pool:
+        jobs = []
+        for i, instance_seed in enumerate(seeds):
+            for kind in ("offline", "online"):
+                filename = os.path.join(directory, "cinema_{}_{}.txt".format(kind, i))
+                jobs.append(pool.submit(generate_instance, instance_seed, filename,
+                                        kind == "online", **hall))
+        return [job.result() for job in jobs]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=n_rows, help="Number of rows")
+    parser.add_argument("--columns", type=int, default=n_columns, help="Number of columns")
+    parser.add_argument("--row_break", type=int, default=n_rows_break,
+                        help="Every n seats add an empty row")
+    parser.add_argument("--column_break", type=int, default=n_columns_break,
+                        help="Every n seats add an empty column")
+    parser.add_argument("--empty", type=float, default=perc_empty,
+                        help="Percentage of empty spaces")
+    parser.add_argument("--occupied", type=float, default=perc_seats_occupied,
+                        help="Percentage of seats occupied")
+    parser.add_argument("--online", type=str, default="y" if online else "n",
+                        help="Online instance? [y|n]")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the random generator")
+    parser.add_argument("--output", type=str, default=None,
+                        help="File to write to (default: cinema_online.txt or cinema_offline.txt)")
+    parser.add_argument("--batch", type=int, default=0,
+                        help="Write this many offline and online instances to --directory instead")
+    parser.add_argument("--directory", type=str, default="instances",
+                        help="Folder for --batch")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for --batch (default: one per core)")
+    args = parser.parse_args()
+
+    hall = dict(n_rows=args.rows, n_columns=args.columns, n_rows_break=args.row_break,
+                n_columns_break=args.column_break, perc_empty=args.empty,
+                perc_seats_occupied=args.occupied)
+    if args.batch > 0:
+        generate_batch(args.batch, args.directory, args.seed, args.workers, **hall)
+    else:
+        is_online = args.online == "y"
+        filename = args.output or ("cinema_online.txt" if is_online else "cinema_offline.txt")
+        generate_instance(args.seed, filename, is_online, **hall)
+
+    print("Done")
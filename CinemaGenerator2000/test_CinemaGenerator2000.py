@@ -0,0 +1,60 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+import CinemaGenerator2000 as generator
+
+OFFLINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Offline", "Offline.py")
+sys.path.append(OFFLINE)
+from utils import read_instance, read_online_instance
+
+
+class TestGenerateInstance(unittest.TestCase):
+    """Checks that generated instances parse back with read_instance"""
+
+    hall = dict(n_rows=12, n_columns=17, n_rows_break=4, n_columns_break=6, perc_empty=0.1,
+                perc_seats_occupied=0.4)
+
+    def test_offline(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "offline.txt")
+            generator.generate_instance(3, filename, False, **self.hall)
+            cinema, people, h, v = read_instance(filename)
+
+        expected = generator.generate(np.random.default_rng(3), 12, 17, 4, 6, 0.1)
+        self.assertEqual((h, v), (12, 17))
+        self.assertTrue(np.array_equal(cinema, expected))
+        self.assertEqual(len(people), 8)
+        total = sum((size + 1) * amt for size, amt in people.items())
+        self.assertGreaterEqual(total, 0.4 * generator.count_seats(cinema))
+        self.assertLess(total, 0.4 * generator.count_seats(cinema) + 8)
+
+    def test_online(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "online.txt")
+            generator.generate_instance(4, filename, True, **self.hall)
+            cinema, groups, h, v = read_online_instance(filename)
+
+        rng = np.random.default_rng(4)
+        expected = generator.generate(rng, 12, 17, 4, 6, 0.1)
+        self.assertTrue(np.array_equal(cinema, expected))
+        self.assertEqual(groups, list(generator.generate_groups(rng, expected, 0.4)))
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as folder:
+            files = generator.generate_batch(2, folder, seed=5, workers=1, **self.hall)
+            again = generator.generate_batch(2, os.path.join(folder, "again"), seed=5, workers=1,
+                                             **self.hall)
+            self.assertEqual(len(files), 4)
+            for first, second in zip(files, again):
+                with open(first) as f, open(second) as g:
+                    self.assertEqual(f.read(), g.read())
+            # Offline and online instance i share their hall
+            self.assertTrue(np.array_equal(read_instance(files[0])[0],
+                                           read_online_instance(files[1])[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
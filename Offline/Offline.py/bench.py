@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import sys
+import tempfile
+import time
+from datetime import datetime
+import numpy as np
+from seating import Seating
+from online import OnlineSeating
+from layout import Layout, LayoutCache
+from utils import (
+    read_instance,
+    read_online_instance,
+    find_legal_start_positions,
+    get_invalid_seats,
+)
+
+BASE = os.path.dirname(os.path.abspath(__file__))
+INSTANCES = os.path.join(BASE, "..", "Offline.cs", "instances")
+ONLINE_INSTANCES = os.path.join(BASE, "..", "..", "Online", "instances")
+GENERATOR = os.path.join(BASE, "..", "..", "CinemaGenerator2000")
+
+
+def timed(fn, repeat):
+    """Median time of repeat calls of fn, and the result of the last one"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)), result
+
+
+def quiet(fn):
+    """fn without its prints"""
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return fn()
+    return run
+
+
+def bench_offline(filename, repeat, node_limit, ilp, greedy, slow):
+    """
+    Times every phase of the offline solvers on one instance
+    ilp: Also time the ILP phases
+    greedy: Also time the greedy, which takes minutes on the biggest halls
+    slow: Also time the bitset greedy and dfs, which take long on big halls
+    """
+    result = {}
+    result["read_instance"], _ = timed(lambda: read_instance(filename, cache=False), repeat)
+    result["read_instance_cached"], (cinema, people, h, v) = timed(
+        lambda: read_instance(filename, cache=True), repeat)
+
+    sizes = [size + 1 for size, amt in people.items() if amt > 0]
+    result["find_legal_start_positions"], legals = timed(
+        lambda: {n: find_legal_start_positions(n, cinema) for n in sizes}, repeat)
+    # Neighbourhood of every legal start of the smallest size, as the loop encoding does
+    smallest = min(sizes, default=1)
+    result["get_invalid_seats"], _ = timed(
+        lambda: [get_invalid_seats(x, y, smallest, smallest, v, h)
+                 for (y, x) in legals.get(smallest, [])], repeat)
+
+    # Layout of the hall from scratch, read back from disk and found in memory
+    result["layout"], _ = timed(lambda: Layout(cinema), repeat)
+    with tempfile.TemporaryDirectory() as folder:
+        Layout(cinema, folder)
+        result["layout_disk"], _ = timed(lambda: Layout(cinema, folder), repeat)
+    layouts = LayoutCache(folder=None)
+    layouts.get(cinema)
+    result["layout_memory"], _ = timed(lambda: layouts.get(cinema), repeat)
+
+    def run_greedy(bitset):
+        np.random.seed(0)
+        return Seating(cinema, people, h, v).greedy(bitset=bitset)
+    if greedy:
+        result["greedy"], (_, no_seat) = timed(lambda: run_greedy(False), repeat)
+        result["greedy_not_seated"] = int(no_seat)
+
+    if slow:
+        result["greedy_bitset"], _ = timed(lambda: run_greedy(True), repeat)
+        result["dfs"], _ = timed(
+            quiet(lambda: Seating(cinema, people, h, v).dfs(node_limit=node_limit)), repeat)
+
+    if ilp:
+        try:
+            from ilp import make_and_solve_ILP
+            run = quiet(lambda: make_and_solve_ILP(filename, encoding="clique"))
+            times = [run() for _ in range(repeat)]
+            result["ilp_encode"] = float(np.median([t[2] for t in times]))
+            result["ilp_solve"] = float(np.median([t[3] for t in times]))
+        except Exception as e:
+            # No gurobipy, or the licence does not allow this size
+            result["ilp_error"] = str(e)
+    return result
+
+
+def bench_online(filename, repeat):
+    """Times the online engine on one instance"""
+    np.random.seed(0)
+    cinema, groups, h, v = read_online_instance(filename)
+
+    def run():
+        online = OnlineSeating(cinema)
+        for size in groups:
+            online.seat(size)
+    result = {"online_groups": len(groups)}
+    result["online"], _ = timed(run, repeat)
+    return result
+
+
+def generated_instances(directory, sizes, occupancies, seed):
+    """Writes a generated hall for every (size, occupancy), returns {name: filename}"""
+    sys.path.append(GENERATOR)
+    import CinemaGenerator2000 as generator
+
+    os.makedirs(directory, exist_ok=True)
+    files = {}
+    for size in sizes:
+        for occupancy in occupancies:
+            name = "generated_{}x{}_{}".format(size, size, occupancy)
+            filename = os.path.join(directory, name + ".txt")
+            generator.generate_instance(seed, filename, online=False, n_rows=size,
+                                        n_columns=size, perc_seats_occupied=occupancy)
+            files[name] = filename
+    return files
+
+
+def run_suite(args):
+    exact = sorted(
+        (f for f in os.listdir(INSTANCES) if re.fullmatch(r"Exact\d+\.txt", f)),
+        key=lambda f: int(f[len("Exact"):-len(".txt")]),
+    )
+    cases = {f[:-len(".txt")]: os.path.join(INSTANCES, f) for f in exact}
+    cases.update(generated_instances(args.generated, args.sizes, args.occupancies, args.seed))
+    online_cases = {"online_" + f[:-len(".txt")]: os.path.join(ONLINE_INSTANCES, f)
+                    for f in args.online}
+
+    pattern = re.compile(args.cases)
+    results = {}
+    for name, filename in list(cases.items()) + list(online_cases.items()):
+        if not pattern.search(name):
+            continue
+        print("Benchmarking", name, flush=True)
+        if name in online_cases:
+            results[name] = bench_online(filename, args.repeat)
+        else:
+            _, people, h, v = read_instance(filename)
+            results[name] = bench_offline(filename, args.repeat, args.node_limit,
+                                          args.ilp == "y" and h * v <= args.ilp_seats,
+                                          h * v <= args.greedy_seats,
+                                          h * v <= args.slow_seats)
+
+    report = {
+        "meta": {
+            "date": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Written to", args.output)
+
+
+def compare(baseline, current, threshold=0.2, minimum=0.001):
+    """
+    Phases that got slower than baseline by more than threshold (relative)
+    and minimum seconds. Returns a list of (case, phase, baseline, current)
+    """
+    regressions = []
+    for case, phases in current["results"].items():
+        old_phases = baseline["results"].get(case, {})
+        for phase, seconds in phases.items():
+            old = old_phases.get(phase)
+            # Counts like greedy_not_seated are not times
+            if not isinstance(seconds, float) or not isinstance(old, float):
+                continue
+            if seconds > old * (1 + threshold) and seconds - old > minimum:
+                regressions.append((case, phase, old, seconds))
+    return regressions
+
+
+def run_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    regressions = compare(baseline, current, args.threshold, args.minimum)
+    for case, phase, old, new in regressions:
+        print("REGRESSION {} {}: {:.4f}s -> {:.4f}s ({:+.0%})".format(
+            case, phase, old, new, new / old - 1))
+    if len(regressions) == 0:
+        print("No regressions")
+    return len(regressions) == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run the benchmarks, write the results as json")
+    run.add_argument("--output", type=str, default="bench.json")
+    run.add_argument("--repeat", type=int, default=3, help="Runs per phase, the median is kept")
+    run.add_argument("--cases", type=str, default="",
+                     help="Only benchmark cases whose name matches this regular expression")
+    run.add_argument("--sizes", type=int, nargs="*", default=[25, 50, 100, 200],
+                     help="Rows (and columns) of the generated halls")
+    run.add_argument("--occupancies", type=float, nargs="*", default=[0.3, 0.6],
+                     help="Share of the seats the generated groups ask for")
+    run.add_argument("--generated", type=str,
+                     default=os.path.join(tempfile.gettempdir(), "cinema_bench"),
+                     help="Folder for the generated halls")
+    run.add_argument("--online", type=str, nargs="*", default=["TheMonsterOnline.txt"],
+                     help="Online instances (in Online/instances) to benchmark")
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--node_limit", type=int, default=2000, help="Nodes of the dfs")
+    run.add_argument("--ilp", type=str, default="y", help="Time the ILP phases (y/n)")
+    run.add_argument("--ilp_seats", type=int, default=400,
+                     help="Only time the ILP on halls with at most this many seats")
+    run.add_argument("--greedy_seats", type=int, default=100000,
+                     help="Only time the greedy on halls with at most this many seats")
+    run.add_argument("--slow_seats", type=int, default=20000,
+                     help="Only time the bitset greedy and dfs on halls with at most this many seats")
+
+    comp = commands.add_parser("compare", help="Compare results with a baseline")
+    comp.add_argument("baseline", type=str)
+    comp.add_argument("current", type=str)
+    comp.add_argument("--threshold", type=float, default=0.2,
+                      help="Relative slowdown that counts as a regression")
+    comp.add_argument("--minimum", type=float, default=0.001,
+                      help="Ignore slowdowns below this many seconds")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run_suite(args)
+    elif not run_compare(args):
+        sys.exit(1)
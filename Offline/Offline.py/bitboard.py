@@ -0,0 +1,114 @@
+import numpy as np
+
+
+def popcount(mask):
+    # int.bit_count only exists from python 3.10 on
+    return bin(mask).count("1")
+
+
+class BitBoard:
+    def __init__(self, seats):
+        """
+        Seating state with every row stored as an integer bitmask,
+        bit x of a row is set when seat x of that row is (still) available.
+
+        Args:
+            seats: Matrix without padding, 1 where there is a seat
+        """
+        self.h, self.v = seats.shape
+        self.full = (1 << self.v) - 1
+        self.seats = [self.to_mask(row == 1) for row in seats]
+        # Padding rows above and below, so placing in the first/last row needs no checks
+        self.rows = [0] + list(self.seats) + [0]
+        self.taken = [0] * (self.h + 2)
+        self.free = sum(popcount(row) for row in self.rows)
+        self.seated_amount = 0
+
+    @staticmethod
+    def to_mask(row):
+        mask = 0
+        for x in np.nonzero(row)[0]:
+            mask |= 1 << int(x)
+        return mask
+
+    def shifted(self, mask, x):
+        """mask moved so that its bit 0 lands on seat x (x may be negative)"""
+        if x >= 0:
+            return (mask << x) & self.full
+        return (mask >> -x) & self.full
+
+    def legal_starts(self, n):
+        """
+        All (row, seat) where a group of size n fits, in the same order
+        as find_legal_start_positions
+        """
+        opts = []
+        for y in range(self.h):
+            row = self.rows[y + 1]
+            starts = row
+            # A start is legal if the n - 1 seats to its right are free as well
+            for k in range(1, n):
+                starts &= row >> k
+            while starts:
+                low = starts & -starts
+                opts.append((y, low.bit_length() - 1))
+                starts ^= low
+        return opts
+
+    def exclusion(self, x, n):
+        """Seats that a group of size n at seat x takes away in its own and the neighbouring rows"""
+        same = self.shifted((1 << (n + 4)) - 1, x - 2)
+        other = self.shifted((1 << (n + 2)) - 1, x - 1)
+        return same, other
+
+    def loss(self, y, x, n):
+        """Amount of available seats lost when seating a group of size n at (y, x)"""
+        same, other = self.exclusion(x, n)
+        return (
+            popcount(self.rows[y + 1] & same)
+            + popcount(self.rows[y] & other)
+            + popcount(self.rows[y + 2] & other)
+        )
+
+    def place(self, y, x, n):
+        """
+        Seats a group of size n at (y, x)
+        Returns an undo token for undo
+        """
+        token = (y, self.rows[y], self.rows[y + 1], self.rows[y + 2], self.free)
+        same, other = self.exclusion(x, n)
+        self.free -= self.loss(y, x, n)
+        self.rows[y] &= ~other
+        self.rows[y + 1] &= ~same
+        self.rows[y + 2] &= ~other
+        self.taken[y + 1] |= ((1 << n) - 1) << x
+        self.seated_amount += n
+        return token, x, n
+
+    def undo(self, token):
+        (y, above, row, below, free), x, n = token
+        self.rows[y], self.rows[y + 1], self.rows[y + 2] = above, row, below
+        self.free = free
+        self.taken[y + 1] &= ~(((1 << n) - 1) << x)
+        self.seated_amount -= n
+
+    def to_array(self, mask):
+        """Row bitmask as an array of 0s and 1s"""
+        text = format(mask, "0%db" % self.v)[::-1].encode()
+        return np.frombuffer(text, dtype=np.uint8) - ord("0")
+
+    def matrix(self):
+        """
+        Matrix view without padding, like the seats returned by greedy:
+        2 where people are seated, 1 for the other seats, 0 otherwise
+        """
+        result = np.zeros((self.h, self.v))
+        for y in range(self.h):
+            result[y] = self.to_array(self.seats[y])
+            result[y][self.to_array(self.taken[y + 1]) == 1] = 2
+        return result
+
+    def available_seats(self):
+        """Padded available_seats matrix, as used by Seating"""
+        available = np.array([self.to_array(row) for row in self.rows[1:-1]], dtype=float)
+        return np.pad(available, (2, 2), "constant", constant_values=(0, 0))
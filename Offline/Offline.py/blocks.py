@@ -0,0 +1,330 @@
+import argparse
+import time
+from multiprocessing import Pool
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.ndimage import find_objects
+
+from seating import Seating
+from bounds import upper_bound
+from stats import Stats
+from utils import read_instance, count_seated, seated_groups, verify_cinema
+
+# (dy, dx) of the seats after a seat that a group on it can interact with:
+# 2 seats to the right in its row and the 3 seats below it (see find_violations_batch)
+STENCIL = [(0, 1), (0, 2), (1, -1), (1, 0), (1, 1)]
+
+SOLVERS = ["dp", "ilp", "greedy"]
+
+# Widest block the dp gets, its row patterns grow exponentially with the width
+DP_COLUMNS = 16
+
+
+def label_blocks(seats):
+    """
+    Splits a hall into blocks that cannot interact under the spacing rules:
+    two seats are in the same block when they are at most 2 apart in a row,
+    or at most 1 apart in neighbouring rows. So an empty row, or two empty
+    columns next to each other, separate blocks (a single aisle column does not).
+
+    Args:
+        seats: Matrix without padding, 1 where there is a seat
+
+    Returns: (labels, 0 where there is no seat and the block number (from 1) otherwise,
+              amount of blocks)
+    """
+    h, v = seats.shape
+    ys, xs = np.nonzero(seats == 1)
+    index = np.full((h + 2, v + 4), -1)
+    index[ys + 1, xs + 2] = np.arange(len(ys))
+
+    first, second = [], []
+    for dy, dx in STENCIL:
+        other = index[ys + 1 + dy, xs + 2 + dx]
+        first.append(np.flatnonzero(other >= 0))
+        second.append(other[other >= 0])
+    first, second = np.concatenate(first), np.concatenate(second)
+
+    graph = sp.csr_matrix((np.ones(len(first)), (first, second)), shape=(len(ys), len(ys)))
+    amount, components = connected_components(graph, directed=False)
+
+    labels = np.zeros((h, v), dtype=int)
+    labels[ys, xs] = components + 1
+    return labels, amount
+
+
+def split_blocks(seats, labels=None):
+    """
+    labels: label_blocks(seats)[0] when it is already known (see layout.Layout)
+    Returns: list of (y, x, hall) per block, hall is the bounding box of the block
+    with only its own seats, (y, x) where the box starts in seats
+    """
+    if labels is None:
+        labels, _ = label_blocks(seats)
+    blocks = []
+    for number, (rows, cols) in enumerate(find_objects(labels), 1):
+        hall = (labels[rows, cols] == number).astype(np.uint8)
+        blocks.append((rows.start, cols.start, hall))
+    return blocks
+
+
+def budgets(people, seats, total_seats):
+    """
+    Group budgets to solve a block with seats seats for: for every smallest size
+    waiting only the groups of that size and up, and a share of every size in
+    proportion to the seats of the block
+
+    Returns: list of people dicts
+    """
+    result = []
+    for smallest in sorted(size + 1 for size, amt in people.items() if amt > 0):
+        result.append({size: amt if size + 1 >= smallest else 0 for size, amt in people.items()})
+    share = seats / max(total_seats, 1)
+    result.append({size: int(np.ceil(amt * share)) for size, amt in people.items()})
+    return result
+
+
+def groups_used(seats, amount):
+    """Amount of groups of every size (index size - 1) seated in seats"""
+    sizes = [size for (_, _, size) in seated_groups(seats)]
+    return np.bincount(np.asarray(sizes, dtype=int) - 1, minlength=amount)[:amount]
+
+
+def solve_block(job):
+    """
+    Seating of one block: the greedy, improved by the dp or the ilp (see ilp.solve_hall)
+    until the deadline (a time.time(), None for no limit). The greedy seating is kept
+    when the exact solve seats fewer people or runs out of time, and blocks wider than
+    DP_COLUMNS only get the greedy with the dp.
+    """
+    hall, people, solver, deadline = job
+    h, v = hall.shape
+    seats, _ = Seating(hall, people, h, v).greedy()
+    if solver == "greedy" or (solver == "dp" and v > DP_COLUMNS):
+        return seats
+    left = None if deadline is None else deadline - time.time()
+    if left is not None and left <= 0:
+        return seats
+    if solver == "ilp":
+        # Only needs gurobi when it is used
+        from ilp import solve_hall
+        found = solve_hall(hall, people, threads=1, time_limit=left)
+    else:
+        found, _ = Seating(hall, people, h, v).dp(left, (seats, None))
+    return found if count_seated(found) >= count_seated(seats) else seats
+
+
+def split_groups(menus, demand, max_states=1000):
+    """
+    Knapsack over the blocks: picks one seating from the menu of every block, such
+    that together they use at most demand[i] groups of size i + 1, seating the most people.
+    Only the max_states fullest partial splits are kept after every block, so it is
+    exact unless that many different splits are possible.
+
+    Args:
+        menus: per block a list of (groups used per size, people seated)
+        demand: amount of groups waiting per size
+
+    Returns: index into the menu of every block
+    """
+    demand = np.asarray(demand, dtype=int)
+    used = np.zeros((1, len(demand)), dtype=int)
+    values = np.zeros(1, dtype=int)
+    # Per block: for every kept state its parent state and menu choice
+    parents, choices = [], []
+
+    for menu in menus:
+        counts = np.array([c for c, _ in menu], dtype=int).reshape(len(menu), len(demand))
+        seated = np.array([s for _, s in menu], dtype=int)
+
+        total = (used[:, None, :] + counts[None, :, :]).reshape(-1, len(demand))
+        value = (values[:, None] + seated[None, :]).ravel()
+        parent = np.repeat(np.arange(len(used)), len(menu))
+        choice = np.tile(np.arange(len(menu)), len(used))
+
+        fits = np.all(total <= demand, axis=1)
+        total, value, parent, choice = total[fits], value[fits], parent[fits], choice[fits]
+
+        # Fullest first, so the first of equal splits is the one to keep
+        order = np.argsort(-value, kind="stable")
+        _, first = np.unique(total[order], axis=0, return_index=True)
+        keep = order[np.sort(first)][:max_states]
+
+        used, values = total[keep], value[keep]
+        parents.append(parent[keep])
+        choices.append(choice[keep])
+
+    # Walk back from the fullest split
+    result = []
+    state = int(np.argmax(values))
+    for parent, choice in zip(reversed(parents), reversed(choices)):
+        result.append(int(choice[state]))
+        state = int(parent[state])
+    return result[::-1]
+
+
+def solve_blocks(cinema, people, solver="dp", workers=1, time_limit=None, max_states=1000,
+                 stats=None, layout=None):
+    """
+    Solves every block of the hall (see label_blocks) on its own, in workers processes,
+    and stitches the seatings back together.
+    Every block is solved for a few group budgets (see budgets, identical blocks
+    only once), split_groups divides the groups over the blocks, and the groups
+    that are left are offered to the blocks with the fewest people seated first.
+    When the blocks together use no more groups than are waiting with all groups,
+    the seating is optimal (for the dp and ilp, when every block was solved exactly
+    before the deadline).
+
+    Args:
+        cinema: Matrix without padding, 1 where there is a seat
+        people: people[i] is the amount of groups of size i + 1
+        solver: "dp", "ilp" or "greedy" (see solve_block)
+        time_limit: Seconds for the whole call, every block solve gets what is left of it
+                    and keeps its greedy seating once it runs out (the greedy always runs,
+                    so the groups that are left are still offered to the blocks)
+        stats: Stats for the blocks and solves, and the time of every phase
+        layout: layout.Layout of the hall, to take the blocks from
+
+    Returns: (matrix with 2s where people are seated, amount of people not seated) like greedy
+    """
+    stats = stats or Stats()
+    deadline = None if time_limit is None else time.time() + time_limit
+    with stats.phase("blocks"):
+        blocks = split_blocks(cinema, None if layout is None else np.asarray(layout.labels))
+    stats.count("blocks", len(blocks))
+    stats.maximum("largest_block", max([int(np.count_nonzero(hall)) for _, _, hall in blocks], default=0))
+
+    demand = np.array([people[size] for size in range(len(people))], dtype=int)
+    total_seats = int(np.count_nonzero(cinema == 1))
+    block_budgets = [budgets(people, int(np.count_nonzero(hall)), total_seats)
+                     for (_, _, hall) in blocks]
+
+    def key(hall, budget):
+        return hall.shape, hall.tobytes(), tuple(budget.values())
+
+    solved = dict()
+
+    def solve_budgets(first):
+        """Solves every block for its first budget, or for the others"""
+        # The same block (shape and seats) is only solved once per budget
+        jobs = dict()
+        for (_, _, hall), options in zip(blocks, block_budgets):
+            for budget in (options[:1] if first else options[1:]):
+                if key(hall, budget) not in solved:
+                    jobs.setdefault(key(hall, budget), (hall, budget, solver, deadline))
+        stats.count("block_solves", len(jobs))
+        if workers > 1 and len(jobs) > 1:
+            with Pool(workers) as pool:
+                seatings = pool.map(solve_block, list(jobs.values()),
+                                    chunksize=max(1, len(jobs) // (4 * workers)))
+        else:
+            seatings = [solve_block(job) for job in jobs.values()]
+        solved.update(zip(jobs, seatings))
+
+    def menu(hall, options):
+        """(groups used, people seated, seating) per solved budget, not seating anyone is always possible"""
+        result = {tuple([0] * len(demand)): (0, None)}
+        for budget in options:
+            if key(hall, budget) in solved:
+                seats = solved[key(hall, budget)]
+                result.setdefault(tuple(groups_used(seats, len(demand))), (count_seated(seats), seats))
+        return [(np.array(used), seated, seats) for used, (seated, seats) in result.items()]
+
+    with stats.phase("solve_blocks"):
+        solve_budgets(first=True)
+    # The seating of every block with all groups waiting
+    chosen = [menu(hall, options)[-1] for (_, _, hall), options in zip(blocks, block_budgets)]
+
+    everyone = np.sum([used for used, _, _ in chosen], axis=0)
+    in_time = deadline is None or time.time() < deadline
+    if np.all(everyone <= demand):
+        # Every block gets the groups it seats best, nothing to divide
+        exact = solver == "ilp" or (solver == "dp" and all(
+            hall.shape[1] <= DP_COLUMNS for (_, _, hall) in blocks))
+        stats.count("blocks_optimal", exact and in_time)
+    else:
+        # Past the deadline the blocks only have their first seatings to divide
+        if in_time:
+            with stats.phase("solve_blocks"):
+                solve_budgets(first=False)
+        with stats.phase("split_groups"):
+            menus = [menu(hall, options) for (_, _, hall), options in zip(blocks, block_budgets)]
+            picks = split_groups([[(used, seated) for used, seated, _ in m] for m in menus],
+                                 demand, max_states)
+        chosen = [m[pick] for m, pick in zip(menus, picks)]
+
+    with stats.phase("fill_blocks"):
+        # Offer the groups nobody took to the blocks that may still have room, one by one
+        left = demand - np.sum([used for used, _, _ in chosen], axis=0, dtype=int)
+        order = np.argsort([seated for _, seated, _ in chosen])
+        for i in order:
+            if not np.any(left > 0):
+                break
+            (_, _, hall), (used, seated, _) = blocks[i], chosen[i]
+            budget = dict(enumerate(int(amt) for amt in used + left))
+            if upper_bound(hall, budget) <= seated:
+                continue
+            seats = solve_block((hall, budget, solver, deadline))
+            stats.count("block_fills")
+            if count_seated(seats) > seated:
+                now = groups_used(seats, len(demand))
+                left -= now - used
+                chosen[i] = (now, count_seated(seats), seats)
+
+    solution = cinema.copy()
+    for (y, x, hall), (_, _, seats) in zip(blocks, chosen):
+        if seats is not None:
+            box = solution[y: y + hall.shape[0], x: x + hall.shape[1]]
+            box[seats == 2] = 2
+
+    total = sum((size + 1) * amt for size, amt in people.items())
+    return solution, total - count_seated(solution)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str, default="instances/instance.txt",
+                        help="Filename with offline instance")
+    parser.add_argument("--solver", type=str, default="dp", choices=SOLVERS,
+                        help="Solve the blocks with the row dynamic program, gurobi or the greedy")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Amount of processes solving blocks at the same time")
+    parser.add_argument("--time_limit", type=float, default=None,
+                        help="Seconds for all blocks together, blocks not solved in time keep the greedy seating")
+    parser.add_argument("--max_states", type=int, default=1000,
+                        help="Partial splits of the groups to keep per block")
+    parser.add_argument("--layouts", type=str, default="y",
+                        help="Take the blocks from the layout cache? [y|n]")
+    parser.add_argument("--verify", type=str, default="n",
+                        help="Check the seating against the guidelines? [y|n]")
+    parser.add_argument("--stats", type=str, default=None,
+                        help="Write the phase times and counters to this .json or .csv file")
+    parser.add_argument("--cache", type=str, default="n",
+                        help="Cache big instances next to them as .npz, so the next run skips parsing? [y|n]")
+    args = parser.parse_args()
+
+    stats = Stats()
+    with stats.phase("parse"):
+        cinema, people, h, v = read_instance(args.filename, args.cache == "y")
+    start = time.time()
+    layout = None
+    if args.layouts == "y":
+        # Not at the top, layout itself uses label_blocks
+        from layout import cache
+        with stats.phase("layout"):
+            layout, _ = cache.get(cinema, stats)
+    seats, no_seat = solve_blocks(cinema, people, args.solver, args.workers, args.time_limit,
+                                  args.max_states, stats, layout)
+    print("Output (blocks) (2=person seated)")
+    print(seats)
+    print("{} blocks, the largest has {} seats".format(
+        stats.counters["blocks"], stats.counters["largest_block"]))
+    print("Not seated", no_seat, "out of", no_seat + count_seated(seats))
+    print("Upper bound", upper_bound(cinema, people))
+    print("Execution time %s" % (time.time() - start))
+
+    if args.verify == "y":
+        verify_cinema(seats, v, h)
+    if args.stats is not None:
+        stats.write(args.stats)
@@ -0,0 +1,110 @@
+import numpy as np
+from utils import ones
+
+
+def group_sizes_waiting(people):
+    """Sizes of which at least one group is waiting"""
+    return [size + 1 for size, amt in people.items() if amt > 0]
+
+
+def run_capacities(length, sizes, gap):
+    """
+    Most people that fit in a run of free seats, for every run length up to length,
+    when groups (of any of the sizes, as many as needed) need gap empty seats between them
+
+    Returns: array, entry L is the capacity of a run of length L
+    """
+    cap = np.zeros(length + 1, dtype=int)
+    for L in range(1, length + 1):
+        # Either the first seat stays empty, or a group starts there
+        best = cap[L - 1]
+        for size in sizes:
+            if size <= L:
+                best = max(best, size + cap[max(L - size - gap, 0)])
+        cap[L] = best
+    return cap
+
+
+def row_runs(seats):
+    """Lengths of the runs of free seats per row"""
+    return [[int(end - start) for start, end in ones(row)] for row in seats]
+
+
+def row_bounds(seats, sizes):
+    """Most people every row can hold on its own, using only the horizontal rule"""
+    cap = run_capacities(seats.shape[1], sizes, gap=2)
+    return np.array([sum(cap[L] for L in runs) for runs in row_runs(seats)], dtype=int)
+
+
+def pair_bounds(seats, sizes):
+    """
+    Most people two neighbouring rows y, y + 1 can hold together.
+    People in neighbouring rows need an empty column between them, so projected
+    on one row the groups of both rows form a seating with gaps of (at least) 1,
+    on the seats that exist in either row.
+    """
+    cap = run_capacities(seats.shape[1], sizes, gap=1)
+    merged = np.logical_or(seats[:-1] == 1, seats[1:] == 1).astype(int)
+    return np.array([sum(cap[L] for L in runs) for runs in row_runs(merged)], dtype=int)
+
+
+def coupled_bound(rows, pairs):
+    """
+    Max of sum(x) over integers 0 <= x[y] <= rows[y] with x[y] + x[y + 1] <= pairs[y],
+    row by row: best[k] is the most people in the rows so far with k in the last one
+    """
+    best = np.arange(rows[0] + 1)
+    for y in range(1, len(rows)):
+        prefix = np.maximum.accumulate(best)
+        amounts = np.arange(rows[y] + 1)
+        limit = np.minimum(pairs[y - 1] - amounts, len(best) - 1)
+        best = np.where(limit >= 0, amounts + prefix[np.maximum(limit, 0)], -1)
+    return int(np.max(best))
+
+
+def knapsack_bound(seats, people, sizes):
+    """
+    Fractional knapsack over the waiting groups: in a row a group of size s uses
+    s seats and the 2 empty seats after it, and a run of length L has room for L + 2
+    of those (the last group needs no empty seats). Big groups waste the least.
+    """
+    smallest = min(sizes)
+    room = sum(L + 2 for runs in row_runs(seats) for L in runs if L >= smallest)
+    # Groups that do not fit anywhere cannot be seated at all
+    longest = max([max(runs, default=0) for runs in row_runs(seats)], default=0)
+
+    bound = 0.0
+    for size in sorted(sizes, reverse=True):
+        if size > longest:
+            continue
+        amt = people[size - 1]
+        used = min(amt, room / (size + 2))
+        bound += used * size
+        room -= used * (size + 2)
+        if room <= 0:
+            break
+    return int(np.floor(bound + 1e-9))
+
+
+def upper_bound(seats, people):
+    """
+    Upper bound on the amount of people that can be seated, in milliseconds:
+    the minimum of the people waiting, the per-row bounds combined with the
+    bounds for neighbouring rows, and a fractional knapsack over the waiting groups
+
+    Args:
+        seats: Matrix without padding, 1 where there is a free seat
+        people: people[i] is the amount of groups of size i + 1
+    """
+    sizes = group_sizes_waiting(people)
+    if len(sizes) == 0 or seats.shape[0] == 0:
+        return 0
+    waiting = sum((size + 1) * amt for size, amt in people.items())
+
+    rows = row_bounds(seats, sizes)
+    pairs = pair_bounds(seats, sizes)
+    return min(
+        int(waiting),
+        coupled_bound(rows, pairs),
+        knapsack_bound(seats, people, sizes),
+    )
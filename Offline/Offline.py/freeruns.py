@@ -0,0 +1,109 @@
+import bisect
+from collections import defaultdict
+from utils import ones
+
+
+class FreeRuns:
+    def __init__(self, seats):
+        """
+        Index of the maximal runs of free seats in every row, bucketed by length,
+        so legal start positions can be listed without scanning the hall.
+        Seating a group only splits the runs it touches in its own and the
+        neighbouring rows.
+
+        Args:
+            seats: Matrix without padding, 1 where a seat is free
+        """
+        self.h, self.v = seats.shape
+        # Per row: sorted run starts and the length of the run at every start
+        self.starts = [[] for _ in range(self.h)]
+        self.lengths = [dict() for _ in range(self.h)]
+        # length -> set of (row, start) of the runs with that length
+        self.buckets = defaultdict(set)
+
+        for y, row in enumerate(seats):
+            for start, end in ones(row):
+                self.add(y, int(start), int(end - start))
+
+    def add(self, y, start, length):
+        bisect.insort(self.starts[y], start)
+        self.lengths[y][start] = length
+        self.buckets[length].add((y, start))
+
+    def remove(self, y, start):
+        length = self.lengths[y].pop(start)
+        self.starts[y].pop(bisect.bisect_left(self.starts[y], start))
+        self.buckets[length].discard((y, start))
+        if len(self.buckets[length]) == 0:
+            del self.buckets[length]
+        return length
+
+    def legal_starts(self, n):
+        """
+        All (row, seat) where a group of size n fits, in the same order
+        as find_legal_start_positions
+        """
+        opts = []
+        for length, runs in self.buckets.items():
+            if length >= n:
+                for (y, start) in runs:
+                    opts.extend((y, x) for x in range(start, start + length - n + 1))
+        opts.sort()
+        return opts
+
+    def runs(self, y):
+        """(start, length) of the free runs in row y"""
+        return [(start, self.lengths[y][start]) for start in self.starts[y]]
+
+    def take(self, y, lo, hi):
+        """
+        Marks seats lo..hi-1 of row y as taken
+        Returns the runs that were removed, for undo
+        """
+        removed = []
+        if y < 0 or y >= self.h:
+            return removed
+        lo, hi = max(lo, 0), min(hi, self.v)
+
+        # The first run that could overlap lo..hi-1 starts at or before lo
+        i = max(bisect.bisect_right(self.starts[y], lo) - 1, 0)
+        while i < len(self.starts[y]) and self.starts[y][i] < hi:
+            start = self.starts[y][i]
+            length = self.lengths[y][start]
+            if start + length <= lo:
+                i += 1
+                continue
+            removed.append((y, start, self.remove(y, start)))
+            # Keep the parts on either side
+            if start < lo:
+                self.add(y, start, lo - start)
+                i += 1
+            if start + length > hi:
+                self.add(y, hi, start + length - hi)
+        return removed
+
+    def seat(self, y, x, n):
+        """
+        Seats a group of size n at (y, x): takes its seats, 2 on either side
+        and 1 on either side in the rows above and below
+        Returns an undo token for undo
+        """
+        removed = (
+            self.take(y, x - 2, x + n + 2)
+            + self.take(y - 1, x - 1, x + n + 1)
+            + self.take(y + 1, x - 1, x + n + 1)
+        )
+        return (y, x, n, removed)
+
+    def undo(self, token):
+        _, _, _, removed = token
+        for row in set(row for row, _, _ in removed):
+            old = [(start, length) for (r, start, length) in removed if r == row]
+            lo = min(start for start, _ in old)
+            hi = max(start + length for start, length in old)
+            # Whatever is left of the old runs lies within lo..hi-1
+            for start, _ in self.runs(row):
+                if lo <= start < hi:
+                    self.remove(row, start)
+            for start, length in old:
+                self.add(row, start, length)
@@ -1,148 +1,833 @@
-import sys
-import math
 import argparse
 import time
-from pprint import pprint
 import numpy as np
+import scipy.sparse as sp
 from tqdm import tqdm
 import gurobipy as gp
 from gurobipy import GRB
 from collections import defaultdict
 import os
 import csv
-from datetime import datetime
+from multiprocessing import Pool
 
 from seating import Seating
+from freeruns import FreeRuns
+from bounds import upper_bound
+from stats import Stats
+import layout as layouts
 from utils import (
     read_instance,
     check_legal,
     count_seated,
     verify_cinema,
+    find_violations,
     get_invalid_seats,
-    find_legal_start_positions,
+    conflicting_positions,
     filter_people,
+    seated_groups,
 )
 
 
-def make_and_solve_ILP(filename, optimized=False, configFile=""):
+def pair_conflicts(legals, xs, ys, layout=None):
+    """Function giving conflicting_positions of two sizes, from the layout when there is one"""
+    if layout is not None:
+        return layout.conflicts
+    return lambda size1, size2: conflicting_positions(legals, size1, size2, xs, ys)
+
+
+def encode_matrix(model, legals, size_to_group, group_sizes, xs, ys, cliques=False, stats=None,
+                  layout=None, lazy=False):
+    """
+    Same model as the loops in make_and_solve_ILP, but built in bulk with
+    gurobi's matrix API. Only legal start positions get a variable, so the
+    "do not seat on a 0" constraints are not needed.
+    cliques: use add_clique_constraints instead of pairwise constraints
+    stats: Stats to time the variables and constraints phases in
+    layout: layout.Layout of the hall to take the conflicting positions from,
+            legals has to come from it as well
+    lazy: only add add_row_constraints, the conflicts are left to lazy_conflicts
+
+    Returns the MVar and a list of (y, x, size) per variable
+    """
+    stats = stats or Stats()
+    conflicts = pair_conflicts(legals, xs, ys, layout)
+    group_amount = len(group_sizes)
+
+    # Variables of group g are seated[offsets[g]: offsets[g] + len(legals[size])]
+    counts = np.array([len(legals[size]) for size in group_sizes], dtype=int)
+    offsets = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+
+    with stats.phase("variables"):
+        placements = [
+            (y, x, size)
+            for size in group_sizes
+            for (y, x) in legals[size]
+        ]
+        n = len(placements)
+
+        seated = model.addMVar(n, vtype=GRB.BINARY, name="seated")
+        stats.count("variables", n)
+
+    with stats.phase("constraints"):
+        # Only one position per group
+        owner = np.repeat(np.arange(group_amount), counts)
+        one_position = sp.csr_matrix(
+            (np.ones(n), (owner, np.arange(n))), shape=(group_amount, n)
+        )
+        model.addMConstr(one_position, seated, GRB.LESS_EQUAL, np.ones(group_amount))
+        stats.count("one_position_constraints", group_amount)
+
+        if cliques:
+            add_clique_constraints(model, seated, placements, xs, ys, stats)
+            sizes = []
+        elif lazy:
+            add_row_constraints(model, seated, placements, xs, stats)
+            sizes = []
+        else:
+            sizes = sorted(size_to_group)
+
+        # Collect every conflicting pair of variables, each pair only once
+        first, second = [], []
+        for i, size1 in enumerate(sizes):
+            for size2 in sizes[i:]:
+                pos1, pos2 = conflicts(size1, size2)
+                if len(pos1) == 0:
+                    continue
+
+                groups1 = np.asarray(size_to_group[size1])
+                groups2 = np.asarray(size_to_group[size2])
+                g1, g2 = np.meshgrid(groups1, groups2, indexing="ij")
+                g1, g2 = g1.ravel(), g2.ravel()
+                if size1 == size2:
+                    # Same position pairs appear in both orders, so order the groups
+                    g1, g2 = g1[g1 < g2], g2[g1 < g2]
+
+                first.append(np.add.outer(offsets[g1], pos1).ravel())
+                second.append(np.add.outer(offsets[g2], pos2).ravel())
+
+        add_pair_constraints(model, seated, first, second, stats)
+
+    # Maximize number of people seated
+    sizes_per_var = np.asarray([size for (_, _, size) in placements])
+    model.setObjective(sizes_per_var @ seated, GRB.MAXIMIZE)
+
+    return seated, placements
+
+
+def encode_sizes(model, legals, people, xs, ys, cliques=False, stats=None, layout=None,
+                 lazy=False):
+    """
+    Aggregated formulation: one binary per (legal start position, group size)
+    instead of one per group. Groups of the same size are interchangeable, so
+    a cardinality constraint per size is all that is needed, which also
+    removes the symmetry between identical groups.
+    cliques: use add_clique_constraints instead of pairwise constraints
+    stats: Stats to time the variables and constraints phases in
+    layout: See encode_matrix
+    lazy: See encode_matrix
+
+    Returns the MVar and a list of (y, x, size) per variable
+    """
+    stats = stats or Stats()
+    conflicts = pair_conflicts(legals, xs, ys, layout)
+    sizes = sorted(legals)
+    counts = np.array([len(legals[size]) for size in sizes], dtype=int)
+    offsets = dict(zip(sizes, np.concatenate([[0], np.cumsum(counts)[:-1]])))
+
+    with stats.phase("variables"):
+        placements = [(y, x, size) for size in sizes for (y, x) in legals[size]]
+        n = len(placements)
+
+        seated = model.addMVar(n, vtype=GRB.BINARY, name="seated")
+        stats.count("variables", n)
+
+    with stats.phase("constraints"):
+        # At most as many placements of a size as there are groups of that size
+        owner = np.repeat(np.arange(len(sizes)), counts)
+        per_size = sp.csr_matrix(
+            (np.ones(n), (owner, np.arange(n))), shape=(len(sizes), n)
+        )
+        model.addMConstr(
+            per_size,
+            seated,
+            GRB.LESS_EQUAL,
+            np.array([people[size - 1] for size in sizes]),
+            name="per_size",
+        )
+        stats.count("per_size_constraints", len(sizes))
+
+        if cliques:
+            add_clique_constraints(model, seated, placements, xs, ys, stats)
+        elif lazy:
+            add_row_constraints(model, seated, placements, xs, stats)
+
+        # Collect every conflicting pair of variables, each pair only once
+        first, second = [], []
+        for i, size1 in enumerate([] if cliques or lazy else sizes):
+            for size2 in sizes[i:]:
+                pos1, pos2 = conflicts(size1, size2)
+                if size1 == size2:
+                    pos1, pos2 = pos1[pos1 < pos2], pos2[pos1 < pos2]
+
+                first.append(offsets[size1] + pos1)
+                second.append(offsets[size2] + pos2)
+
+        add_pair_constraints(model, seated, first, second, stats)
+
+    # Maximize number of people seated
+    sizes_per_var = np.asarray([size for (_, _, size) in placements])
+    model.setObjective(sizes_per_var @ seated, GRB.MAXIMIZE)
+
+    return seated, placements
+
+
+def ragged(widths):
+    """0, 1, ..., w - 1 for every width w, concatenated"""
+    return np.arange(widths.sum()) - np.repeat(np.cumsum(widths) - widths, widths)
+
+
+def clique_cells(placements, xs, ys):
+    """
+    For every placement (y, x, size) the cells it claims, such that two
+    placements conflict exactly when they claim a common cell:
+      - in its own row, its seats plus one seat on each side
+        (two groups in a row need 2 empty seats between them)
+      - between its row and the rows above and below, every boundary between
+        two neighbouring seats from the one left of the group up to the one
+        right of it (diagonal neighbours need 1 empty seat between them)
+
+    Returns (cell, placement) index arrays
+    """
+    y, x, size = np.asarray(placements, dtype=int).reshape(-1, 3).T
+    members = np.arange(len(y))
+
+    # Cells of the hall padded with one seat on each side
+    width = size + 2
+    row_cells = np.repeat(y * (xs + 2) + x, width) + ragged(width)
+    row_members = np.repeat(members, width)
+
+    # Boundaries -1..xs-1 (between seat b and b + 1) of the ys - 1 gaps
+    # between two rows. Gap r lies between row r - 1 and row r.
+    width = size + 1
+    gap_cells, gap_members = [], []
+    for gap in (y, y + 1):
+        inside = (gap > 0) & (gap < ys)
+        w = width[inside]
+        gap_cells.append(
+            ys * (xs + 2)
+            + np.repeat((gap[inside] - 1) * (xs + 1) + x[inside], w)
+            + ragged(w)
+        )
+        gap_members.append(np.repeat(members[inside], w))
+
+    return (
+        np.concatenate([row_cells] + gap_cells),
+        np.concatenate([row_members] + gap_members),
+    )
+
+
+def add_clique_constraints(model, seated, placements, xs, ys, stats=None):
+    """
+    At most one placement may claim each cell (see clique_cells). This is
+    the same set of conflicts as the pairwise constraints, but with linearly
+    many (and much stronger) constraints.
+    """
+    cells, members = clique_cells(placements, xs, ys)
+    add_cell_constraints(model, seated, cells, members, "clique_constraints", stats)
+
+
+def add_row_constraints(model, seated, placements, xs, stats=None):
+    """
+    Only the row cells of clique_cells: the conflicts between placements in the
+    same row, with one constraint per seat. Conflicts between neighbouring rows
+    are left out.
+    """
+    y, x, size = np.asarray(placements, dtype=int).reshape(-1, 3).T
+    cells = np.repeat(y * (xs + 2) + x, size + 2) + ragged(size + 2)
+    members = np.repeat(np.arange(len(y)), size + 2)
+    add_cell_constraints(model, seated, cells, members, "row_constraints", stats)
+
+
+def add_cell_constraints(model, seated, cells, members, counter, stats=None):
+    """
+    One constraint per cell claimed by more than one placement: at most one of
+    them is used. members[i] is the placement claiming cells[i], the amount of
+    constraints is counted as counter in stats.
+    """
+    # Only cells claimed by more than one placement give a constraint
+    unique, inverse, counts = np.unique(
+        cells, return_inverse=True, return_counts=True)
+    keep = counts[inverse] > 1
+    rows = np.cumsum(counts > 1) - 1
+
+    amount = int(np.count_nonzero(counts > 1))
+    if stats is not None:
+        stats.count(counter, amount)
+    if amount == 0:
+        return
+
+    matrix = sp.csr_matrix(
+        (np.ones(np.count_nonzero(keep)), (rows[inverse[keep]], members[keep])),
+        shape=(amount, seated.shape[0]),
+    )
+    model.addMConstr(matrix, seated, GRB.LESS_EQUAL, np.ones(amount))
+
+
+def add_pair_constraints(model, seated, first, second, stats=None):
+    """
+    Adds seated[first[i]] + seated[second[i]] <= 1 for every i with a single
+    sparse matrix. first and second are lists of index arrays.
+    """
+    if len(first) == 0:
+        return
+
+    first = np.concatenate(first)
+    second = np.concatenate(second)
+    pairs = len(first)
+    if stats is not None:
+        stats.count("pair_constraints", pairs)
+    if pairs == 0:
+        return
+
+    conflicts = sp.csr_matrix(
+        (
+            np.ones(2 * pairs),
+            (np.repeat(np.arange(pairs), 2), np.column_stack([first, second]).ravel()),
+        ),
+        shape=(pairs, seated.shape[0]),
+    )
+    model.addMConstr(conflicts, seated, GRB.LESS_EQUAL, np.ones(pairs))
+
+
+def best_greedy(cinema, people, ys, xs, seeds=1, bound=None):
+    """
+    Runs Seating.greedy with seeds 0..seeds-1, returns the seats with most people seated
+    Stops early when a run seats bound people
+    """
+    best = None
+    for seed in range(seeds):
+        np.random.seed(seed)
+        seats, _ = Seating(cinema, people, ys, xs).greedy()
+        if best is None or count_seated(seats) > count_seated(best):
+            best = seats
+        if bound is not None and count_seated(best) >= bound:
+            break
+    return best
+
+
+def set_greedy_start(model, seated, placements, size_to_group, greedy_seats, loop,
+                     per_size=False):
+    """
+    Uses a greedy seating as MIP start. Once gurobi accepts it, it is the incumbent,
+    so gurobi only looks for better seatings and never returns a worse one
+    per_size: placements has one variable per (y, x, size) (encode_sizes) instead
+              of one per group
+
+    Returns whether the start satisfies the constraints of the model (see start_feasible)
+    """
+    groups = seated_groups(greedy_seats)
+
+    if loop:
+        free_groups = {size: list(g) for size, g in size_to_group.items()}
+        for (y, x, size) in groups:
+            seated[x, y, free_groups[size].pop()].Start = 1
+    else:
+        # index[(y, x, size)][k] is the variable of the k-th group of that size
+        # (size_to_group[size][k]) at that position: every group of a size has
+        # the same legal positions, in the same order
+        index = defaultdict(list)
+        for i, placement in enumerate(placements):
+            index[placement].append(i)
+        used = defaultdict(int)
+        start = np.zeros(len(placements))
+        for group in groups:
+            size = group[2]
+            start[index[group][0 if per_size else used[size]]] = 1
+            used[size] += 1
+        seated.Start = start
+
+    model.update()
+    return start_feasible(model)
+
+
+def start_feasible(model, tolerance=1e-6):
+    """
+    Whether the MIP start of model satisfies all of its linear constraints, so
+    gurobi accepts it. Variables without a start count as their lower bound.
+    """
+    variables = model.getVars()
+    start = np.array(model.getAttr("Start", variables))
+    lower = np.array(model.getAttr("LB", variables))
+    start = np.where(start >= GRB.UNDEFINED, lower, start)
+    constraints = model.getConstrs()
+    if len(constraints) == 0:
+        return True
+
+    lhs = model.getA() @ start
+    rhs = np.array(model.getAttr("RHS", constraints))
+    sense = np.array(model.getAttr("Sense", constraints))
+    ok = np.where(sense == GRB.LESS_EQUAL, lhs <= rhs + tolerance,
+                  np.where(sense == GRB.GREATER_EQUAL, lhs >= rhs - tolerance,
+                           np.abs(lhs - rhs) <= tolerance))
+    return bool(ok.all())
+
+
+def gurobi_progress(stats, series="gurobi"):
+    """
+    Gurobi callback that adds the incumbent, best bound, gap and explored nodes to
+    a series of stats whenever the incumbent or the bound changes
+    """
+    last = [None]
+
+    def callback(model, where):
+        if where != GRB.Callback.MIP:
+            return
+        incumbent = model.cbGet(GRB.Callback.MIP_OBJBST)
+        bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+        if (incumbent, bound) == last[0]:
+            return
+        last[0] = (incumbent, bound)
+        # No incumbent yet is -infinity for a maximization
+        found = abs(incumbent) < GRB.INFINITY
+        stats.record(
+            series,
+            incumbent=incumbent if found else None,
+            bound=bound,
+            gap=abs(bound - incumbent) / max(abs(incumbent), 1) if found else None,
+            nodes=model.cbGet(GRB.Callback.MIP_NODCNT),
+        )
+
+    return callback
+
+
+def spacing_violations(chosen):
+    """
+    Pairs (i, j) of chosen placements (y, x, size) that break the spacing rules
+    (see check_legal). Placements only get compared with the ones in the same and
+    the next row that are near enough to conflict, not with the whole seating.
+    """
+    rows = defaultdict(list)
+    for i, (y, x, size) in enumerate(chosen):
+        rows[y].append((x, i))
+    for row in rows.values():
+        row.sort()
+
+    violations = []
+    for y, row in rows.items():
+        for k, (x1, i) in enumerate(row):
+            size1 = chosen[i][2]
+            for other, start in ((row, k + 1), (rows.get(y + 1, []), 0)):
+                for x2, j in other[start:]:
+                    if x2 > x1 + size1 + 2:
+                        break
+                    size2 = chosen[j][2]
+                    # Groups that end well before x1 cannot conflict
+                    if x2 + size2 + 2 < x1:
+                        continue
+                    if not check_legal(size1, size2, x1, x2, y, chosen[j][0])[0]:
+                        violations.append((i, j))
+    return violations
+
+
+def lazy_conflicts(seated, placements, stats, then=None):
+    """
+    Gurobi callback that checks every new incumbent with spacing_violations and
+    adds the violated conflicts as lazy constraints. Two placements in
+    neighbouring rows that conflict share a boundary cell (see clique_cells), so
+    instead of the pair, every placement claiming that cell is in the constraint.
+    Needs model.Params.LazyConstraints = 1. Calls then(model, where) as well.
+    """
+    variables = seated.tolist()
+    y, x, size = np.asarray(placements, dtype=int).reshape(-1, 3).T
+    index = defaultdict(list)
+    for i, placement in enumerate(placements):
+        index[placement].append(i)
+
+    def claiming(row, boundary):
+        # Every variable claiming the boundary on the gap below row
+        # (between seats boundary and boundary + 1)
+        near = ((y == row) | (y == row + 1)) & (x - 1 <= boundary) & (boundary <= x + size - 1)
+        return np.flatnonzero(near).tolist()
+
+    def callback(model, where):
+        if where == GRB.Callback.MIPSOL:
+            values = model.cbGetSolution(variables)
+            chosen = [placements[i] for i, value in enumerate(values) if value > 0.5]
+            for i, j in spacing_violations(chosen):
+                (y1, x1, _), (y2, x2, _) = chosen[i], chosen[j]
+                if y1 == y2:
+                    both = index[chosen[i]] + index[chosen[j]]
+                else:
+                    both = claiming(min(y1, y2), max(x1, x2) - 1)
+                model.cbLazy(gp.LinExpr([1.0] * len(both), [variables[k] for k in both]) <= 1)
+                stats.count("lazy_constraints")
+            stats.count("lazy_checks")
+        if then is not None:
+            then(model, where)
+
+    return callback
+
+
+def eager_pairs(conflicts, sizes, size_to_group=None):
+    """
+    Amount of pair constraints encode_matrix (with size_to_group) or encode_sizes
+    (without) would add, without building them
+    """
+    amount = 0
+    for i, size1 in enumerate(sizes):
+        for size2 in sizes[i:]:
+            pos1, pos2 = conflicts(size1, size2)
+            if size_to_group is None:
+                amount += int(np.count_nonzero(pos1 < pos2)) if size1 == size2 else len(pos1)
+            elif size1 == size2:
+                groups = len(size_to_group[size1])
+                amount += len(pos1) * groups * (groups - 1) // 2
+            else:
+                amount += len(pos1) * len(size_to_group[size1]) * len(size_to_group[size2])
+    return amount
+
+
+def make_and_solve_ILP(filename, optimized=False, configFile="", encoding="matrix", formulation="group",
+                       env=None, threads=0, greedy_first=False, seeds=1, stats=None,
+                       use_layouts=True, cache=False):
     """
     Encodes and solves ILP
+    env: gurobi environment to build the model in, a new one when None
+    threads: gurobi threads to use, 0 lets gurobi decide
+    greedy_first: Run the greedy (seeds times) first. Its seating is returned when it
+                  meets bounds.upper_bound, otherwise it is the MIP start of the ILP
+    encoding: "matrix" builds the model in bulk (see encode_matrix),
+              "clique" does the same with one constraint per cell (see add_clique_constraints),
+              "lazy" only adds add_row_constraints and leaves the other conflicts to a
+              callback (see lazy_conflicts), the counters lazy_constraints and
+              eager_pair_constraints tell how many were added and would have been
+              "loop" adds every constraint one at a time
+    formulation: "group" has variables per group,
+                 "size" has variables per group size (see encode_sizes, always in bulk)
+    stats: Stats that collects the time and peak memory of every phase, the model
+           size and the progress of gurobi. Nothing is printed unless stats.verbose
+    use_layouts: Take the legal positions and conflicts from layout.cache, so they
+                 are only computed once per hall (the "layout" phase, and counters
+                 layout_memory, layout_disk or layout_new, tell whether they were)
+    cache: Read the instance with the .npz cache of utils.read_instance
     """
+    stats = stats or Stats()
+
     # Prepare our problem instance
-    cinema, people, ys, xs = read_instance(filename)
+    with stats.phase("parse"):
+        cinema, people, ys, xs = read_instance(filename, cache)
+    all_people = people
+
+    layout = None
+    if use_layouts:
+        with stats.phase("layout"):
+            layout, source = layouts.cache.get(cinema, stats)
+        stats.log("Layout of the hall:", source)
 
     # Filter all the people that cannot be seated.
     # This will mean less variables in our ILP problem
-    people = filter_people(cinema, people)
+    with stats.phase("filter_people"):
+        people = filter_people(cinema, people) if layout is None else layout.filter_people(people)
 
     group_amount = int(np.sum([z for _, z in people.items()]))
     group_sizes = np.concatenate(
         [np.array(n * [i + 1], dtype=int) for i, n in people.items()]
     )
-    max_group_size = np.max(group_sizes)
     people_amount = np.sum(group_sizes)
-    print(
+    stats.count("groups", group_amount)
+    stats.count("people", people_amount)
+    stats.log(
         group_amount,
         " groups with sizes: ",
         group_sizes,
         "total people waiting:",
         people_amount,
     )
+
+    # Nobody can seat more people than this, see bounds.py
+    with stats.phase("upper_bound"):
+        bound = upper_bound(cinema, people)
+    stats.count("upper_bound", bound)
+    stats.log("Upper bound:", bound, "people")
+
+    greedyTime = 0
+    greedy_seats = None
+    if greedy_first:
+        start = time.time()
+        with stats.phase("greedy"):
+            greedy_seats = best_greedy(cinema, all_people, ys, xs, seeds, bound)
+        greedyTime = time.time() - start
+        stats.count("greedy_seated", count_seated(greedy_seats))
+        stats.log("Greedy seated", count_seated(greedy_seats))
+
+        if count_seated(greedy_seats) >= bound:
+            with stats.phase("verify"):
+                valid = verify_seating(greedy_seats, xs, ys, stats)
+            return (filename, configFile, 0, 0, group_amount, people_amount, valid,
+                    people_amount - count_seated(greedy_seats), encoding, formulation,
+                    "greedy", greedyTime, bound)
+
     start = time.time()
 
     # Collect legal positions per group size only once
-    legals = dict()
-    for size, amt in people.items():
-        if amt > 0:
-            legals[size + 1] = find_legal_start_positions(size + 1, cinema)
+    with stats.phase("legal_positions"):
+        runs = FreeRuns(cinema) if layout is None else None
+        legals = dict()
+        for size, amt in people.items():
+            if amt > 0:
+                if layout is None:
+                    legals[size + 1] = runs.legal_starts(size + 1)
+                else:
+                    legals[size + 1] = layout.starts(size + 1)
+    stats.count("legal_positions", sum(len(pos) for pos in legals.values()))
 
     # Collect group sizes
     size_to_group = defaultdict(list)
     for i, group_size in enumerate(group_sizes):
         size_to_group[group_size].append(i)
     # sys.exit(0)
-    print(size_to_group)
+    stats.log(size_to_group)
     # Instantiate a gurobi ILP model
-    model = gp.Model()
+    model = gp.Model(env=env)
+    model.Params.OutputFlag = int(stats.verbose)
 
     if not configFile == "":
         model.read(configFile)
+    if threads > 0:
+        model.Params.Threads = threads
+
+    if formulation == "size":
+        seated, placements = encode_sizes(
+            model, legals, people, xs, ys, cliques=encoding == "clique", stats=stats,
+            layout=layout, lazy=encoding == "lazy"
+        )
+    elif encoding in ("matrix", "clique", "lazy"):
+        seated, placements = encode_matrix(
+            model, legals, size_to_group, group_sizes, xs, ys,
+            cliques=encoding == "clique", stats=stats, layout=layout,
+            lazy=encoding == "lazy"
+        )
+    else:
+        seated = encode_loop(
+            model, cinema, legals, size_to_group, group_sizes, xs, ys, optimized, stats
+        )
+        placements = None
+    model.update()
+    stats.count("constraints", model.NumConstrs)
 
-    # Each group has a binary variable per possible seat
-    seated = model.addVars(xs, ys, group_amount,
-                           vtype=GRB.BINARY, name="seated")
+    warm = False
+    if greedy_seats is not None:
+        warm = set_greedy_start(model, seated, placements, size_to_group, greedy_seats,
+                                loop=formulation != "size" and encoding == "loop",
+                                per_size=formulation == "size")
+        stats.count("start_accepted", warm)
+        if not warm:
+            stats.log("Gurobi does not accept the greedy seating as MIP start")
 
-    # Every group has a constant size
-    size = model.addVars(
-        group_amount,
-        lb=tuple(group_sizes),
-        ub=tuple(group_sizes),
-        vtype=GRB.INTEGER,
-        name="groupsize",
+    # Stop as soon as a seating meets the bound, it cannot be improved
+    model.Params.BestObjStop = bound
+
+    constraintTime = time.time() - start
+
+    stats.log(
+        "DONE ENCODING IN %s seconds.. STARTING OPTIMIZATION... "
+        % (time.time() - start)
     )
+    start = time.time()
 
-    # Only one position per group
-    for g in range(group_amount):
-        model.addConstr(
-            gp.quicksum([seated[x, y, g] for x in range(xs)
-                         for y in range(ys)]),
-            GRB.LESS_EQUAL,
-            1,
+    callback = gurobi_progress(stats)
+    if encoding == "lazy":
+        model.Params.LazyConstraints = 1
+        callback = lazy_conflicts(seated, placements, stats, callback)
+
+    with stats.phase("optimize"):
+        model.optimize(callback)
+
+    optimizeTime = time.time() - start
+    stats.count("nodes", model.NodeCount)
+
+    if encoding == "lazy":
+        # Only counted after optimizing, so the peak memory of optimize is the lazy one
+        with stats.phase("eager_count"):
+            eager = eager_pairs(pair_conflicts(legals, xs, ys, layout), sorted(legals),
+                                None if formulation == "size" else size_to_group)
+        stats.count("eager_pair_constraints", eager)
+        stats.count("lazy_constraints", 0)
+        stats.log("Lazy constraints:", stats.counters["lazy_constraints"], "instead of", eager)
+
+    # Get the solution
+    solution = cinema.copy()
+    path = "warm" if warm else "ilp"
+    with stats.phase("extract"):
+        if greedy_seats is not None and model.SolCount == 0:
+            # Gurobi stopped before it found anything, not even the start
+            solution = greedy_seats
+            path = "greedy"
+        elif formulation == "size" or encoding != "loop":
+            for (y, x, size), value in zip(placements, seated.X):
+                if value > 0.5:
+                    solution[y, x: x + size] = np.zeros(size) + 2
+        else:
+            for x in range(xs):
+                for y in range(ys):
+                    for g in range(group_amount):
+                        if seated[x, y, g].x > 0:
+                            solution[y, x: x + group_sizes[g]
+                                     ] = np.zeros(group_sizes[g]) + 2
+
+    stats.log(cinema)
+    stats.log("--- Was solved in %s seconds ---" % (time.time() - start))
+    stats.log(solution)
+    stats.log("Not seated", people_amount -
+              count_seated(solution), "out of", people_amount)
+
+    with stats.phase("verify"):
+        valid = verify_seating(solution, xs, ys, stats)
+
+    return (filename, configFile, constraintTime, optimizeTime, group_amount, people_amount, valid, people_amount - count_seated(solution), encoding, formulation, path, greedyTime, bound)
+
+
+def solve_hall(cinema, people, env=None, threads=0, time_limit=None, stats=None):
+    """
+    Optimal seating of a hall given as a matrix, with the size formulation and
+    clique constraints (see encode_sizes), for callers that solve many small halls
+
+    Args:
+        cinema: Matrix without padding, 1 where there is a free seat
+        people: people[i] is the amount of groups of size i + 1
+        env: gurobi environment to build the model in, the default one when None
+        threads: gurobi threads to use, 0 lets gurobi decide
+        time_limit: Seconds gurobi may take, the best seating found so far is returned
+
+    Returns: matrix with 2s where people are seated
+    """
+    stats = stats or Stats()
+    ys, xs = cinema.shape
+    runs = FreeRuns(cinema)
+    legals = dict()
+    for size, amt in people.items():
+        if amt > 0:
+            starts = runs.legal_starts(size + 1)
+            if len(starts) > 0:
+                legals[size + 1] = starts
+    solution = cinema.copy()
+    if len(legals) == 0:
+        return solution
+
+    model = gp.Model(env=env)
+    model.Params.OutputFlag = int(stats.verbose)
+    if threads > 0:
+        model.Params.Threads = threads
+    if time_limit is not None:
+        model.Params.TimeLimit = time_limit
+    seated, placements = encode_sizes(model, legals, people, xs, ys, cliques=True, stats=stats)
+    model.Params.BestObjStop = upper_bound(cinema, people)
+
+    with stats.phase("optimize"):
+        model.optimize()
+    if model.SolCount > 0:
+        for (y, x, size), value in zip(placements, seated.X):
+            if value > 0.5:
+                solution[y, x: x + size] = 2
+    return solution
+
+
+def verify_seating(seats, xs, ys, stats):
+    """Checks a seating like verify_cinema, which only prints when stats.verbose"""
+    violations = find_violations(seats[:ys, :xs])
+    stats.count("violations", len(violations))
+    if stats.verbose:
+        verify_cinema(seats, xs, ys)
+    return len(violations) == 0
+
+
+def encode_loop(model, cinema, legals, size_to_group, group_sizes, xs, ys, optimized, stats=None):
+    """
+    Adds the variables, constraints and objective one at a time
+    stats: Stats to time the variables and constraints phases in
+    Returns the seated tupledict, indexed by (x, y, group)
+    """
+    stats = stats or Stats()
+    group_amount = len(group_sizes)
+    max_group_size = np.max(group_sizes)
+
+    with stats.phase("variables"):
+        # Each group has a binary variable per possible seat
+        seated = model.addVars(xs, ys, group_amount,
+                               vtype=GRB.BINARY, name="seated")
+
+        # Every group has a constant size
+        size = model.addVars(
+            group_amount,
+            lb=tuple(group_sizes),
+            ub=tuple(group_sizes),
+            vtype=GRB.INTEGER,
+            name="groupsize",
         )
+        stats.count("variables", xs * ys * group_amount + group_amount)
 
-    # Check for non-seats and out-of-bounds groups
-    # Do not seat a group when it will overlap with a 0-position/the end of the cinema
-    for x in range(xs):
-        for y in range(ys):
-            for g in range(group_amount):
-                # Loop over all positions from here to here + group_size
-                any_zeros = False
-                for i in range(0, group_sizes[g]):
-                    if x + i >= xs or cinema[y, x + i] == 0:
-                        any_zeros = True
-                        break
+    with stats.phase("constraints"):
+        # Only one position per group
+        for g in range(group_amount):
+            model.addConstr(
+                gp.quicksum([seated[x, y, g] for x in range(xs)
+                             for y in range(ys)])
+                <= 1
+            )
 
-                # If any positions were zero, the starting position was illegal
-                if any_zeros:
-                    model.addConstr(seated[x, y, g], GRB.EQUAL, 0)
-
-    if optimized:
-        for size1 in tqdm(range(1, max_group_size+1)):
-            for size2 in range(1, max_group_size+1):
-                    # Look for all illegal combinations
-                    # Start with every possible position where g1 can be seated using the legals dictionary
-                for (y1, x1) in legals[size1]:
-                        # Calculate illegal seats for g2 given this start position
-                    invalid_seats = get_invalid_seats(
-                        x1, y1, size1, size2, xs, ys)
-                    # Add a constraint, only one group can be seated in this area (<= 1)
-                    for (x2, y2) in invalid_seats:
-                        # For every combination of groups with these specific sizes
-                        for g1 in size_to_group[size1]:
-                            for g2 in size_to_group[size2]:
-                                if g1 != g2:
-                                    model.addConstr(
-                                        seated[x1, y1, g1] + seated[x2,
-                                                                    y2, g2], GRB.LESS_EQUAL, 1,
-                                    )
-    else:
-        # For every combination of groups g1, g2
-        for g1 in tqdm(range(group_amount)):
-            for g2 in range(group_amount):
-                if g1 > g2:
-                    size1 = group_sizes[g1]
-                    size2 = group_sizes[g2]
-                    for (y1, x1) in legals[size1]:
-                        # Calculate illegal seats for g2 given this start position
+        # Check for non-seats and out-of-bounds groups
+        # Do not seat a group when it will overlap with a 0-position/the end of the cinema
+        for x in range(xs):
+            for y in range(ys):
+                for g in range(group_amount):
+                    # Loop over all positions from here to here + group_size
+                    any_zeros = False
+                    for i in range(0, group_sizes[g]):
+                        if x + i >= xs or cinema[y, x + i] == 0:
+                            any_zeros = True
+                            break
+
+                    # If any positions were zero, the starting position was illegal
+                    if any_zeros:
+                        model.addConstr(seated[x, y, g] == 0)
+
+        if optimized:
+            for size1 in tqdm(range(1, max_group_size+1), disable=not stats.verbose):
+                for size2 in range(1, max_group_size+1):
+                        # Look for all illegal combinations
+                        # Start with every possible position where g1 can be seated using the legals dictionary
+                    for (y1, x1) in legals.get(size1, []):
+                            # Calculate illegal seats for g2 given this start position
                         invalid_seats = get_invalid_seats(
                             x1, y1, size1, size2, xs, ys)
                         # Add a constraint, only one group can be seated in this area (<= 1)
                         for (x2, y2) in invalid_seats:
-                            model.addConstr(
-                                seated[x1, y1, g1] + seated[x2,
-                                                            y2, g2], GRB.LESS_EQUAL, 1,
-                            )
-                        del invalid_seats
+                            # For every combination of groups with these specific sizes
+                            for g1 in size_to_group[size1]:
+                                for g2 in size_to_group[size2]:
+                                    if g1 != g2:
+                                        model.addConstr(
+                                            seated[x1, y1, g1] + seated[x2,
+                                                                        y2, g2] <= 1
+                                        )
+        else:
+            # For every combination of groups g1, g2
+            for g1 in tqdm(range(group_amount), disable=not stats.verbose):
+                for g2 in range(group_amount):
+                    if g1 > g2:
+                        size1 = group_sizes[g1]
+                        size2 = group_sizes[g2]
+                        for (y1, x1) in legals.get(size1, []):
+                            # Calculate illegal seats for g2 given this start position
+                            invalid_seats = get_invalid_seats(
+                                x1, y1, size1, size2, xs, ys)
+                            # Add a constraint, only one group can be seated in this area (<= 1)
+                            for (x2, y2) in invalid_seats:
+                                model.addConstr(
+                                    seated[x1, y1, g1] + seated[x2,
+                                                                y2, g2] <= 1
+                                )
+                            del invalid_seats
 
     # TODO: Add more constraints that will help fastness of solver
 
@@ -160,62 +845,154 @@ def make_and_solve_ILP(filename, optimized=False, configFile=""):
         GRB.MAXIMIZE,
     )
 
-    constraintTime = time.time() - start
+    return seated
 
-    print(
-        "DONE ENCODING IN %s seconds.. STARTING OPTIMIZATION... "
-        % (time.time() - start)
-    )
-    start = time.time()
 
-    model.optimize()
+RESULT_FIELDS = ['InstanceFile', 'ConfigFile', 'ConstraintTime', 'OptimizationTime',
+                 'TotalNumberOfGroups', 'TotalNumberOfPeople', 'Valid', 'Seated',
+                 'Encoding', 'Formulation', 'Path', 'GreedyTime', 'UpperBound',
+                 'Optimized', 'GreedyFirst', 'Layout', 'LayoutTime']
 
-    optimizeTime = time.time() - start
+# Gurobi environment of this worker process, see init_worker
+worker_env = None
+worker_threads = 0
 
-    # Get the solution
-    solution = cinema.copy()
-    for x in range(xs):
-        for y in range(ys):
-            for g in range(group_amount):
-                if seated[x, y, g].x > 0:
-                    solution[y, x: x + group_sizes[g]
-                             ] = np.zeros(group_sizes[g]) + 2
-
-    print(cinema)
-    print("--- Was solved in %s seconds ---" % (time.time() - start))
-    print(solution)
-    print("Not seated", people_amount -
-          count_seated(solution), "out of", people_amount)
-
-    valid = verify_cinema(solution, xs, ys)
-
-    return (filename, configFile, constraintTime, optimizeTime, group_amount, people_amount, valid, people_amount - count_seated(solution))
-
-
-def experiment_runner(optimize=False):
-    instanceFolder = "./Offline/instances"
-    configFolder = "./Offline/configs"
-    fields = ['InstanceFile', 'ConfigFile', 'ConstraintTime', 'OptimizationTime',
-              'TotalNumberOfGroups', 'TotalNumberOfPeople', 'Valid', 'Seated']
-    resultsFile = "./Offline/results/python_{}.csv".format(
-        datetime.now().strftime("%d-%m-%Y-%H-%M-%S"))
-
-    with open(resultsFile, 'w+', newline='') as csvfile:
-        # creating a csv writer object
-        csvwriter = csv.writer(csvfile)
-        csvwriter.writerow(fields)
 
-    for i in range(1, len(os.listdir(instanceFolder))):
-        instanceFile = "{}/Exact{}.txt".format(instanceFolder, i)
-        configFile = "{}/tune_Exact{}_0.prm".format(configFolder, i)
+worker_seeds = 1
+worker_stats = None
+worker_verbose = False
+worker_cache = False
 
-        solveResult = make_and_solve_ILP(instanceFile, optimize, configFile)
 
-        with open(resultsFile, 'a+', newline='') as csvfile:
-            # creating a csv writer object
-            csvwriter = csv.writer(csvfile)
+def init_worker(threads, seeds, statsFolder=None, verbose=False, cache=False, layoutFolder=None):
+    """
+    Creates the gurobi environment a pool worker reuses for all of its instances
+    layoutFolder: Folder of layouts.cache on disk, None keeps them in memory only
+    """
+    global worker_env, worker_threads, worker_seeds, worker_stats, worker_verbose, worker_cache
+    worker_env = gp.Env()
+    worker_threads = threads
+    worker_seeds = seeds
+    worker_stats = statsFolder
+    worker_verbose = verbose
+    worker_cache = cache
+    layouts.cache.folder = layoutFolder
+
+
+def stats_file(statsFolder, instanceFile, encoding, formulation, optimize, greedy_first):
+    name = os.path.splitext(os.path.basename(instanceFile))[0]
+    return os.path.join(statsFolder, "{}_{}_{}{}{}.json".format(
+        name, encoding, formulation, "_optimized" if optimize else "",
+        "_greedy" if greedy_first else ""))
+
+
+def solve_job(job):
+    instanceFile, configFile, optimize, encoding, formulation, greedy_first = job
+    stats = Stats(worker_verbose)
+    try:
+        result = make_and_solve_ILP(
+            instanceFile, optimize, configFile, encoding, formulation,
+            env=worker_env, threads=worker_threads,
+            greedy_first=greedy_first, seeds=worker_seeds, stats=stats, cache=worker_cache)
+    except gp.GurobiError as e:
+        # No row, so the instance is tried again on the next run
+        print("Could not solve {}: {}".format(instanceFile, e))
+        return None
+    if worker_stats is not None:
+        stats.write(stats_file(worker_stats, instanceFile, encoding, formulation,
+                               optimize, greedy_first))
+    return list(result) + [bool(optimize), bool(greedy_first), layouts.source(stats),
+                           stats.times.get("layout", 0.0)]
+
+
+def done_jobs(resultsFile):
+    """
+    (instance, config, encoding, formulation, optimized, greedy first) of every row already in resultsFile
+    Raises ValueError when resultsFile has other columns than RESULT_FIELDS, new rows would not fit in it
+    """
+    done = set()
+    if not os.path.exists(resultsFile) or os.path.getsize(resultsFile) == 0:
+        return done
+    with open(resultsFile, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        if reader.fieldnames != RESULT_FIELDS:
+            raise ValueError(
+                "{} has the columns {} instead of {}, it was written by an older version. "
+                "Move it away or pass another results file".format(
+                    resultsFile, reader.fieldnames, RESULT_FIELDS))
+        for row in reader:
+            done.add((row['InstanceFile'], row['ConfigFile'], row['Encoding'],
+                      row['Formulation'], row['Optimized'], row['GreedyFirst']))
+    return done
+
+
+def experiment_runner(optimize=False, encoding="matrix", formulation="group",
+                      instanceFolder=None, configFolder=None, resultsFile=None,
+                      workers=1, threads=0, greedy_first=False, seeds=1,
+                      statsFolder=None, verbose=False, cache=False, layoutFolder=None):
+    """
+    Solves all Exact{i}.txt instances in instanceFolder and writes a row per instance
+    to resultsFile as soon as it is done. Instances that already have a row for this
+    config and mode are skipped, so an interrupted run can be resumed.
+
+    Args:
+        workers: Amount of processes solving instances at the same time
+        threads: Gurobi threads per worker, 0 spreads the cores over the workers
+        greedy_first, seeds: See make_and_solve_ILP
+        statsFolder: Write the Stats of every instance to a .json file in this folder
+        verbose: Print the progress of every instance and gurobi's log
+        cache: Read the instances with the .npz cache of utils.read_instance
+        layoutFolder: Keep the layouts of the halls on disk in this folder as well
+                      (see layout.LayoutCache), None keeps them in memory only
+    """
+    base = os.path.dirname(os.path.abspath(__file__))
+    if instanceFolder is None:
+        instanceFolder = os.path.join(base, "..", "Offline.cs", "instances")
+    if configFolder is None:
+        configFolder = os.path.join(base, "..", "Offline.cs", "configs")
+    if resultsFile is None:
+        resultsFile = os.path.join(base, "..", "results", "python.csv")
+    if threads == 0:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+
+    instances = sorted(
+        (f for f in os.listdir(instanceFolder) if f.startswith("Exact") and f.endswith(".txt")),
+        key=lambda f: int(f[len("Exact"):-len(".txt")]),
+    )
+
+    done = done_jobs(resultsFile)
+    jobs = []
+    for instance in instances:
+        instanceFile = os.path.join(instanceFolder, instance)
+        configFile = os.path.join(
+            configFolder, "tune_{}_0.prm".format(instance[:-len(".txt")]))
+        if not os.path.exists(configFile):
+            print("No tune file for {}, solving it with the default parameters".format(instance))
+            configFile = ""
+        mode = (encoding, formulation, str(bool(optimize)), str(bool(greedy_first)))
+        if (instanceFile, configFile) + mode in done:
+            continue
+        jobs.append((instanceFile, configFile, optimize, encoding, formulation, greedy_first))
+    print("{} of {} instances left to solve".format(len(jobs), len(instances)))
+
+    os.makedirs(os.path.dirname(os.path.abspath(resultsFile)), exist_ok=True)
+    if statsFolder is not None:
+        os.makedirs(statsFolder, exist_ok=True)
+    new_file = not os.path.exists(resultsFile) or os.path.getsize(resultsFile) == 0
+    with open(resultsFile, 'a', newline='') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        if new_file:
+            csvwriter.writerow(RESULT_FIELDS)
+            csvfile.flush()
 
-            csvwriter.writerow(np.asarray(solveResult))
+        # Biggest files first, so a slow instance does not start last
+        jobs.sort(key=lambda job: os.path.getsize(job[0]), reverse=True)
+        with Pool(workers, initializer=init_worker, initargs=(threads, seeds, statsFolder, verbose, cache, layoutFolder)) as pool:
+            for result in pool.imap_unordered(solve_job, jobs):
+                if result is None:
+                    continue
+                csvwriter.writerow(result)
+                csvfile.flush()
 
 
 if __name__ == "__main__":
@@ -232,11 +1009,114 @@ if __name__ == "__main__":
         default='',
         help="Use our Optimized^TM group looper",
     )
+    parser.add_argument(
+        "--encoding",
+        type=str,
+        default="matrix",
+        choices=["matrix", "clique", "lazy", "loop"],
+        help="Build the model in bulk with pairwise (matrix), per cell (clique) or lazily added (lazy) conflicts, or one constraint at a time (loop)",
+    )
+    parser.add_argument(
+        "--formulation",
+        type=str,
+        default="group",
+        choices=["group", "size"],
+        help="Binary variables per group (group) or per group size (size)",
+    )
+    parser.add_argument(
+        "--experiments",
+        type=str,
+        default="n",
+        help="Solve all Exact{i}.txt instances and write the results to a .csv (y/n)",
+    )
+    parser.add_argument(
+        "--instances",
+        type=str,
+        default=None,
+        help="Folder with the Exact{i}.txt instances (default: ../Offline.cs/instances)",
+    )
+    parser.add_argument(
+        "--configs",
+        type=str,
+        default=None,
+        help="Folder with the tune_Exact{i}_0.prm files (default: ../Offline.cs/configs)",
+    )
+    parser.add_argument(
+        "--results",
+        type=str,
+        default=None,
+        help="Results .csv, rows already in it are skipped (default: ../results/python.csv)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Amount of instances to solve in parallel",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=0,
+        help="Gurobi threads per worker, 0 divides the cores over the workers",
+    )
+    parser.add_argument(
+        "--greedy_first",
+        type=str,
+        default="n",
+        help="Run the greedy first, skip the ILP when it is provably optimal and warm start it otherwise (y/n)",
+    )
+    parser.add_argument(
+        "--seeds",
+        type=int,
+        default=1,
+        help="Amount of greedy runs (with different seeds) to take the best of with --greedy_first",
+    )
+    parser.add_argument(
+        "--stats",
+        type=str,
+        default=None,
+        help="Write the phase times, counters, peak memory and gurobi progress to this .json or .csv file (with --experiments: a folder with a .json per instance)",
+    )
+    parser.add_argument(
+        "--verbose",
+        type=str,
+        default="n",
+        help="Print the hall, the solution and gurobi's log (y/n)",
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        default="n",
+        help="Cache big instances next to them as .npz, so the next run skips parsing (y/n)",
+    )
+    parser.add_argument(
+        "--layout_folder",
+        type=str,
+        default=None,
+        help="Also keep the hall layouts as .npy files in this folder, e.g. ../layouts (default: in memory only)",
+    )
     args = parser.parse_args()
 
-    args.experiments = True
-
-    if args.experiments:
-        experiment_runner(args.optimize)
+    if args.experiments == "y":
+        experiment_runner(args.optimize, args.encoding, args.formulation,
+                          args.instances, args.configs, args.results,
+                          args.workers, args.threads,
+                          args.greedy_first == "y", args.seeds,
+                          args.stats, args.verbose == "y", args.cache == "y",
+                          args.layout_folder)
     else:
-        make_and_solve_ILP(args.filename, args.optimize)
+        layouts.cache.folder = args.layout_folder
+        stats = Stats(args.verbose == "y")
+        result = make_and_solve_ILP(args.filename, args.optimize,
+                                    encoding=args.encoding, formulation=args.formulation,
+                                    greedy_first=args.greedy_first == "y", seeds=args.seeds,
+                                    stats=stats, cache=args.cache == "y")
+        print("Seated {} out of {} people ({}), valid: {}, layout: {} ({:.3f}s)".format(
+            result[5] - result[7], result[5], result[10], result[6],
+            layouts.source(stats), stats.times.get("layout", 0.0)))
+        if "eager_pair_constraints" in stats.counters:
+            print("Lazy constraints: {} instead of {} pairs, peak memory {:.0f} MB".format(
+                stats.counters["lazy_constraints"], stats.counters["eager_pair_constraints"],
+                stats.memory["optimize"] or 0))
+        if args.stats is not None:
+            stats.write(args.stats)
@@ -0,0 +1,179 @@
+import argparse
+import time
+import numpy as np
+import gurobipy as gp
+from gurobipy import GRB
+
+import layout as layouts
+from ilp import encode_sizes, solve_hall
+from bounds import upper_bound
+from stats import Stats
+from utils import read_instance, count_seated, find_violations
+
+
+class HallSolver:
+    def __init__(self, cinema, people, env=None, threads=0, cliques=True, stats=None):
+        """
+        Gurobi model of one hall that stays alive while the demand changes.
+        It has a binary per (legal start position, group size) for every size
+        that fits in the hall (see encode_sizes), so a booking or a cancellation
+        only changes the right hand side of one per size constraint, and the
+        previous seating is the MIP start of the next solve.
+
+        Args:
+            cinema: Matrix without padding, 1 where there is a seat
+            people: people[i] is the amount of groups of size i + 1
+            env: gurobi environment to build the model in, the default one when None
+            threads: gurobi threads to use, 0 lets gurobi decide
+            cliques: Use clique constraints instead of pairwise ones
+            stats: Stats for the encoding and every solve (series "resolve")
+        """
+        self.stats = stats or Stats()
+        self.cinema = cinema
+        self.ys, self.xs = cinema.shape
+        self.people = {size: int(people.get(size, 0)) for size in range(layouts.MAX_SIZE)}
+
+        with self.stats.phase("layout"):
+            layout, _ = layouts.cache.get(cinema, self.stats)
+        # Every size that fits gets variables, also when no group of it is waiting yet
+        self.legals = {size + 1: layout.starts(size + 1) for size in layout.filter_people(self.people)}
+        if len(self.legals) == 0:
+            raise ValueError("No group fits in the hall")
+        self.sizes = sorted(self.legals)
+
+        self.model = gp.Model(env=env)
+        self.model.Params.OutputFlag = int(self.stats.verbose)
+        if threads > 0:
+            self.model.Params.Threads = threads
+        self.seated, self.placements = encode_sizes(
+            self.model, self.legals, self.people, self.xs, self.ys, cliques=cliques,
+            stats=self.stats, layout=None if cliques else layout)
+        self.model.update()
+        self.per_size = {size: self.model.getConstrByName("per_size[{}]".format(i))
+                         for i, size in enumerate(self.sizes)}
+        self.placement_sizes = np.array([size for (_, _, size) in self.placements], dtype=int)
+        self.solution = np.zeros(len(self.placements))
+
+    def set_demand(self, people):
+        """Changes the amount of groups of every size waiting, people[i] for size i + 1"""
+        for size, amt in people.items():
+            self.people[size] = int(amt)
+            if size + 1 in self.per_size:
+                self.per_size[size + 1].RHS = int(amt)
+
+    def book(self, size, amount=1):
+        """amount more groups of size are waiting (fewer when amount < 0)"""
+        self.set_demand({size - 1: max(self.people.get(size - 1, 0) + amount, 0)})
+
+    def cancel(self, size, amount=1):
+        self.book(size, -amount)
+
+    def start(self):
+        """
+        Previous solution as MIP start: after cancellations it may seat more groups
+        of a size than are waiting, those are dropped (the last ones first)
+        """
+        start = (self.solution > 0.5).astype(float)
+        for size in self.sizes:
+            chosen = np.flatnonzero((start > 0) & (self.placement_sizes == size))
+            extra = len(chosen) - self.people.get(size - 1, 0)
+            if extra > 0:
+                start[chosen[-extra:]] = 0
+        return start
+
+    def solve(self, time_limit=None):
+        """
+        Re-optimizes for the current demand, warm started from the previous solution.
+        When gurobi finds no seating in time_limit seconds (None for no limit), the
+        start is kept (counted as "failed_solves")
+
+        Returns: (matrix with 2s where people are seated, amount of people not seated) like greedy
+        """
+        begin = time.perf_counter()
+        self.seated.Start = self.start()
+        # Stop as soon as a seating meets the bound of the current demand
+        self.model.Params.BestObjStop = upper_bound(self.cinema, self.people)
+        self.model.Params.TimeLimit = GRB.INFINITY if time_limit is None else time_limit
+
+        with self.stats.phase("optimize"):
+            self.model.optimize()
+        if self.model.SolCount > 0:
+            self.solution = np.array(self.seated.X)
+        else:
+            # The previous solution without the groups that are no longer waiting
+            self.solution = self.start()
+            self.stats.count("failed_solves")
+        self.stats.count("solves")
+        self.stats.record("resolve", seconds=time.perf_counter() - begin,
+                          nodes=self.model.NodeCount,
+                          seated=int(self.placement_sizes @ (self.solution > 0.5)))
+
+        seats = self.cinema.copy()
+        for (y, x, size), value in zip(self.placements, self.solution):
+            if value > 0.5:
+                seats[y, x: x + size] = 2
+        total = sum((size + 1) * amt for size, amt in self.people.items())
+        return seats, total - count_seated(seats)
+
+
+def random_changes(rng, people, amount, max_size=8):
+    """amount random bookings (+1) and cancellations (-1) of group sizes, as (size, change)"""
+    people = dict(people)
+    changes = []
+    for _ in range(amount):
+        size = int(rng.integers(1, max_size + 1))
+        change = -1 if people.get(size - 1, 0) > 0 and rng.random() < 0.5 else 1
+        people[size - 1] = people.get(size - 1, 0) + change
+        changes.append((size, change))
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str, default="instances/instance3.txt",
+                        help="Filename with offline instance")
+    parser.add_argument("--changes", type=int, default=20,
+                        help="Amount of random bookings and cancellations to re-solve after")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the changes")
+    parser.add_argument("--compare", type=str, default="n",
+                        help="Also solve every change from scratch (ilp.solve_hall)? [y|n]")
+    parser.add_argument("--verbose", type=str, default="n",
+                        help="Print gurobi's log (y/n)")
+    parser.add_argument("--stats", type=str, default=None,
+                        help="Write the phase times, counters and re-solve times to this .json or .csv file")
+    parser.add_argument("--cache", type=str, default="n",
+                        help="Cache big instances next to them as .npz, so the next run skips parsing? [y|n]")
+    args = parser.parse_args()
+
+    cinema, people, h, v = read_instance(args.filename, args.cache == "y")
+    stats = Stats(args.verbose == "y")
+    start = time.perf_counter()
+    solver = HallSolver(cinema, people, stats=stats)
+    seats, no_seat = solver.solve()
+    print("First solve (encoding included): {:.3f}s, seated {} out of {}".format(
+        time.perf_counter() - start, count_seated(seats), count_seated(seats) + no_seat))
+
+    times, scratch = [], []
+    for size, change in random_changes(np.random.default_rng(args.seed), people, args.changes):
+        start = time.perf_counter()
+        solver.book(size, change)
+        seats, no_seat = solver.solve()
+        times.append(time.perf_counter() - start)
+        print("{} a group of {}: {:.3f}s, seated {} out of {}{}".format(
+            "Booked" if change > 0 else "Cancelled", size, times[-1], count_seated(seats),
+            count_seated(seats) + no_seat,
+            "" if len(find_violations(seats)) == 0 else " (INVALID)"))
+        if args.compare == "y":
+            start = time.perf_counter()
+            fresh = solve_hall(cinema, solver.people)
+            scratch.append(time.perf_counter() - start)
+            if count_seated(fresh) != count_seated(seats):
+                print("  from scratch seated", count_seated(fresh))
+
+    if len(times) > 0:
+        print("Re-solve: median {:.3f}s, max {:.3f}s".format(np.median(times), np.max(times)))
+    if len(scratch) > 0:
+        print("From scratch: median {:.3f}s, max {:.3f}s".format(np.median(scratch), np.max(scratch)))
+    if args.stats is not None:
+        stats.write(args.stats)
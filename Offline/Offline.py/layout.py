@@ -0,0 +1,167 @@
+import os
+import hashlib
+import tempfile
+from collections import OrderedDict
+import numpy as np
+
+from freeruns import FreeRuns
+from blocks import label_blocks
+from utils import conflicting_positions, filter_people
+
+MAX_SIZE = 8
+
+# Next to results/, e.g. for LayoutCache(folder=FOLDER)
+FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "layouts")
+
+
+def layout_key(seats):
+    """Hash of the seats of a hall (and its shape)"""
+    seats = np.ascontiguousarray(seats == 1, dtype=np.uint8)
+    digest = hashlib.sha1(np.array(seats.shape, dtype=np.int64).tobytes())
+    digest.update(seats.tobytes())
+    return digest.hexdigest()
+
+
+class Layout:
+    def __init__(self, seats, folder=None):
+        """
+        Everything about a hall that does not depend on the groups waiting:
+        the legal start positions of every group size, the blocks (see
+        blocks.label_blocks) and, when asked for, the pairs of start positions
+        that conflict (see utils.conflicting_positions).
+
+        With a folder, every array is also written to (and read from) a .npy
+        file in folder/<key>/, memory mapped when it is read back.
+
+        Args:
+            seats: Matrix without padding, 1 where there is a seat
+            folder: Folder of the layouts on disk, None keeps it in memory only
+        """
+        self.seats = np.asarray(seats == 1, dtype=np.uint8)
+        self.ys, self.xs = self.seats.shape
+        self.key = layout_key(self.seats)
+        self.path = None if folder is None else os.path.join(folder, self.key)
+        self.pairs = dict()
+
+        runs = None
+        self.legals = dict()
+        for size in range(1, MAX_SIZE + 1):
+            self.legals[size] = self.load("legal_{}".format(size))
+            if self.legals[size] is None:
+                runs = runs or FreeRuns(self.seats)
+                self.legals[size] = self.save(
+                    "legal_{}".format(size),
+                    np.array(runs.legal_starts(size), dtype=np.int32).reshape(-1, 2))
+
+        self.labels = self.load("blocks")
+        if self.labels is None:
+            self.labels = self.save("blocks", label_blocks(self.seats)[0].astype(np.int32))
+        self.blocks = int(self.labels.max(initial=0))
+
+        if self.path is not None and self.load("seats") is None:
+            self.save("seats", self.seats)
+
+    def load(self, name):
+        """Array name from disk (memory mapped), None when it is not there"""
+        if self.path is None:
+            return None
+        try:
+            return np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+
+    def save(self, name, array):
+        """Writes array name to disk (when there is a folder), returns it"""
+        if self.path is None:
+            return array
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            # Written under another name first, so readers never see half a file
+            handle, temporary = tempfile.mkstemp(dir=self.path, suffix=".npy")
+            with os.fdopen(handle, "wb") as f:
+                np.save(f, array)
+            os.replace(temporary, os.path.join(self.path, name + ".npy"))
+        except OSError:
+            # Read-only folder, keep it in memory only
+            pass
+        return array
+
+    def legal(self, size):
+        """Legal start positions of a group of size as an array of (y, x), sizes above MAX_SIZE are kept in memory only"""
+        if size not in self.legals:
+            self.legals[size] = np.array(
+                FreeRuns(self.seats).legal_starts(size), dtype=np.int32).reshape(-1, 2)
+        return self.legals[size]
+
+    def starts(self, size):
+        """Legal start positions of a group of size as a list of (y, x), like FreeRuns.legal_starts"""
+        return [(int(y), int(x)) for y, x in self.legal(size)]
+
+    def filter_people(self, people):
+        """utils.filter_people with the legal start positions of the layout"""
+        return filter_people(self.seats, people, self.legal)
+
+    def conflicts(self, size1, size2):
+        """
+        (index into legals[size1], index into legals[size2]) of every pair of
+        start positions that cannot both be used, computed once per pair of sizes
+        """
+        if (size1, size2) not in self.pairs:
+            name = "conflicts_{}_{}".format(size1, size2)
+            first, second = self.load(name + "_first"), self.load(name + "_second")
+            if first is None or second is None:
+                # Sizes above MAX_SIZE are only made when they are asked for
+                self.legal(size1)
+                self.legal(size2)
+                first, second = conflicting_positions(self.legals, size1, size2, self.xs, self.ys)
+                self.save(name + "_first", first)
+                self.save(name + "_second", second)
+            self.pairs[(size1, size2)] = (first, second)
+        return self.pairs[(size1, size2)]
+
+
+class LayoutCache:
+    def __init__(self, capacity=8, folder=None):
+        """
+        The layouts of the last capacity halls in memory, and all of them in
+        folder (None: in memory only)
+        """
+        self.capacity = capacity
+        self.folder = folder
+        self.layouts = OrderedDict()
+
+    def get(self, seats, stats=None):
+        """
+        Layout of seats, stats counts whether it was in memory, on disk or new
+        (counters layout_memory, layout_disk and layout_new)
+
+        Returns: (layout, "memory" | "disk" | "new")
+        """
+        key = layout_key(seats)
+        if key in self.layouts:
+            self.layouts.move_to_end(key)
+            source = "memory"
+            layout = self.layouts[key]
+        else:
+            on_disk = self.folder is not None and os.path.exists(
+                os.path.join(self.folder, key, "seats.npy"))
+            layout = Layout(seats, self.folder)
+            source = "disk" if on_disk else "new"
+            self.layouts[key] = layout
+            if len(self.layouts) > self.capacity:
+                self.layouts.popitem(last=False)
+        if stats is not None:
+            stats.count("layout_" + source)
+        return layout, source
+
+
+def source(stats):
+    """Where LayoutCache.get found the layout counted in stats: "memory", "disk", "new" or "" """
+    for where in ("memory", "disk", "new"):
+        if stats.counters.get("layout_" + where, 0) > 0:
+            return where
+    return ""
+
+
+# Layouts of this process, set cache.folder to keep them on disk as well
+cache = LayoutCache()
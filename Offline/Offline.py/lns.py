@@ -0,0 +1,169 @@
+import argparse
+import time
+import numpy as np
+
+from seating import Seating
+from blocks import solve_block, DP_COLUMNS
+from bounds import upper_bound
+from stats import Stats
+from utils import read_instance, count_seated, seated_groups, verify_cinema
+
+WINDOWS = ["rect", "rows", "both"]
+
+
+def window_seats(cinema, groups, y0, y1, x0, x1):
+    """
+    Seats of cinema[y0:y1, x0:x1] that a group may use next to groups: 1 where
+    there is a seat that is not taken or too close to one of groups (2 seats
+    in its row, 1 seat in the rows above and below, like BitBoard.exclusion)
+    """
+    free = (cinema[y0:y1, x0:x1] == 1).astype(np.uint8)
+    for (y, x, n) in groups:
+        for dy, lo, hi in ((0, x - 2, x + n + 2), (-1, x - 1, x + n + 1), (1, x - 1, x + n + 1)):
+            if y0 <= y + dy < y1:
+                free[y + dy - y0, max(lo - x0, 0): max(hi - x0, 0)] = 0
+    return free
+
+
+def pick_window(rng, h, v, rows, columns, kind, max_columns=None):
+    """
+    (y0, y1, x0, x1) of a random window of rows rows, the full width or columns wide
+    max_columns: Never wider than this, full rows that are wider become a window of max_columns
+    """
+    rows = min(rows, h)
+    y0 = int(rng.integers(0, h - rows + 1))
+    full = kind == "rows" or (kind == "both" and rng.random() < 0.5)
+    if max_columns is not None and v > max_columns:
+        columns = min(max_columns, v if full else columns)
+    elif full:
+        columns = v
+    if columns >= v:
+        return y0, y0 + rows, 0, v
+    x0 = int(rng.integers(0, v - columns + 1))
+    return y0, y0 + rows, x0, x0 + columns
+
+
+def improve(cinema, people, seats=None, solver="dp", rows=3, columns=12, window="rect",
+            time_limit=10.0, iterations=None, seed=0, stats=None):
+    """
+    Large neighbourhood search: starting from seats (the greedy when None), clears
+    a random window and seats the groups that were in it and the groups that are
+    not seated yet again, optimally within the window (see blocks.solve_block).
+    The new seating of the window is kept when it seats more people.
+    Stops after time_limit seconds of windows (the greedy and the upper bound are
+    not part of it, they always run) or iterations windows,
+    or when the seating meets bounds.upper_bound.
+
+    Args:
+        cinema: Matrix without padding, 1 where there is a seat
+        people: people[i] is the amount of groups of size i + 1
+        solver: "dp" or "ilp", for the windows
+        rows, columns: Size of the window, window "rows" uses the full width,
+                       "rect" columns seats and "both" picks one of the two at random.
+                       The dp never gets windows wider than DP_COLUMNS
+        seed: Seed of the windows (and of the greedy)
+        stats: Stats for the iterations and improvements, every improvement
+               is added to series "lns"
+
+    Returns: (matrix with 2s where people are seated, amount of people not seated) like greedy
+    """
+    stats = stats or Stats()
+    rng = np.random.default_rng(seed)
+    h, v = cinema.shape
+    demand = np.array([people[size] for size in range(len(people))], dtype=int)
+    total = int(demand @ np.arange(1, len(demand) + 1))
+
+    if seats is None:
+        np.random.seed(seed)
+        with stats.phase("greedy"):
+            seats, _ = Seating(cinema, people, h, v).greedy()
+    groups = seated_groups(seats)
+    seated = int(count_seated(seats))
+    with stats.phase("upper_bound"):
+        bound = upper_bound(cinema, people)
+    stats.record("lns", seated=seated, iteration=0)
+
+    iteration = 0
+    start = time.time()
+    with stats.phase("lns"):
+        while seated < bound and time.time() - start < time_limit and (
+                iterations is None or iteration < iterations):
+            iteration += 1
+            y0, y1, x0, x1 = pick_window(rng, h, v, rows, columns, window,
+                                         DP_COLUMNS if solver == "dp" else None)
+
+            # Groups completely inside the window are seated again, the others stay
+            inside = [g for g in groups if y0 <= g[0] < y1 and x0 <= g[1] and g[1] + g[2] <= x1]
+            kept = [g for g in groups if g not in inside]
+            free = window_seats(cinema, [g for g in kept if y0 - 1 <= g[0] <= y1], y0, y1, x0, x1)
+
+            # The groups of the window and the groups nobody seated
+            waiting = demand - np.bincount([n - 1 for (_, _, n) in groups], minlength=len(demand))
+            waiting += np.bincount([n - 1 for (_, _, n) in inside], minlength=len(demand))
+            if upper_bound(free, dict(enumerate(waiting))) <= sum(n for (_, _, n) in inside):
+                stats.count("lns_skipped")
+                continue
+
+            # A solve that runs out of time gives the greedy seating of the window
+            found = solve_block((free, dict(enumerate(int(amt) for amt in waiting)), solver,
+                                 start + time_limit))
+            gain = int(count_seated(found)) - sum(n for (_, _, n) in inside)
+            if gain > 0:
+                groups = kept + [(y + y0, x + x0, n) for (y, x, n) in seated_groups(found)]
+                seated += gain
+                stats.count("lns_improvements")
+                stats.record("lns", seated=seated, iteration=iteration)
+    stats.count("lns_iterations", iteration)
+
+    result = cinema.copy()
+    for (y, x, n) in groups:
+        result[y, x: x + n] = 2
+    return result, total - seated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str, default="instances/instance.txt",
+                        help="Filename with offline instance")
+    parser.add_argument("--solver", type=str, default="dp", choices=["dp", "ilp"],
+                        help="Seat the windows with the row dynamic program or gurobi")
+    parser.add_argument("--time_limit", type=float, default=10.0,
+                        help="Stop after this many seconds of windows, the first greedy is not part of it")
+    parser.add_argument("--iterations", type=int, default=None,
+                        help="Stop after this many windows")
+    parser.add_argument("--rows", type=int, default=3,
+                        help="Rows of a window")
+    parser.add_argument("--columns", type=int, default=12,
+                        help="Seats of a rectangular window")
+    parser.add_argument("--window", type=str, default="rect", choices=WINDOWS,
+                        help="Rectangular windows, windows of full rows, or both")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the greedy and the windows")
+    parser.add_argument("--verify", type=str, default="n",
+                        help="Check the seating against the guidelines? [y|n]")
+    parser.add_argument("--stats", type=str, default=None,
+                        help="Write the phase times, counters and improvements to this .json or .csv file")
+    parser.add_argument("--cache", type=str, default="n",
+                        help="Cache big instances next to them as .npz, so the next run skips parsing? [y|n]")
+    args = parser.parse_args()
+
+    stats = Stats()
+    with stats.phase("parse"):
+        cinema, people, h, v = read_instance(args.filename, args.cache == "y")
+    start = time.time()
+    seats, no_seat = improve(cinema, people, solver=args.solver, rows=args.rows,
+                             columns=args.columns, window=args.window,
+                             time_limit=args.time_limit, iterations=args.iterations,
+                             seed=args.seed, stats=stats)
+    print("Output (lns) (2=person seated)")
+    print(seats)
+    print("Greedy seated", stats.series["lns"][0]["seated"], "after",
+          stats.counters["lns_iterations"], "windows:", count_seated(seats))
+    print("Not seated", no_seat, "out of", no_seat + count_seated(seats))
+    print("Upper bound", upper_bound(cinema, people))
+    print("Execution time %s" % (time.time() - start))
+
+    if args.verify == "y":
+        verify_cinema(seats, v, h)
+    if args.stats is not None:
+        stats.write(args.stats)
@@ -0,0 +1,126 @@
+import argparse
+import time
+from multiprocessing import Pool
+import numpy as np
+
+from seating import Seating
+from bounds import upper_bound
+from stats import Stats
+from utils import read_instance, count_seated, verify_cinema
+
+
+def perturbed_order(seating, rng, perturb):
+    """
+    Group sizes in the order to seat them: big to small, but every size is moved
+    by normal noise with standard deviation perturb before sorting, so groups of
+    close sizes swap places now and then
+    """
+    order = np.array(seating.group_order(), dtype=int)
+    keys = order + rng.normal(0, perturb, len(order))
+    return [int(size) for size in order[np.argsort(-keys, kind="stable")]]
+
+
+def restart(job):
+    """
+    One run of the greedy, everything random in it comes from seed
+    Returns: (seed, seats)
+    """
+    cinema, people, seed, perturb, noise = job
+    h, v = cinema.shape
+    rng = np.random.default_rng(seed)
+    seating = Seating(cinema, people, h, v)
+    order = perturbed_order(seating, rng, perturb) if perturb > 0 else None
+    seats, _ = seating.greedy(rng=rng, order=order, noise=noise)
+    return seed, seats
+
+
+def multistart(cinema, people, restarts=16, workers=1, seed=0, perturb=0.0, noise=0.0,
+               stats=None):
+    """
+    Runs the greedy restarts times, with seeds seed..seed + restarts - 1, in workers
+    processes, and keeps the seating with the most people seated (the lowest seed
+    on ties). Stops as soon as a restart seats everyone or meets bounds.upper_bound.
+    The results are taken in the order of the seeds, so which seed is returned does
+    not depend on which worker finishes first. restart(seed) gives the same seating again.
+
+    Args:
+        cinema: Matrix without padding, 1 where there is a seat
+        people: people[i] is the amount of groups of size i + 1
+        perturb: Standard deviation of the noise on the group order (see perturbed_order)
+        noise: Noise on the score of every position (see Seating.greedy)
+        stats: Stats for the restarts run, and every improvement (series "multistart")
+
+    Returns: (matrix with 2s where people are seated, amount of people not seated, seed)
+    """
+    stats = stats or Stats()
+    with stats.phase("upper_bound"):
+        bound = upper_bound(cinema, people)
+    jobs = [(cinema, people, seed + i, perturb, noise) for i in range(restarts)]
+
+    best, best_seed = None, None
+    with stats.phase("multistart"):
+        if workers > 1:
+            pool = Pool(workers)
+            # In seed order, so stopping at the bound keeps the lowest seed that meets it
+            results = pool.imap(restart, jobs)
+        else:
+            pool = None
+            results = map(restart, jobs)
+
+        for run_seed, seats in results:
+            stats.count("restarts")
+            seated = count_seated(seats)
+            if best is None or (seated, -run_seed) > (count_seated(best), -best_seed):
+                best, best_seed = seats, run_seed
+                stats.record("multistart", seated=int(seated), seed=int(run_seed))
+            if count_seated(best) >= bound:
+                break
+
+        if pool is not None:
+            # Restarts that are still running are not needed anymore
+            pool.terminate()
+            pool.join()
+
+    total = sum((size + 1) * amt for size, amt in people.items())
+    return best, total - count_seated(best), best_seed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filename", type=str, default="instances/instance.txt",
+                        help="Filename with offline instance")
+    parser.add_argument("--restarts", type=int, default=16,
+                        help="Amount of greedy runs, with seeds --seed, --seed + 1, ...")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Amount of processes running the greedy at the same time")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Seed of the first run, --restarts 1 replays a run")
+    parser.add_argument("--perturb", type=float, default=0.0,
+                        help="Standard deviation of the noise on the group order")
+    parser.add_argument("--noise", type=float, default=0.0,
+                        help="Noise on the seats lost of every position")
+    parser.add_argument("--verify", type=str, default="n",
+                        help="Check the seating against the guidelines? [y|n]")
+    parser.add_argument("--stats", type=str, default=None,
+                        help="Write the phase times, counters and improvements to this .json or .csv file")
+    parser.add_argument("--cache", type=str, default="n",
+                        help="Cache big instances next to them as .npz, so the next run skips parsing? [y|n]")
+    args = parser.parse_args()
+
+    stats = Stats()
+    with stats.phase("parse"):
+        cinema, people, h, v = read_instance(args.filename, args.cache == "y")
+    start = time.time()
+    seats, no_seat, seed = multistart(cinema, people, args.restarts, args.workers, args.seed,
+                                      args.perturb, args.noise, stats)
+    print("Output (multistart) (2=person seated)")
+    print(seats)
+    print("Best of", stats.counters["restarts"], "restarts: seed", seed)
+    print("Not seated", no_seat, "out of", no_seat + count_seated(seats))
+    print("Upper bound", upper_bound(cinema, people))
+    print("Execution time %s" % (time.time() - start))
+
+    if args.verify == "y":
+        verify_cinema(seats, v, h)
+    if args.stats is not None:
+        stats.write(args.stats)
@@ -0,0 +1,193 @@
+import argparse
+import heapq
+import time
+import numpy as np
+from seating import seats_lost
+from utils import read_online_instance, count_seated, verify_cinema
+
+
+class OnlineSeating:
+    def __init__(self, seats, max_group_size=8):
+        """
+        Seats groups one at a time as they arrive, at the legal start position that
+        takes away the fewest available seats (the score of Seating.greedy), ties
+        go to the first position in row major order.
+
+        For every group size it keeps the best start position of every row and a
+        heap over those rows. Seating a group only changes the rows around it, so a
+        decision only rescores 5 rows instead of the whole hall.
+
+        Args:
+            seats: Matrix without padding, 1 where there is a seat
+            max_group_size: Biggest group that can arrive
+        """
+        self.h, self.v = seats.shape
+        self.sizes = range(1, max_group_size + 1)
+        # Padding, so no out of range errors (like Seating)
+        self.available_seats = np.pad(seats, (2, 2), "constant", constant_values=(0, 0))
+        self.seats = self.available_seats.copy()
+        rows = self.available_seats.shape[0]
+
+        # Per row and size: seats lost by the best start position of the row (inf if none) and its column
+        self.best_loss = np.full((rows, len(self.sizes)), np.inf)
+        self.best_col = np.zeros((rows, len(self.sizes)), dtype=int)
+        self.heaps = {n: [] for n in self.sizes}
+
+        # Start columns 2..columns - 3 for all sizes at once, so the score never looks
+        # outside the hall. Columns where a size does not fit are masked with inside.
+        columns = self.available_seats.shape[1]
+        self.starts = np.arange(2, columns - 2)
+        ends = self.starts + np.array(self.sizes)[:, None]
+        self.inside = ends + 2 <= columns
+        self.ends = np.minimum(ends, columns - 2)
+
+        # In blocks of rows, to keep the (row, size, column) arrays small on big halls
+        for lo in range(0, rows, 64):
+            self.rescore(lo, lo + 64)
+
+    def rescore(self, lo, hi):
+        """Updates the best start positions of all sizes in (padded) rows lo..hi-1"""
+        # Rows 0, 1 and the last 2 are padding, without seats
+        lo, hi = max(lo, 1), min(hi, self.available_seats.shape[0] - 1)
+        if lo >= hi:
+            return
+        # Prefix sums of the rows and their neighbours above and below:
+        # sum(seats[lo - 1 + i, j:k]) == prefix[i, k] - prefix[i, j]
+        window = self.available_seats[lo - 1: hi + 1]
+        prefix = np.zeros((window.shape[0], window.shape[1] + 1))
+        np.cumsum(window, axis=1, out=prefix[:, 1:])
+        # Row dy away from every row in lo..hi-1
+        around = {-1: prefix[:-2], 0: prefix[1:-1], 1: prefix[2:]}
+        starts, ends = self.starts[None, :], self.ends
+
+        # As (row, size, start column) arrays
+        sizes = np.array(self.sizes)[:, None]
+        fits = around[0][:, ends] - around[0][:, starts] == sizes
+        lost = seats_lost(lambda dy, column: around[dy][:, column], starts, ends)
+        lost[~(fits & self.inside)] = np.inf
+        cols = np.argmin(lost, axis=2)
+        losses = np.take_along_axis(lost, cols[:, :, None], axis=2)[:, :, 0]
+
+        cols = self.starts[cols]
+        # Rows whose best position did not change already have it in the heap
+        changed = (losses < np.inf) & (
+            (self.best_loss[lo:hi] != losses) | (self.best_col[lo:hi] != cols))
+        self.best_loss[lo:hi] = losses
+        self.best_col[lo:hi] = cols
+        for y, i in zip(*np.nonzero(changed)):
+            heapq.heappush(self.heaps[self.sizes[i]], (losses[y, i], int(y + lo), int(cols[y, i])))
+
+    def best_position(self, n):
+        """Best (padded) start position for a group of size n, None if it does not fit"""
+        heap = self.heaps.get(n)
+        if heap is None:
+            return None
+        # Entries of rows that changed since they were pushed are skipped
+        while len(heap) > 0:
+            loss, y, x = heap[0]
+            if self.best_loss[y, n - 1] == loss and self.best_col[y, n - 1] == x:
+                return y, x
+            heapq.heappop(heap)
+        return None
+
+    def seat(self, n):
+        """
+        Seats an arriving group of size n, for good
+        Returns: (row, column) where it is seated, None if it does not fit
+        """
+        pos = self.best_position(n)
+        if pos is None:
+            return None
+        y, x = pos
+        self.place(y - 2, x - 2, n)
+        return y - 2, x - 2
+
+    def place(self, y, x, n):
+        """Seats a group of size n at (row, column) (y, x), which must be legal"""
+        y, x = y + 2, x + 2
+        self.available_seats[y, x - 2: x + n + 2] = 0
+        self.available_seats[y - 1, x - 1: x + n + 1] = 0
+        self.available_seats[y + 1, x - 1: x + n + 1] = 0
+        self.seats[y, x: x + n] = 2
+
+        # Rows y - 1..y + 1 changed, so the scores of rows y - 2..y + 2 did
+        self.rescore(y - 2, y + 3)
+
+    def release(self, y, x, n):
+        """Frees the seats of the group of size n seated at (row, column) (y, x)"""
+        y, x = y + 2, x + 2
+        self.seats[y, x: x + n] = 1
+
+        # Seats around the group are available again, unless another group still blocks them
+        for r in range(y - 1, y + 2):
+            for c in range(x - 2, x + n + 2):
+                self.available_seats[r, c] = self.seats[r, c] == 1 and not (
+                    np.any(self.seats[r, max(c - 2, 0): c + 3] == 2)
+                    or np.any(self.seats[r - 1, max(c - 1, 0): c + 2] == 2)
+                    or np.any(self.seats[r + 1, max(c - 1, 0): c + 2] == 2)
+                )
+        self.rescore(y - 2, y + 3)
+
+    def result(self):
+        """Matrix without padding: 2 where people are seated, 1 for the other seats"""
+        return self.seats[2:-2, 2:-2]
+
+
+def run(filename, verify=False):
+    """
+    Seats all arrivals of an instance, prints the decision latencies and throughput
+    verify: Check the result with verify_cinema
+    """
+    cinema, groups, h, v = read_online_instance(filename)
+
+    start = time.perf_counter()
+    online = OnlineSeating(cinema, max(groups, default=8))
+    setup = time.perf_counter() - start
+
+    latencies = np.zeros(len(groups))
+    not_seated = 0
+    start = time.perf_counter()
+    for i, size in enumerate(groups):
+        before = time.perf_counter()
+        if online.seat(size) is None:
+            not_seated += size
+        latencies[i] = time.perf_counter() - before
+    total = time.perf_counter() - start
+
+    seats = online.result()
+    print("Seated", count_seated(seats), "people out of", sum(groups),
+          "(not seated: {})".format(not_seated))
+    if verify:
+        verify_cinema(seats, v, h)
+    print("Hall {}x{}, {} arrivals, setup {:.3f}s".format(h, v, len(groups), setup))
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e6
+    print("Decision latency: p50 {:.0f}us, p90 {:.0f}us, p99 {:.0f}us, max {:.0f}us".format(
+        p50, p90, p99, np.max(latencies, initial=0) * 1e6))
+    print("Throughput: {:.0f} groups/s".format(len(groups) / total if total > 0 else 0))
+    return seats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--filename",
+        type=str,
+        default="../../Online/instances/TheMonsterOnline.txt",
+        help="Online instance (group sizes in order of arrival, ending with 0), offline instances arrive in a random order",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed for the order of arrival of offline instances",
+    )
+    parser.add_argument(
+        "--verify",
+        type=str,
+        default="n",
+        help="Verify the final seating (y/n)",
+    )
+    args = parser.parse_args()
+
+    np.random.seed(args.seed)
+    run(args.filename, args.verify == "y")
@@ -1,8 +1,49 @@
+import sys
+import time
 import numpy as np
-from collections import deque
-import heapq
-from tqdm import tqdm
 from utils import ones
+from bitboard import BitBoard
+from freeruns import FreeRuns
+from bounds import upper_bound
+from transposition import TranspositionTable
+from stats import Stats
+
+
+def seats_lost(prefix, start, end):
+    """
+    Available seats taken away by groups on seats start..end-1: 2 on either side
+    in their own row and 1 on either side in the rows above and below.
+    prefix(dy, column) gives the prefix sums up to column of the row dy away from
+    the group's row (dy in -1, 0, 1), so sum(row[j:k]) == prefix(dy, k) - prefix(dy, j)
+    """
+    return (
+        prefix(0, end + 2) - prefix(0, start - 2)
+        + prefix(-1, end + 1) - prefix(-1, start - 1)
+        + prefix(1, end + 1) - prefix(1, start - 1)
+    )
+
+
+def start_position_losses(n, seats):
+    """
+    Legal start positions of a group of size n, and how many available seats
+    seating it there takes away, using prefix sums per row
+    seats: matrix of available seats, with (at least) 1 row and 2 columns of padding
+    output: (array of (row, column) start positions in row major order, seats lost)
+    """
+    # Prefix sums per row: sum(seats[i, j:k]) == prefix[i, k] - prefix[i, j]
+    prefix = np.zeros((seats.shape[0], seats.shape[1] + 1))
+    np.cumsum(seats, axis=1, out=prefix[:, 1:])
+
+    # Every seat from here to here + n is free
+    width = max(seats.shape[1] - n + 1, 0)
+    rows, cols = np.nonzero(prefix[:, n: n + width] - prefix[:, :width] == n)
+
+    lost = seats_lost(lambda dy, column: prefix[rows + dy, column], cols, cols + n)
+    return np.column_stack([rows, cols]), lost
+
+
+class DpTimeout(Exception):
+    """Raised inside Seating.dp when its time limit is hit"""
 
 
 class Seating:
@@ -45,161 +86,454 @@ class Seating:
         else:
             self.group_index = group_index
 
-    def copy_seats(self, seats, seated, index):
+    def dfs(self, node_limit=None, time_limit=None, stats=None, table=None):
         """
-        Copies this instance of seating, but updates seats and seated
+        Depth-first branch and bound to find the optimal seating (==most people seated in total)
+        Moves are applied to and undone on a single BitBoard (and FreeRuns index
+        for the legal start positions) instead of copying the state.
+        A node is pruned when even seating min(free seats, people still waiting)
+        more people cannot beat the best seating found so far, and the search
+        stops once a seating meets bounds.upper_bound.
+
+        Groups of the same size are interchangeable, so a group is only placed
+        after the position of the previous group of its size, and skipping a
+        group skips the remaining groups of that size as well.
+
+        Once a state (available seats, next group, and the position it has to come
+        after) is searched, the most people that can still be seated from it is
+        kept in a bounded transposition table, so reaching it again by another
+        order of moves is pruned when that cannot beat the best seating.
+
         Args:
-            seats: Where are the current available seats?
-            seated: Where are the people seated? (Matrix with 2s)
-            index: What is the index of the next group to be seated in self.groups?
-        """
-        return Seating(
-            seats, self.people, self.h, self.v, seated=seated, group_index=index
-        )
+            node_limit: Stop after expanding this many nodes (None: no limit)
+            time_limit: Stop after this many seconds (None: no limit)
+            stats: Stats for the nodes expanded, prunes, deepest stack,
+                   the transposition table counters and every improvement of
+                   the best seating (series "dfs")
+            table: TranspositionTable to use (a 64 MB one when None), kept in self.table
 
-    def dfs(self):
-        """
-        Runs dfs to find the optimal seating (==most people seated in total)
+        Returns: (matrix with 2s where people are seated, amount of people not seated)
+        like greedy. When a limit is hit this is the best seating found so far.
         """
+        stats = stats or Stats()
+        self.table = table = TranspositionTable() if table is None else table
+        board = BitBoard(self.available_seats[2:-2, 2:-2])
+        width = (board.v + 7) // 8
+        runs = FreeRuns(self.available_seats[2:-2, 2:-2])
+        groups = [int(g) for g in self.groups]
+        amount = len(groups)
+
+        # People waiting in groups index..end
+        waiting = np.concatenate([np.cumsum(groups[::-1])[::-1], [0]])
+        # First group of the next (smaller) size
+        next_size = [amount] * amount
+        for index in range(amount - 2, -1, -1):
+            if groups[index + 1] == groups[index]:
+                next_size[index] = next_size[index + 1]
+            else:
+                next_size[index] = index + 1
 
-        def hashed(c):
-            return hash(c.data.tobytes())
+        # No seating can do better than this, so the search can stop when it is met
+        upper = min(self.totalpeople, upper_bound(self.available_seats[2:-2, 2:-2], self.people))
 
-        # Stack of tuples (Seating, Amt_of_People_Seated)
-        stack = []  # deque()
-        stack.append((self, 0))
+        placed = []
         best = 0
-        best_seats = None
-        visited = set()
-
-        while len(stack) > 0 and len(stack) < 1000:
-            # if np.random.rand() > 0.999:
-            #    print("Stack size", len(stack), self.totalpeople - best)
-            (current, amt_seated) = stack.pop()
-            h = hashed(current.seated)
-            visited.add(h)
-
-            if amt_seated > best:
-                best = amt_seated
-                best_seats = current
-
-            # Go over all the groups that need to be seated, and add them depth-first (IF they can be seated)
-            found_one = False
-            while (current.group_index) < len(current.groups) and not found_one:
-                # Find all ways this person can be seated
-                current_group_size = current.groups[current.group_index]
-                pos = current.find_legal_start_position(
-                    current_group_size, current.available_seats
-                )
+        best_placed = []
+        nodes = 0
+        prunes = 0
+        cutoffs = 0
+        depth = 0
+        start = time.time()
 
-                # TODO: Or possibly use a priority queue?
-                # Right now: adding all possibilities at once.
-                if len(pos) > 0:
-                    opts = []
-                    for _, possible in enumerate(pos):
-                        # Hypothetical update
-                        x, y = possible
-                        a_s, _ = current.update_seats(
-                            possible, current_group_size, current.available_seats
-                        )
-
-                        # Add hypothetical update to the stack/queue
-                        new_seated = current.seated.copy()
-                        new_seated[x, y: y + current_group_size] = (
-                            np.zeros(current_group_size) + 2
-                        )
-                        seated_amount = np.count_nonzero(new_seated == 2)
-                        free = np.count_nonzero(new_seated == 1)
-
-                        # (Seating, Amount_Seated)
-                        # Only add if there are no better solutions found already
-                        if hashed(new_seated) not in visited and best < (
-                            seated_amount + free
-                        ):
-                            if seated_amount == self.totalpeople:
-                                print("Everyone seated, breaking")
-                                print(best_seats.seated[2:-2, 2:-2])
-                                print("Not seated", np.sum(self.groups) - best)
-                                return
-                            opts.append((free, new_seated, a_s, seated_amount))
-
-                    for opt in sorted(opts, key=lambda x: x[0], reverse=False):
-                        _, new_seated, a_s, seated_amount = opt
-                        stack.append(
-                            (
-                                current.copy_seats(
-                                    a_s, new_seated, current.group_index + 1
-                                ),
-                                seated_amount,
-                            )
-                        )
-                    found_one = True
-                else:
-                    # This group could not be seated, try the next group
-                    # This is necessary if there are groups too large for the cinema
-                    current.group_index += 1
-        if best_seats is None:
-            print("Stack became 2 Big")
-        else:
-            print(best_seats.seated[2:-2, 2:-2])
-            print("Not seated", np.sum(self.groups) - best)
+        def bound(index):
+            return board.seated_amount + min(board.free, waiting[index])
+
+        def expand(index, after):
+            """New stack frame for seating groups[index], None if it is pruned"""
+            nonlocal best, best_placed, nodes, prunes, cutoffs
+            nodes += 1
+            if board.seated_amount > best:
+                best = board.seated_amount
+                best_placed = list(placed)
+                stats.record("dfs", best=best, nodes=nodes)
+            if index >= amount or best >= upper:
+                return None
+            if bound(index) <= best:
+                prunes += 1
+                return None
+            key = table.key(board.rows[1:-1], width, index, after)
+            extra = table.get(key)
+            if extra is not None and board.seated_amount + extra <= best:
+                cutoffs += 1
+                return None
+
+            size = groups[index]
+            candidates = [
+                pos for pos in runs.legal_starts(size) if after is None or pos > after
+            ]
+            # Positions that take away the fewest seats first
+            candidates.sort(key=lambda pos: board.loss(pos[0], pos[1], size))
+            # [group index, candidates, next candidate, undo token of the current move,
+            #  transposition key, people seated]
+            return [index, candidates, 0, None, key, board.seated_amount]
+
+        stack = [expand(0, None)]
+        complete = True
 
-    def greedy(self):
+        while len(stack) > 0 and stack[-1] is not None:
+            frame = stack[-1]
+            index, candidates, i, token, key, seated = frame
+            if token is not None:
+                board.undo(token[0])
+                runs.undo(token[1])
+                placed.pop()
+                frame[3] = None
+
+            if (node_limit is not None and nodes >= node_limit) or (
+                time_limit is not None and time.time() - start >= time_limit
+            ):
+                complete = False
+                break
+
+            # The best seating may have improved since this frame was made
+            if bound(index) <= best or best >= upper:
+                if best < upper:
+                    prunes += 1
+                    table.put(key, best - seated, amount - index)
+                stack.pop()
+                continue
+
+            frame[2] += 1
+            if i < len(candidates):
+                size = groups[index]
+                y, x = candidates[i]
+                frame[3] = (board.place(y, x, size), runs.seat(y, x, size))
+                placed.append((y, x, size))
+                same_size = index + 1 < amount and groups[index + 1] == size
+                child = expand(index + 1, (y, x) if same_size else None)
+            elif i == len(candidates):
+                # Do not seat this group (and the others of its size)
+                child = expand(next_size[index], None)
+            else:
+                # Everything below this state is searched (or could not beat best)
+                table.put(key, best - seated, amount - index)
+                stack.pop()
+                continue
+
+            if child is not None:
+                stack.append(child)
+                depth = max(depth, len(stack))
+
+        if not complete:
+            stats.log("Search budget exhausted after", nodes,
+                      "nodes, returning the best seating so far")
+
+        seats = self.available_seats[2:-2, 2:-2].copy()
+        for (y, x, size) in best_placed:
+            seats[y, x: x + size] = 2
+        self.nodes = nodes
+        stats.count("dfs_nodes", nodes)
+        stats.count("dfs_prunes", prunes)
+        stats.maximum("dfs_max_depth", depth)
+        stats.count("dfs_complete", complete)
+        stats.count("dfs_cutoffs", cutoffs)
+        for name, value in table.counters().items():
+            stats.count(name, value)
+
+        return seats, self.totalpeople - best
+
+    def group_order(self):
+        """Sizes of the groups in the order the greedy seats them: big to small"""
+        return [size for size in range(8, 0, -1) for _ in range(0, self.people[size - 1])]
+
+    def greedy(self, bitset=False, stats=None, rng=None, order=None, noise=0.0):
         """
         Greedily searches, places people from large groups first
         If there are multiple possible starting positions, 
+        bitset: Use the BitBoard state instead of matrices (see greedy_bits)
+        stats: Stats for the groups seated and candidate positions scored
+        rng: np.random.Generator to break ties with (np.random when None)
+        order: Sizes of the groups in the order to seat them (see group_order)
+        noise: Add uniform noise in [0, noise) to the score of every position
         """
+        stats = stats or Stats()
+        rng = rng or np.random
+        order = self.group_order() if order is None else order
+        if bitset:
+            return self.greedy_bits(stats, rng, order, noise)
+
         no_seat = 0
         seats = self.available_seats.copy()
 
-        # Go through group sizes from big to small
-        for group_size in range(8, 0, -1):
-
-            # The amount of groups with this size
-            for _ in range(0, self.people[group_size - 1]):
-
-                # Get possible legal start positions for the group
-                pos = self.find_legal_start_position(
-                    group_size, self.available_seats)
-                # print(pos)
-                # If there is at least one place these guys can sit
-                if len(pos) > 0:
-                    # Find the best position with a loop
-                    # best = (minimal amount of seats occupied after seating the group on that position)
-                    best_amt = np.size(self.available_seats)
-
-                    amts = np.zeros(len(pos)) - 1
-                    poses = [-1] * len(pos)
-
-                    for index, possible in enumerate(pos):
-                        _, amt = self.update_seats(
-                            possible, group_size, self.available_seats
-                        )
-                        amts[index] = amt
-
-                        if amt <= best_amt:
-                            best_amt = amt
-                            poses[index] = possible
-
-                    # Choose one of the best solutions
-                    choices = np.nonzero(amts == best_amt)[0]
-                    choice = np.random.choice(choices)
-                    x, y = poses[choice]
-
-                    # Update the available seats (add zeros)
-                    self.available_seats, _ = self.update_seats(
-                        poses[choice], group_size, self.available_seats
-                    )
+        # Go through the groups, from big to small unless order says otherwise
+        for group_size in order:
+
+            # Get possible legal start positions for the group, and
+            # how many seats are occupied after seating the group there
+            pos, amts = self.score_start_positions(
+                group_size, self.available_seats)
+            stats.count("greedy_candidates", len(pos))
+
+            # If there is at least one place these guys can sit
+            if len(pos) > 0:
+                if noise > 0:
+                    amts = amts + noise * rng.random(len(amts))
+                # best = (minimal amount of seats occupied after seating the group on that position)
+                best_amt = np.min(amts)
 
-                    # Update where people are sitting
-                    seats[x, y: y + group_size] = np.zeros(group_size) + 2
-                # No places this group can sit, time to move on.
-                else:
-                    no_seat += group_size
+                # Choose one of the best solutions
+                choices = np.nonzero(amts == best_amt)[0]
+                choice = rng.choice(choices)
+                x, y = pos[choice]
+
+                # Update the available seats (add zeros)
+                self.available_seats, _ = self.update_seats(
+                    (x, y), group_size, self.available_seats
+                )
 
+                # Update where people are sitting
+                seats[x, y: y + group_size] = np.zeros(group_size) + 2
+                stats.count("greedy_groups_seated")
+            # No places this group can sit, time to move on.
+            else:
+                no_seat += group_size
+
+        stats.count("greedy_not_seated", no_seat)
         # Remove padding
         return seats[2:-2, 2:-2], no_seat
 
+    def greedy_bits(self, stats=None, rng=None, order=None, noise=0.0):
+        """
+        Same as greedy, but on a BitBoard: the score of a candidate is a popcount
+        over three rows instead of a copy and count of the whole matrix. Every
+        candidate is scored in python, so on big halls it is slower than greedy.
+        Legal start positions come from a FreeRuns index.
+        """
+        stats = stats or Stats()
+        rng = rng or np.random
+        order = self.group_order() if order is None else order
+        no_seat = 0
+        board = BitBoard(self.available_seats[2:-2, 2:-2])
+        runs = FreeRuns(self.available_seats[2:-2, 2:-2])
+
+        # Go through the groups, from big to small unless order says otherwise
+        for group_size in order:
+            pos = runs.legal_starts(group_size)
+            stats.count("greedy_candidates", len(pos))
+
+            if len(pos) > 0:
+                # best = (minimal amount of seats lost after seating the group on that position)
+                amts = np.array([board.loss(y, x, group_size) for (y, x) in pos])
+                if noise > 0:
+                    amts = amts + noise * rng.random(len(amts))
+                choices = np.nonzero(amts == np.min(amts))[0]
+                choice = rng.choice(choices)
+                y, x = pos[choice]
+                board.place(y, x, group_size)
+                runs.seat(y, x, group_size)
+                stats.count("greedy_groups_seated")
+            # No places this group can sit, time to move on.
+            else:
+                no_seat += group_size
+
+        stats.count("greedy_not_seated", no_seat)
+        # Keep the matrices in sync, as greedy does
+        self.available_seats = board.available_seats()
+        return board.matrix(), no_seat
+
+    def dp(self, time_limit=None, incumbent=None):
+        """
+        Exact row-by-row dynamic program, no gurobi needed.
+        The spacing rules only couple neighbouring rows, so the best seating of
+        the rows below row r only depends on which seats are taken in row r and
+        on how many groups of every size are still waiting.
+        Every row is a bitmask, a pattern of seated groups in a row is fully
+        described by its occupied seats (groups need 2 empty seats in between).
+        Fast on narrow halls, the amount of patterns grows quickly with width.
+
+        Args:
+            time_limit: Stop after this many seconds (None: no limit)
+            incumbent: (seats, not seated) like greedy, returned when the time limit
+                       is hit. The dp has no seating of its own before it is done,
+                       so without one it runs the greedy instead.
+
+        Returns: (matrix with 2s where people are seated, amount of people not seated)
+        like greedy. When the time limit is hit this is incumbent (or the greedy).
+        """
+        hall = self.available_seats[2:-2, 2:-2]
+        deadline = None if time_limit is None else time.time() + time_limit
+
+        def check_clock():
+            if deadline is not None and time.time() >= deadline:
+                raise DpTimeout()
+
+        max_size = len(self.people)
+        sizes = np.arange(1, max_size + 1)
+        # Masks are python ints, numpy ints overflow on rows wider than 63 seats
+        rows = [
+            sum(1 << int(x) for x in np.nonzero(row == 1)[0]) for row in hall
+        ] + [0]
+        # The recursions over rows below go one level deeper per row, and the
+        # patterns of a row one level deeper per seat
+        sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * self.h + 2 * self.v + 1000))
+
+        # Subsets of group sizes to bound separately: all sizes, the larger
+        # sizes only and the smaller sizes only
+        subsets = np.array(
+            [sizes > 0]
+            + [sizes > k for k in range(1, max_size)]
+            + [sizes <= k for k in range(1, max_size)]
+        )
+        amount = len(subsets)
+
+        def optimistic(people, left):
+            """
+            Upper bound on people seated with left groups waiting, given
+            people[k] for the groups in subsets[k] when there is no shortage:
+            groups outside a subset can at most all be seated
+            """
+            outside = (left * sizes) @ (~subsets).T
+            return np.minimum(left @ sizes, np.min(outside + people, axis=-1))
+
+        patterns_memo = dict()
+
+        def patterns(free):
+            """All (seated, occupied mask, used counts) for one row, as arrays"""
+            if free in patterns_memo:
+                return patterns_memo[free]
+            result = []
+
+            def place(x, occupied, used, seated):
+                check_clock()
+                while x < self.v and not free >> x & 1:
+                    x += 1
+                if x >= self.v:
+                    result.append((seated, occupied, used))
+                    return
+                # Leave seat x empty
+                place(x + 1, occupied, used, seated)
+                for size in range(1, max_size + 1):
+                    if x + size > self.v or not free >> (x + size - 1) & 1:
+                        break
+                    new_used = used.copy()
+                    new_used[size - 1] += 1
+                    place(
+                        x + size + 2,
+                        occupied | (((1 << size) - 1) << x),
+                        new_used,
+                        seated + size,
+                    )
+
+            place(0, 0, np.zeros(max_size, dtype=int), 0)
+            patterns_memo[free] = (
+                np.array([seated for seated, _, _ in result], dtype=int),
+                [occupied for _, occupied, _ in result],
+                np.array([used for _, _, used in result]),
+            )
+            return patterns_memo[free]
+
+        children_memo = dict()
+
+        def children(r, blocked):
+            """
+            Patterns of row r, the seats they block in row r + 1 and what
+            still fits below them (see unlimited)
+            """
+            key = (r, blocked)
+            if key not in children_memo:
+                seated, occupied, used = patterns(rows[r] & ~blocked)
+                # Occupied seats block the same and neighbouring seats in the next row
+                below = [(m | m << 1 | m >> 1) & rows[r + 1] for m in occupied]
+                rest = np.array([unlimited(r + 1, b) for b in below], dtype=int)
+                children_memo[key] = (
+                    seated, occupied, used, below, rest[:, :amount], rest[:, amount:])
+            return children_memo[key]
+
+        unlimited_memo = dict()
+
+        def unlimited(r, blocked):
+            """
+            Upper bounds for solve, when there are enough groups of every size:
+            the most people of every subset of sizes that can be seated in
+            rows r..h-1, followed by the most groups of every size that fit
+            """
+            if r >= self.h:
+                return np.zeros(amount + max_size, dtype=int)
+            key = (r, blocked)
+            if key not in unlimited_memo:
+                _, _, used, _, people, groups = children(r, blocked)
+                unlimited_memo[key] = np.concatenate(
+                    [
+                        np.max((used * sizes) @ subsets.T + people, axis=0),
+                        np.max(used + groups, axis=0),
+                    ]
+                )
+            return unlimited_memo[key]
+
+        memo = dict()
+
+        def solve(r, blocked, counts):
+            """
+            Most people that can be seated in rows r..h-1
+            counts is capped by unlimited(r, blocked): groups that can never be
+            seated anymore do not change the answer, capping them lets more
+            states share a memo entry
+            """
+            waiting = int(counts @ sizes)
+            if r >= self.h or waiting == 0:
+                return 0
+            key = (r, blocked, counts.tobytes())
+            if key in memo:
+                return memo[key][0]
+            check_clock()
+
+            seated, occupied, used, below, people, groups = children(r, blocked)
+            bound = optimistic(unlimited(r, blocked)[:amount], counts)
+            best, best_occupied, best_left = -1, 0, counts
+
+            # Only patterns that need no more groups than are waiting
+            possible = np.nonzero(np.all(used <= counts, axis=1))[0]
+            left = np.minimum(counts - used[possible], groups[possible])
+            estimate = seated[possible] + optimistic(people[possible], left)
+
+            # Most promising patterns first (fullest rows on ties), stop once
+            # none can beat the best
+            for i in np.lexsort((-seated[possible], -estimate)):
+                if estimate[i] <= best:
+                    break
+                index = possible[i]
+                value = seated[index] + solve(r + 1, below[index], left[i])
+                if value > best:
+                    best, best_occupied, best_left = value, occupied[index], left[i]
+                    if best == bound:
+                        break
+
+            memo[key] = (best, best_occupied, best_left)
+            return best
+
+        try:
+            counts = np.minimum(
+                [int(self.people[i]) for i in range(max_size)], unlimited(0, 0)[amount:])
+            best = solve(0, 0, counts)
+        except DpTimeout:
+            if incumbent is not None:
+                return incumbent
+            return Seating(hall, self.people, self.h, self.v).greedy()
+
+        # Walk the memo to rebuild the seating
+        seats = hall.copy()
+        blocked = 0
+        for r in range(self.h):
+            if (r, blocked, counts.tobytes()) not in memo:
+                break
+            _, occupied, counts = memo[(r, blocked, counts.tobytes())]
+            for x in range(self.v):
+                if occupied >> x & 1:
+                    seats[r, x] = 2
+            blocked = (occupied | occupied << 1 | occupied >> 1) & rows[r + 1]
+
+        return seats, self.totalpeople - best
+
     def find_legal_start_position(self, n, seats):
         """
         n:     amount of people in the group
@@ -219,6 +553,17 @@ class Seating:
                     current_size -= 1
         return opts
 
+    def score_start_positions(self, n, seats):
+        """
+        Legal start positions and their update_seats score, for all positions at once
+        n:     amount of people in the group
+        seats: (padded) matrix of available seats
+        output: (array of start positions in the order of find_legal_start_position,
+                 amount of non-free spaces in the matrix after seating the group there)
+        """
+        pos, lost = start_position_losses(n, seats)
+        return pos, np.size(seats) - np.count_nonzero(seats) + lost
+
     def update_seats(self, pos, n, a_s):
         """
         pos: (x,y) position in the cinema 
@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from online import OnlineSeating
+from seating import Seating
+from utils import read_online_instance, seated_groups
+
+# Most greedy runs a reseat request may ask for
+MAX_SEEDS = 16
+
+
+def reseat(hall, sizes, seeds=4):
+    """
+    Runs in the process pool: plans all groups of a screening again with the offline
+    greedy (big groups first), keeping the plan that leaves most seats available
+
+    Args:
+        hall: Matrix without padding, 1 where there is a seat
+        sizes: Size of every booked group
+        seeds: Amount of greedy runs
+
+    Returns: (y, x) for every group in sizes, None when the greedy cannot seat them all
+    """
+    people = {i: sizes.count(i + 1) for i in range(8)}
+    h, v = hall.shape
+    best, best_free = None, -1
+    for seed in range(seeds):
+        np.random.seed(seed)
+        seating = Seating(hall, people, h, v)
+        seats, no_seat = seating.greedy()
+        free = np.count_nonzero(seating.available_seats)
+        if no_seat == 0 and free > best_free:
+            best, best_free = seats, free
+    if best is None:
+        return None
+
+    # Give every group a position of its size
+    positions = {}
+    for (y, x, size) in seated_groups(best):
+        positions.setdefault(size, []).append((y, x))
+    return [positions[size].pop() for size in sizes]
+
+
+class Screening:
+    def __init__(self, hall):
+        """
+        Live seating state of one screening. Requests for it are handled one at a
+        time (lock), different screenings do not wait for each other.
+
+        Args:
+            hall: Matrix without padding, 1 where there is a seat
+        """
+        self.hall = hall
+        self.online = OnlineSeating(hall)
+        # booking -> (row, seat, size)
+        self.bookings = {}
+        self.next_booking = 0
+        self.lock = asyncio.Lock()
+
+    def seat(self, n):
+        pos = self.online.seat(n)
+        if pos is None:
+            return {"ok": False, "reason": "no room"}
+        booking = self.next_booking
+        self.next_booking += 1
+        self.bookings[booking] = (pos[0], pos[1], n)
+        return {"ok": True, "booking": booking, "row": pos[0], "seat": pos[1]}
+
+    def release(self, booking):
+        if booking not in self.bookings:
+            return {"ok": False, "reason": "unknown booking"}
+        self.online.release(*self.bookings.pop(booking))
+        return {"ok": True}
+
+    def free_seats(self):
+        return int(np.count_nonzero(self.online.available_seats))
+
+
+class BookingService:
+    def __init__(self, pool, instances=None):
+        """
+        JSON lines booking service for many screenings. Every request is a json
+        object with an "op", the answer has "ok" and echoes the "id" of the request:
+
+            {"op": "open", "screening": S, "hall": ["0111", ...]} (or "filename" in instances)
+            {"op": "seat", "screening": S, "size": n} -> booking, row, seat
+            {"op": "release", "screening": S, "booking": B}
+            {"op": "reseat", "screening": S, "seeds": k} -> plans the bookings again with
+                k (1..MAX_SEEDS, default 4) greedy runs in the process pool
+            {"op": "close", "screening": S}
+
+        Args:
+            pool: Executor for the heavy work, so the event loop never blocks
+            instances: Folder "filename" of an open request is read from, None only
+                       accepts a "hall" in the request
+        """
+        self.pool = pool
+        self.instances = instances
+        self.screenings = {}
+
+    async def handle(self, request):
+        op = request.get("op")
+        if op == "open":
+            return self.open(request)
+
+        name = request.get("screening")
+        screening = self.screenings.get(name)
+        if screening is None:
+            return {"ok": False, "reason": "unknown screening"}
+
+        async with screening.lock:
+            # Closed (and maybe opened again) while this request waited for the lock
+            if self.screenings.get(name) is not screening:
+                return {"ok": False, "reason": "unknown screening"}
+            if op == "seat":
+                size = request.get("size")
+                if not isinstance(size, int) or isinstance(size, bool) or size < 1:
+                    return {"ok": False, "reason": "bad size"}
+                return screening.seat(size)
+            if op == "release":
+                return screening.release(request.get("booking"))
+            if op == "reseat":
+                seeds = request.get("seeds", 4)
+                if not isinstance(seeds, int) or isinstance(seeds, bool) or not 1 <= seeds <= MAX_SEEDS:
+                    return {"ok": False, "reason": "bad seeds"}
+                return await self.reseat(screening, seeds)
+            if op == "close":
+                del self.screenings[name]
+                return {"ok": True}
+        return {"ok": False, "reason": "unknown op"}
+
+    def open(self, request):
+        name = request.get("screening")
+        if name in self.screenings:
+            return {"ok": False, "reason": "screening exists"}
+        if "filename" in request:
+            path = self.instance_path(request["filename"])
+            if path is None:
+                return {"ok": False, "reason": "bad filename"}
+            hall = read_online_instance(path)[0]
+        else:
+            hall = np.array([[int(c) for c in row] for row in request["hall"]], dtype=np.uint8)
+        self.screenings[name] = Screening(hall)
+        return {"ok": True, "rows": hall.shape[0], "seats": hall.shape[1]}
+
+    def instance_path(self, filename):
+        """Path of filename in the instances folder, None when it is outside it or missing"""
+        if self.instances is None or not isinstance(filename, str):
+            return None
+        folder = os.path.realpath(self.instances)
+        path = os.path.realpath(os.path.join(folder, filename))
+        if os.path.commonpath([folder, path]) != folder or not os.path.isfile(path):
+            return None
+        return path
+
+    async def reseat(self, screening, seeds):
+        """Moves the bookings to the plan of reseat, if that leaves more seats available"""
+        bookings = list(screening.bookings.items())
+        sizes = [n for _, (_, _, n) in bookings]
+        loop = asyncio.get_running_loop()
+        positions = await loop.run_in_executor(self.pool, reseat, screening.hall, sizes, seeds)
+        if positions is None:
+            return {"ok": False, "reason": "greedy cannot seat all bookings"}
+
+        online = OnlineSeating(screening.hall)
+        for (y, x), n in zip(positions, sizes):
+            online.place(y, x, n)
+        if np.count_nonzero(online.available_seats) <= screening.free_seats():
+            return {"ok": False, "reason": "no improvement"}
+
+        screening.online = online
+        screening.bookings = {
+            booking: (y, x, n) for (booking, _), (y, x), n in zip(bookings, positions, sizes)
+        }
+        return {"ok": True, "bookings": {
+            str(booking): [y, x] for booking, (y, x, _) in screening.bookings.items()}}
+
+    async def client(self, reader, writer):
+        """Answers the requests of one connection, in order"""
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                answer = await self.handle(request)
+                answer["id"] = request.get("id")
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                answer = {"ok": False, "reason": "bad request: {}".format(e)}
+            except Exception as e:
+                # Anything else still gets an answer, the connection stays open
+                answer = {"ok": False, "reason": "error: {!r}".format(e)}
+            writer.write(json.dumps(answer).encode() + b"\n")
+            await writer.drain()
+        writer.close()
+        await writer.wait_closed()
+
+
+async def start(service, host, port, unix):
+    if unix:
+        return await asyncio.start_unix_server(service.client, path=unix)
+    return await asyncio.start_server(service.client, host, port)
+
+
+async def connect(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+
+async def load(host, port, unix, screenings=2000, clients=64, requests=100000,
+               rows=20, seats=30, seed=0):
+    """
+    Load generator: opens screenings with random halls, then every client sends
+    seat requests (and releases some of its bookings) to random screenings,
+    one request at a time. Prints requests/second and the latency percentiles.
+    """
+    rng = np.random.RandomState(seed)
+
+    async def call(reader, writer, request):
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        return json.loads(await reader.readline())
+
+    reader, writer = await connect(host, port, unix)
+    for s in range(screenings):
+        hall = ["".join("1" if rng.rand() < 0.9 else "0" for _ in range(seats))
+                for _ in range(rows)]
+        await call(reader, writer, {"op": "open", "screening": s, "hall": hall})
+    writer.close()
+
+    latencies = []
+    counts = {"seated": 0, "rejected": 0, "released": 0}
+
+    async def client(c):
+        reader, writer = await connect(host, port, unix)
+        rng = np.random.RandomState(seed + 1 + c)
+        booked = []
+        for i in range(requests // clients):
+            if len(booked) > 0 and rng.rand() < 0.2:
+                s, booking = booked.pop(rng.randint(len(booked)))
+                request = {"op": "release", "screening": s, "booking": booking}
+            else:
+                s = int(rng.randint(screenings))
+                request = {"op": "seat", "screening": s, "size": int(rng.randint(1, 9))}
+            request["id"] = i
+
+            before = time.perf_counter()
+            answer = await call(reader, writer, request)
+            latencies.append(time.perf_counter() - before)
+
+            if request["op"] == "release":
+                counts["released"] += 1
+            elif answer["ok"]:
+                counts["seated"] += 1
+                booked.append((request["screening"], answer["booking"]))
+            else:
+                counts["rejected"] += 1
+        writer.close()
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[client(c) for c in range(clients)])
+    total = time.perf_counter() - start_time
+
+    p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9]) * 1e3
+    print("{} requests to {} screenings from {} clients in {:.2f}s: {:.0f} requests/s".format(
+        len(latencies), screenings, clients, total, len(latencies) / total))
+    print("Latency: p50 {:.2f}ms, p99 {:.2f}ms, p99.9 {:.2f}ms, max {:.2f}ms".format(
+        p50, p99, p999, max(latencies) * 1e3))
+    print("Seated {seated}, rejected {rejected}, released {released}".format(**counts))
+
+
+async def main(args):
+    server = None
+    if args.mode in ("serve", "both"):
+        pool = ProcessPoolExecutor(args.workers)
+        server = await start(BookingService(pool, args.instances), args.host, args.port, args.unix)
+        print("Serving on", args.unix or "{}:{}".format(args.host, args.port))
+    if args.mode in ("load", "both"):
+        await load(args.host, args.port, args.unix, args.screenings, args.clients,
+                   args.requests, args.rows, args.seats, args.seed)
+    if server is not None and args.mode == "serve":
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", type=str, default="serve", choices=["serve", "load", "both"],
+                        help="Run the service, the load generator, or both in one process")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", type=str, default=None,
+                        help="Unix socket path, instead of host and port")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes for reseat requests (default: one per core)")
+    parser.add_argument("--instances", type=str, default=None,
+                        help="Folder open requests may read a \"filename\" from (default: only inline halls)")
+    parser.add_argument("--screenings", type=int, default=2000,
+                        help="Load generator: amount of screenings")
+    parser.add_argument("--clients", type=int, default=64,
+                        help="Load generator: amount of connections")
+    parser.add_argument("--requests", type=int, default=100000,
+                        help="Load generator: amount of requests")
+    parser.add_argument("--rows", type=int, default=20,
+                        help="Load generator: rows per hall")
+    parser.add_argument("--seats", type=int, default=30,
+                        help="Load generator: seats per row")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
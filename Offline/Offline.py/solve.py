@@ -1,8 +1,11 @@
 import argparse
-import numpy as np
 import time
 from seating import Seating
-from utils import read_instance
+from utils import read_instance, count_seated, verify_batch
+from bounds import upper_bound
+from multistart import multistart
+from transposition import TranspositionTable
+from stats import Stats
 
 
 if __name__ == "__main__":
@@ -15,20 +18,89 @@ if __name__ == "__main__":
     )
     parser.add_argument("--search", type=str, default="n",
                         help="Apply search? [y|n]")
+    parser.add_argument("--node_limit", type=int, default=None,
+                        help="Stop the search after this many nodes")
+    parser.add_argument("--time_limit", type=float, default=None,
+                        help="Stop the search after this many seconds")
+    parser.add_argument("--table_mb", type=float, default=64,
+                        help="Memory for the transposition table of the search in MB (0: none)")
+    parser.add_argument("--bitset", type=str, default="n",
+                        help="Run the greedy on bitmask rows (slower than the default on big halls)? [y|n]")
+    parser.add_argument("--restarts", type=int, default=1,
+                        help="Keep the best of this many greedy runs (see multistart.py)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Processes running greedy restarts at the same time")
+    parser.add_argument("--dp", type=str, default="n",
+                        help="Solve exactly with the row dynamic program? [y|n]")
+    parser.add_argument("--verify", type=str, default="n",
+                        help="Check the seatings of all modes against the guidelines? [y|n]")
+    parser.add_argument("--stats", type=str, default=None,
+                        help="Write the phase times and counters of the greedy and search to this .json or .csv file")
+    parser.add_argument("--cache", type=str, default="n",
+                        help="Cache big instances next to them as .npz, so the next run skips parsing? [y|n]")
     args = parser.parse_args()
 
-    a = Seating(*read_instance(args.filename))
+    stats = Stats()
+    with stats.phase("parse"):
+        cinema, people, h, v = read_instance(args.filename, args.cache == "y")
+    a = Seating(cinema, people, h, v)
     start = time.time()
-    seats, no_seat = a.greedy()
+    with stats.phase("greedy"):
+        if args.restarts > 1:
+            seats, no_seat, seed = multistart(cinema, people, args.restarts, args.workers,
+                                              stats=stats)
+        else:
+            seats, no_seat = a.greedy(bitset=args.bitset == "y", stats=stats)
     print()
     print("Output (greedy) (2=person seated)")
     print(seats)
+    if args.restarts > 1:
+        print("Best of", stats.counters["restarts"], "restarts: seed", seed)
     print("Not seated", no_seat, "out of", a.totalpeople)
     print("Execution time %s" % (time.time() - start))
-    if no_seat > 0 and args.search == "y":
+    results = {"greedy": seats}
+
+    # When the greedy meets the upper bound it is optimal, no need to search
+    with stats.phase("upper_bound"):
+        bound = upper_bound(cinema, people)
+    print("Upper bound", bound)
+    optimal = count_seated(seats) >= bound
+    if optimal:
+        print("The greedy seating is optimal")
+
+    if no_seat > 0 and not optimal and args.search == "y":
         print("Not everyone seated... Starting branch and bound search...")
-        a = Seating(*read_instance(args.filename))
+        a = Seating(*read_instance(args.filename, args.cache == "y"))
         start = time.time()
 
-        a.dfs()
+        with stats.phase("search"):
+            seats, no_seat = a.dfs(args.node_limit, args.time_limit, stats,
+                                   TranspositionTable(args.table_mb))
+        results["search"] = seats
+        print(seats)
+        if stats.counters.get("dfs_complete", 0) == 0:
+            print("Search budget exhausted after", a.nodes,
+                  "nodes, this is the best seating found so far")
+        print("Not seated", no_seat, "out of", a.totalpeople)
         print("Execution time %s" % (time.time() - start))
+    if no_seat > 0 and not optimal and args.dp == "y":
+        print("Not everyone seated... Starting exact row dynamic program...")
+        a = Seating(*read_instance(args.filename, args.cache == "y"))
+        start = time.time()
+
+        with stats.phase("dp"):
+            seats, no_seat = a.dp()
+        results["dp"] = seats
+        print(seats)
+        print("Not seated", no_seat, "out of", a.totalpeople)
+        print("Execution time %s" % (time.time() - start))
+
+    if args.verify == "y":
+        with stats.phase("verify"):
+            checked = verify_batch(list(results.values()))
+        for mode, violations in zip(results, checked):
+            print(mode, "meets the guidelines" if len(violations) == 0
+                  else "has {} violations, e.g. {}".format(len(violations), violations[0]))
+
+    if args.stats is not None:
+        stats.write(args.stats)
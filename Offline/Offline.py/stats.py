@@ -0,0 +1,98 @@
+import csv
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on windows
+    resource = None
+
+
+def peak_memory():
+    """Peak resident memory of this process so far in MB, None when unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on mac, kilobytes elsewhere
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+class Stats:
+    def __init__(self, verbose=False):
+        """
+        Instrumentation of one run: time per phase, counters, peak memory after
+        every phase and time series (e.g. the progress of gurobi).
+        Printing goes through log, so it is off unless verbose.
+
+        Args:
+            verbose: Print the log messages
+        """
+        self.verbose = verbose
+        self.start = time.perf_counter()
+        # Seconds per phase, summed when a phase runs more than once
+        self.times = {}
+        self.counters = {}
+        # Peak memory (MB) of the process at the end of every phase
+        self.memory = {}
+        # Series name -> list of dicts, each with the time since start
+        self.series = {}
+
+    @contextmanager
+    def phase(self, name):
+        """Times the code in the with block as phase name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+            self.memory[name] = peak_memory()
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + int(amount)
+
+    def maximum(self, name, value):
+        """Keeps the largest value seen for counter name"""
+        self.counters[name] = max(self.counters.get(name, value), int(value))
+
+    def record(self, series, **values):
+        """Adds a point to a time series"""
+        values["time"] = time.perf_counter() - self.start
+        self.series.setdefault(series, []).append(values)
+
+    def log(self, *args):
+        if self.verbose:
+            print(*args)
+
+    def as_dict(self):
+        return {
+            "times": self.times,
+            "counters": self.counters,
+            "memory": self.memory,
+            "peak_memory": peak_memory(),
+            "series": self.series,
+        }
+
+    def write(self, filename):
+        """Writes everything to filename, as csv when it ends with .csv and as json otherwise"""
+        if not filename.endswith(".csv"):
+            with open(filename, "w") as f:
+                json.dump(self.as_dict(), f, indent=2)
+            return
+
+        # One row per value: (kind, name, time, value)
+        with open(filename, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Kind", "Name", "Time", "Value"])
+            for kind, values in (("time", self.times), ("counter", self.counters),
+                                 ("memory", self.memory)):
+                for name, value in values.items():
+                    writer.writerow([kind, name, "", value])
+            writer.writerow(["memory", "peak", "", peak_memory()])
+            for series, points in self.series.items():
+                for point in points:
+                    for name, value in point.items():
+                        if name != "time":
+                            writer.writerow([series, name, point["time"], value])
@@ -0,0 +1,44 @@
+import unittest
+import numpy as np
+
+from bitboard import BitBoard, popcount
+from testing import random_hall, take_seats
+from utils import find_legal_start_positions
+
+
+class TestBitBoard(unittest.TestCase):
+    """Checks for BitBoard place and undo against a matrix"""
+
+    def test_place_and_undo(self):
+        rng = np.random.default_rng(1)
+        for _ in range(30):
+            ys, xs = rng.integers(1, 6), rng.integers(3, 80)
+            available = random_hall(rng, ys, xs)
+            board = BitBoard(available)
+            history = []
+            for _ in range(6):
+                n = int(rng.integers(1, 5))
+                starts = board.legal_starts(n)
+                self.assertEqual(starts, find_legal_start_positions(n, available))
+                if len(starts) == 0:
+                    continue
+                y, x = starts[rng.integers(len(starts))]
+                state = (list(board.rows), list(board.taken), board.free, board.seated_amount)
+                loss = board.loss(y, x, n)
+                history.append((board.place(y, x, n), state, available))
+                available = take_seats(available, y, x, n)
+
+                self.assertEqual(board.rows[1:-1], [BitBoard.to_mask(row) for row in available])
+                self.assertEqual(board.free, int(available.sum()))
+                self.assertEqual(state[2] - board.free, loss)
+                self.assertEqual(board.free, sum(popcount(row) for row in board.rows))
+
+            for token, state, before in reversed(history):
+                board.undo(token)
+                self.assertEqual(
+                    (board.rows, board.taken, board.free, board.seated_amount), state)
+                self.assertEqual(board.rows[1:-1], [BitBoard.to_mask(row) for row in before])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import numpy as np
+
+from blocks import label_blocks, solve_block, solve_blocks, DP_COLUMNS
+from layout import Layout
+from seating import Seating
+from stats import Stats
+from testing import random_hall, random_people
+from utils import count_seated, find_violations
+
+
+def split_hall(rng, ys, xs):
+    """Random hall with an empty row and two empty columns, so it has several blocks"""
+    hall = random_hall(rng, ys, xs, density=0.85)
+    hall[ys // 2, :] = 0
+    hall[:, xs // 2: xs // 2 + 2] = 0
+    return hall
+
+
+class TestSolveBlocks(unittest.TestCase):
+    """Checks solve_blocks against the dp on the whole hall"""
+
+    def test_against_whole_hall(self):
+        rng = np.random.default_rng(11)
+        for _ in range(15):
+            ys, xs = rng.integers(3, 6), rng.integers(6, 12)
+            hall = split_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(2, 10))
+            whole, _ = Seating(hall, people, ys, xs).dp()
+
+            stats = Stats()
+            seats, no_seat = solve_blocks(hall, people, stats=stats)
+            self.assertEqual(find_violations(seats), [])
+            # Only seats are taken, the rest of the hall is left as it was
+            self.assertTrue(np.array_equal(np.where(seats == 2, 1, seats), hall))
+            total = sum((size + 1) * amt for size, amt in people.items())
+            self.assertEqual(no_seat, total - count_seated(seats))
+            self.assertLessEqual(count_seated(seats), count_seated(whole))
+            if stats.counters.get("blocks_optimal", 0) > 0:
+                self.assertEqual(count_seated(seats), count_seated(whole))
+
+    def test_enough_groups(self):
+        rng = np.random.default_rng(12)
+        for _ in range(10):
+            ys, xs = rng.integers(3, 6), rng.integers(6, 12)
+            hall = split_hall(rng, ys, xs)
+            # More groups of every size than can ever be seated
+            people = {size: 20 for size in range(8)}
+            whole, _ = Seating(hall, people, ys, xs).dp()
+            seats, _ = solve_blocks(hall, people)
+            self.assertEqual(count_seated(seats), count_seated(whole))
+
+            with_layout, _ = solve_blocks(hall, people, layout=Layout(hall), workers=2)
+            self.assertTrue(np.array_equal(with_layout, seats))
+
+    def test_greedy_start(self):
+        rng = np.random.default_rng(13)
+        hall = random_hall(rng, 3, 2 * DP_COLUMNS, density=0.9)
+        people = {size: 10 for size in range(8)}
+        np.random.seed(0)
+        greedy, _ = Seating(hall, people, 3, 2 * DP_COLUMNS).greedy()
+        # Too wide for the dp, the block keeps the greedy seating
+        np.random.seed(0)
+        seats = solve_block((hall, people, "dp", None))
+        self.assertTrue(np.array_equal(seats, greedy))
+
+        # Out of time before the first block, nobody is left out of the greedy seatings
+        stats = Stats()
+        seats, _ = solve_blocks(split_hall(rng, 5, 12), people, time_limit=0, stats=stats)
+        self.assertGreater(count_seated(seats), 0)
+        self.assertEqual(find_violations(seats), [])
+        self.assertEqual(stats.counters.get("blocks_optimal", 0), 0)
+
+    def test_labels(self):
+        hall = np.array([[1, 1, 0, 0, 1],
+                         [0, 0, 0, 0, 1],
+                         [1, 0, 1, 0, 0]], dtype=np.uint8)
+        labels, amount = label_blocks(hall)
+        self.assertEqual(amount, 3)
+        self.assertEqual(labels[0, 4], labels[1, 4])
+        # One empty column does not separate seats
+        self.assertEqual(labels[2, 0], labels[2, 2])
+        self.assertNotEqual(labels[0, 0], labels[0, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import numpy as np
+
+from bounds import upper_bound
+from seating import Seating
+from testing import exhaustive, random_hall, random_people
+from utils import count_seated
+
+
+class TestUpperBound(unittest.TestCase):
+    """Checks that bounds.upper_bound never cuts off the optimum"""
+
+    def test_small_halls(self):
+        rng = np.random.default_rng(3)
+        for _ in range(40):
+            ys, xs = rng.integers(1, 4), rng.integers(2, 7)
+            hall = random_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(1, 5))
+            self.assertGreaterEqual(upper_bound(hall, people), exhaustive(hall, people))
+
+    def test_bigger_halls(self):
+        rng = np.random.default_rng(4)
+        for _ in range(15):
+            ys, xs = rng.integers(2, 6), rng.integers(5, 10)
+            hall = random_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(3, 12), max_size=8)
+            seats, _ = Seating(hall, people, ys, xs).dp()
+            self.assertGreaterEqual(upper_bound(hall, people), count_seated(seats))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+import numpy as np
+
+from freeruns import FreeRuns
+from testing import random_hall, take_seats
+from utils import find_legal_start_positions, ones
+
+
+class TestFreeRuns(unittest.TestCase):
+    """Checks for FreeRuns seat and undo against find_legal_start_positions"""
+
+    def test_seat_and_undo(self):
+        rng = np.random.default_rng(2)
+        for _ in range(30):
+            ys, xs = rng.integers(1, 6), rng.integers(3, 40)
+            available = random_hall(rng, ys, xs)
+            runs = FreeRuns(available)
+            history = []
+            for _ in range(6):
+                n = int(rng.integers(1, 5))
+                starts = runs.legal_starts(n)
+                self.assertEqual(starts, find_legal_start_positions(n, available))
+                if len(starts) == 0:
+                    continue
+                y, x = starts[rng.integers(len(starts))]
+                history.append((runs.seat(y, x, n), available))
+                available = take_seats(available, y, x, n)
+                for size in range(1, 5):
+                    self.assertEqual(runs.legal_starts(size),
+                                     find_legal_start_positions(size, available))
+
+            for token, before in reversed(history):
+                runs.undo(token)
+                for y in range(ys):
+                    self.assertEqual(runs.runs(y), [(int(start), int(end - start))
+                                                    for start, end in ones(before[y])])
+
+
+if __name__ == "__main__":
+    unittest.main()
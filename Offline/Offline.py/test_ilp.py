@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from collections import defaultdict
+
+from freeruns import FreeRuns
+from stats import Stats
+from testing import exhaustive, random_hall, random_people, write_instance
+from utils import count_seated, find_violations
+
+try:
+    import gurobipy as gp
+    from ilp import (RESULT_FIELDS, done_jobs, encode_matrix, lazy_conflicts, make_and_solve_ILP,
+                     set_greedy_start)
+except ImportError:
+    # The ILP tests need gurobi
+    gp = None
+
+
+@unittest.skipIf(gp is None, "gurobipy is not installed")
+class TestGreedyStart(unittest.TestCase):
+    """Checks for ilp.set_greedy_start"""
+
+    def test_groups_of_one_size(self):
+        hall = np.ones((1, 8), dtype=np.uint8)
+        legals = {2: FreeRuns(hall).legal_starts(2)}
+        size_to_group = {2: [0, 1]}
+        model = gp.Model()
+        model.Params.OutputFlag = 0
+        seated, placements = encode_matrix(
+            model, legals, size_to_group, np.array([2, 2]), 8, 1)
+
+        greedy = hall.copy()
+        greedy[0, 0:2] = 2
+        greedy[0, 4:6] = 2
+        self.assertTrue(set_greedy_start(
+            model, seated, placements, size_to_group, greedy, loop=False))
+        # The start alone is a solution
+        model.Params.SolutionLimit = 1
+        model.optimize()
+        self.assertEqual(model.ObjVal, 4)
+
+    def test_only_better_seatings(self):
+        hall = np.ones((1, 8), dtype=np.uint8)
+        legals = {2: FreeRuns(hall).legal_starts(2)}
+        size_to_group = {2: [0, 1]}
+        model = gp.Model()
+        model.Params.OutputFlag = 0
+        seated, placements = encode_matrix(
+            model, legals, size_to_group, np.array([2, 2]), 8, 1)
+
+        greedy = hall.copy()
+        greedy[0, 3:5] = 2
+        self.assertTrue(set_greedy_start(
+            model, seated, placements, size_to_group, greedy, loop=False))
+        model.optimize()
+        self.assertEqual(model.ObjVal, 4)
+
+
+def solve_encoding(hall, people, encoding):
+    """Seating of hall by encode_matrix with the pairwise ("matrix"), "clique" or "lazy" conflicts"""
+    ys, xs = hall.shape
+    runs = FreeRuns(hall)
+    legals = {size + 1: runs.legal_starts(size + 1) for size, amt in people.items() if amt > 0}
+    group_sizes = np.array([size + 1 for size, amt in people.items() for _ in range(amt)], dtype=int)
+    size_to_group = defaultdict(list)
+    for i, size in enumerate(group_sizes):
+        size_to_group[size].append(i)
+
+    model = gp.Model()
+    model.Params.OutputFlag = 0
+    seated, placements = encode_matrix(model, legals, size_to_group, group_sizes, xs, ys,
+                                       cliques=encoding == "clique", lazy=encoding == "lazy")
+    if encoding == "lazy":
+        model.Params.LazyConstraints = 1
+        model.optimize(lazy_conflicts(seated, placements, Stats()))
+    else:
+        model.optimize()
+
+    seats = hall.copy()
+    for (y, x, size), value in zip(placements, seated.X):
+        if value > 0.5:
+            seats[y, x: x + size] = 2
+    return round(model.ObjVal), seats
+
+
+@unittest.skipIf(gp is None, "gurobipy is not installed")
+class TestEncodings(unittest.TestCase):
+    """Checks the clique and lazy encodings against the pairwise one"""
+
+    def test_random_halls(self):
+        rng = np.random.default_rng(6)
+        for _ in range(25):
+            ys, xs = rng.integers(1, 5), rng.integers(2, 9)
+            hall = random_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(1, 6))
+            pairwise, _ = solve_encoding(hall, people, "matrix")
+            self.assertEqual(pairwise, exhaustive(hall, people))
+            for encoding in ("clique", "lazy"):
+                objective, seats = solve_encoding(hall, people, encoding)
+                self.assertEqual(objective, pairwise, encoding)
+                self.assertEqual(count_seated(seats), objective, encoding)
+                self.assertEqual(find_violations(seats), [], encoding)
+
+
+@unittest.skipIf(gp is None, "gurobipy is not installed")
+class TestLayouts(unittest.TestCase):
+    """Checks that make_and_solve_ILP gives the same answer with and without layouts"""
+
+    def test_same_groups(self):
+        rng = np.random.default_rng(8)
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(8):
+                ys, xs = rng.integers(2, 5), rng.integers(2, 9)
+                hall = random_hall(rng, ys, xs)
+                # Also sizes that do not fit anywhere
+                people = {size: int(amt) for size, amt in enumerate(rng.integers(0, 3, 8))}
+                filename = os.path.join(folder, "hall{}.txt".format(i))
+                write_instance(filename, hall, people)
+
+                without = make_and_solve_ILP(filename, use_layouts=False, stats=Stats())
+                with_layouts = make_and_solve_ILP(filename, use_layouts=True, stats=Stats())
+                # Groups, people, valid and not seated
+                self.assertEqual(without[4:8], with_layouts[4:8])
+                self.assertTrue(without[6])
+
+
+@unittest.skipIf(gp is None, "gurobipy is not installed")
+class TestDoneJobs(unittest.TestCase):
+    """Checks for reading the rows of an earlier experiment_runner"""
+
+    def test_rows(self):
+        with tempfile.TemporaryDirectory() as folder:
+            results = os.path.join(folder, "python.csv")
+            self.assertEqual(done_jobs(results), set())
+            row = dict(zip(RESULT_FIELDS, range(len(RESULT_FIELDS))))
+            with open(results, "w") as f:
+                f.write(",".join(RESULT_FIELDS) + "\n")
+                f.write(",".join(str(row[field]) for field in RESULT_FIELDS) + "\n")
+            self.assertEqual(len(done_jobs(results)), 1)
+
+    def test_old_header(self):
+        with tempfile.TemporaryDirectory() as folder:
+            results = os.path.join(folder, "python.csv")
+            with open(results, "w") as f:
+                f.write(",".join(RESULT_FIELDS[:8]) + "\n")
+            with self.assertRaises(ValueError):
+                done_jobs(results)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import numpy as np
+
+from testing import random_hall, random_people
+from utils import count_seated, find_violations, seated_groups
+
+try:
+    from incremental import HallSolver, random_changes
+    from ilp import solve_hall
+except ImportError:
+    # HallSolver needs gurobi
+    HallSolver = None
+
+
+@unittest.skipIf(HallSolver is None, "gurobipy is not installed")
+class TestHallSolver(unittest.TestCase):
+    """Checks HallSolver re-solves against solving every demand from scratch"""
+
+    def test_against_cold_solve(self):
+        rng = np.random.default_rng(16)
+        for _ in range(4):
+            hall = random_hall(rng, 4, 9)
+            people = random_people(rng, 6)
+            solver = HallSolver(hall, people)
+            seats, no_seat = solver.solve()
+            self.assertEqual(count_seated(seats), count_seated(solve_hall(hall, people)))
+
+            for size, change in random_changes(rng, people, 6, max_size=4):
+                if change > 0:
+                    solver.book(size)
+                else:
+                    solver.cancel(size)
+                people[size - 1] = max(people[size - 1] + change, 0)
+                seats, no_seat = solver.solve()
+                self.assertEqual(count_seated(seats), count_seated(solve_hall(hall, people)))
+                self.assertEqual(find_violations(seats), [])
+                # Never more groups of a size than are waiting
+                used = np.bincount([n for (_, _, n) in seated_groups(seats)], minlength=9)[1:]
+                self.assertTrue(np.all(used <= [people[size] for size in range(8)]))
+                total = sum((size + 1) * amt for size, amt in people.items())
+                self.assertEqual(no_seat, total - count_seated(seats))
+
+    def test_failed_solve(self):
+        rng = np.random.default_rng(18)
+        hall = random_hall(rng, 4, 9)
+        people = {size: 3 for size in range(8)}
+        solver = HallSolver(hall, people)
+        solver.solve()
+        for size in range(1, 9):
+            solver.cancel(size, 2)
+            people[size - 1] -= 2
+        # No time to find anything, the old seating without the cancelled groups
+        seats, no_seat = solver.solve(time_limit=0)
+        self.assertEqual(solver.stats.counters["failed_solves"], 1)
+        self.assertEqual(find_violations(seats), [])
+        used = np.bincount([n for (_, _, n) in seated_groups(seats)], minlength=9)[1:]
+        self.assertTrue(np.all(used <= [people[size] for size in range(8)]))
+        total = sum((size + 1) * amt for size, amt in people.items())
+        self.assertEqual(no_seat, total - count_seated(seats))
+
+        # The time limit does not stick to the next solve
+        seats, _ = solver.solve()
+        self.assertEqual(solver.model.Params.TimeLimit, float("inf"))
+        self.assertEqual(count_seated(seats), count_seated(solve_hall(hall, people)))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+
+from blocks import label_blocks
+from freeruns import FreeRuns
+from layout import Layout, LayoutCache
+from testing import random_hall
+from utils import conflicting_positions, filter_people
+
+
+class TestFilterPeople(unittest.TestCase):
+    """Checks that Layout.filter_people keeps the same sizes as utils.filter_people"""
+
+    def test_random_halls(self):
+        rng = np.random.default_rng(7)
+        for _ in range(30):
+            ys, xs = rng.integers(1, 5), rng.integers(1, 14)
+            hall = random_hall(rng, ys, xs)
+            # More than the 8 sizes of an instance
+            people = {size: int(amt) for size, amt in enumerate(rng.integers(0, 3, 12))}
+            kept = filter_people(hall, people)
+            self.assertEqual(Layout(hall).filter_people(people), kept)
+            longest = max([len(run) for row in hall for run in "".join(map(str, row)).split("0")])
+            self.assertEqual(set(kept), {size for size in people if size + 1 <= longest})
+
+
+class TestLayoutCache(unittest.TestCase):
+    """Checks that layouts read back from disk (memory mapped) equal new ones"""
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(13)
+        hall = random_hall(rng, 6, 15)
+        with tempfile.TemporaryDirectory() as folder:
+            first = Layout(hall, folder)
+            first.conflicts(2, 3)
+            again = Layout(hall, folder)
+            self.assertIsInstance(again.legals[3], np.memmap)
+            self.assertIsInstance(again.labels, np.memmap)
+
+            runs = FreeRuns(hall)
+            for size in range(1, 9):
+                self.assertEqual(again.starts(size), runs.legal_starts(size))
+            self.assertTrue(np.array_equal(again.labels, label_blocks(hall)[0]))
+            legals = {size: np.array(runs.legal_starts(size)).reshape(-1, 2) for size in (2, 3)}
+            for got, expected in zip(again.conflicts(2, 3),
+                                     conflicting_positions(legals, 2, 3, 15, 6)):
+                self.assertTrue(np.array_equal(got, expected))
+            self.assertTrue(os.path.exists(os.path.join(folder, first.key, "conflicts_2_3_first.npy")))
+
+    def test_sources(self):
+        rng = np.random.default_rng(14)
+        hall = random_hall(rng, 4, 9)
+        with tempfile.TemporaryDirectory() as folder:
+            self.assertEqual(LayoutCache(folder=folder).get(hall)[1], "new")
+            cache = LayoutCache(capacity=1, folder=folder)
+            self.assertEqual(cache.get(hall)[1], "disk")
+            self.assertEqual(cache.get(hall)[1], "memory")
+            cache.get(random_hall(rng, 4, 9))
+            self.assertEqual(cache.get(hall)[1], "disk")
+            self.assertEqual(os.listdir(folder).count(cache.get(hall)[0].key), 1)
+
+    def test_memory_only(self):
+        hall = random_hall(np.random.default_rng(15), 4, 9)
+        cache = LayoutCache()
+        self.assertIsNone(cache.folder)
+        self.assertEqual(cache.get(hall)[1], "new")
+        self.assertEqual(cache.get(hall)[1], "memory")
+        self.assertIsNone(cache.get(hall)[0].path)
+
+
+if __name__ == "__main__":
+    unittest.main()
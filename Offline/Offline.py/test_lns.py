@@ -0,0 +1,48 @@
+import time
+import unittest
+import numpy as np
+
+from lns import improve, pick_window, DP_COLUMNS
+from seating import Seating
+from utils import find_violations
+
+
+class TestTimeLimit(unittest.TestCase):
+    """Checks that the dp windows of improve stay within the time budget"""
+
+    def test_dp_time_limit(self):
+        rng = np.random.default_rng(1)
+        hall = (rng.random((3, 32)) < 0.85).astype(np.uint8)
+        people = {size: 6 for size in range(8)}
+        start = time.time()
+        np.random.seed(0)
+        seats, no_seat = Seating(hall, people, 3, 32).dp(time_limit=0.2)
+        self.assertLess(time.time() - start, 2)
+        # The greedy seating instead
+        np.random.seed(0)
+        greedy = Seating(hall, people, 3, 32).greedy()
+        self.assertTrue(np.array_equal(seats, greedy[0]))
+        self.assertEqual(no_seat, greedy[1])
+
+        incumbent = (hall.copy(), 1)
+        self.assertIs(Seating(hall, people, 3, 32).dp(0.2, incumbent), incumbent)
+
+    def test_rows_windows_are_capped(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            y0, y1, x0, x1 = pick_window(rng, 30, 40, 3, 12, "rows", DP_COLUMNS)
+            self.assertEqual(x1 - x0, DP_COLUMNS)
+            self.assertEqual(pick_window(rng, 30, 10, 3, 12, "rows", DP_COLUMNS)[2:], (0, 10))
+
+    def test_wide_hall(self):
+        rng = np.random.default_rng(1)
+        hall = (rng.random((30, 40)) < 0.85).astype(np.uint8)
+        people = {size: 40 for size in range(8)}
+        start = time.time()
+        seats, _ = improve(hall, people, window="rows", time_limit=1.0)
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(find_violations(seats), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
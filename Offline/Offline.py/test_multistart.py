@@ -0,0 +1,33 @@
+import unittest
+import numpy as np
+
+from multistart import multistart, restart
+from testing import random_hall, random_people
+from utils import count_seated, find_violations
+
+
+class TestMultistart(unittest.TestCase):
+    """Checks that multistart keeps the best restart and can replay it"""
+
+    def test_workers_and_replay(self):
+        rng = np.random.default_rng(9)
+        for _ in range(4):
+            hall = random_hall(rng, 8, 12)
+            people = random_people(rng, 20, max_size=6)
+            seats, no_seat, seed = multistart(hall, people, restarts=6, perturb=0.5, noise=0.3)
+            parallel = multistart(hall, people, restarts=6, workers=2, perturb=0.5, noise=0.3)
+            self.assertEqual(parallel[2], seed)
+            self.assertTrue(np.array_equal(parallel[0], seats))
+
+            self.assertEqual(find_violations(seats), [])
+            total = sum((size + 1) * amt for size, amt in people.items())
+            self.assertEqual(no_seat, total - count_seated(seats))
+            for other in range(6):
+                _, replay = restart((hall, people, other, 0.5, 0.3))
+                self.assertLessEqual(count_seated(replay), count_seated(seats))
+                if other == seed:
+                    self.assertTrue(np.array_equal(replay, seats))
+
+
+if __name__ == "__main__":
+    unittest.main()
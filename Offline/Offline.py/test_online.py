@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+
+from online import OnlineSeating
+from testing import random_hall
+from utils import find_violations
+
+
+class TestOnlineSeating(unittest.TestCase):
+    """Checks OnlineSeating seat and release against building it again from scratch"""
+
+    def rebuilt(self, hall, bookings):
+        online = OnlineSeating(hall)
+        for (y, x, n) in bookings:
+            online.place(y, x, n)
+        return online
+
+    def test_seat_and_release(self):
+        rng = np.random.default_rng(10)
+        for _ in range(15):
+            ys, xs = rng.integers(1, 7), rng.integers(3, 30)
+            hall = random_hall(rng, ys, xs)
+            online = OnlineSeating(hall)
+            bookings = []
+            for _ in range(25):
+                if len(bookings) > 0 and rng.random() < 0.3:
+                    online.release(*bookings.pop(rng.integers(len(bookings))))
+                else:
+                    n = int(rng.integers(1, 9))
+                    pos = online.seat(n)
+                    if pos is not None:
+                        bookings.append((pos[0], pos[1], n))
+
+                scratch = self.rebuilt(hall, bookings)
+                self.assertTrue(np.array_equal(online.available_seats, scratch.available_seats))
+                self.assertTrue(np.array_equal(online.result(), scratch.result()))
+                for n in range(1, 9):
+                    self.assertEqual(online.best_position(n), scratch.best_position(n), n)
+                self.assertEqual(find_violations(online.result()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+
+from seating import Seating
+from testing import exhaustive, random_hall, random_people
+from utils import count_seated, find_violations
+
+
+class TestDp(unittest.TestCase):
+    """Checks for Seating.dp against Seating.dfs and trying everything"""
+
+    def test_random_halls(self):
+        rng = np.random.default_rng(0)
+        for _ in range(40):
+            ys, xs = rng.integers(1, 4), rng.integers(2, 7)
+            hall = random_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(1, 5))
+            optimum = exhaustive(hall, people)
+            dp, _ = Seating(hall, people, ys, xs).dp()
+            dfs, _ = Seating(hall, people, ys, xs).dfs()
+            self.assertEqual(count_seated(dp), optimum)
+            self.assertEqual(count_seated(dfs), optimum)
+            self.assertEqual(find_violations(dp), [])
+
+    def test_wide_hall(self):
+        # Seats past column 63 do not fit in a 64 bit integer
+        hall = np.zeros((2, 80), dtype=np.uint8)
+        hall[:, 70:75] = 1
+        people = {size: 0 for size in range(8)}
+        people[0], people[1] = 4, 2
+        seats, _ = Seating(hall, people, 2, 80).dp()
+        self.assertEqual(count_seated(seats), 4)
+        self.assertEqual(find_violations(seats), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from service import BookingService, MAX_SEEDS
+
+HALL = ["11111111", "11111111", "11111111"]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class TestBookingService(unittest.TestCase):
+    """Checks for BookingService requests"""
+
+    def setUp(self):
+        self.pool = ThreadPoolExecutor(1)
+        self.service = BookingService(self.pool)
+        self.service.open({"op": "open", "screening": "a", "hall": HALL})
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def test_seat_and_release(self):
+        answer = run(self.service.handle({"op": "seat", "screening": "a", "size": 3}))
+        self.assertTrue(answer["ok"])
+        self.assertLess(self.service.screenings["a"].free_seats(), 24 - 3)
+        released = run(self.service.handle(
+            {"op": "release", "screening": "a", "booking": answer["booking"]}))
+        self.assertTrue(released["ok"])
+        self.assertEqual(self.service.screenings["a"].free_seats(), 24)
+
+    def test_close_racing_a_seat(self):
+        async def race():
+            screening = self.service.screenings["a"]
+            async with screening.lock:
+                close = asyncio.ensure_future(self.service.handle({"op": "close", "screening": "a"}))
+                seat = asyncio.ensure_future(
+                    self.service.handle({"op": "seat", "screening": "a", "size": 2}))
+                # Both wait for the lock, the close came first
+                await asyncio.sleep(0)
+            return await close, await seat
+
+        closed, seated = run(race())
+        self.assertTrue(closed["ok"])
+        self.assertEqual(seated, {"ok": False, "reason": "unknown screening"})
+        self.assertNotIn("a", self.service.screenings)
+
+    def test_bad_seeds(self):
+        for seeds in (0, MAX_SEEDS + 1, "4", True, 2.0):
+            answer = run(self.service.handle({"op": "reseat", "screening": "a", "seeds": seeds}))
+            self.assertEqual(answer, {"ok": False, "reason": "bad seeds"}, seeds)
+
+    def test_reseat(self):
+        for size in (1, 1, 1):
+            run(self.service.handle({"op": "seat", "screening": "a", "size": size}))
+        answer = run(self.service.handle({"op": "reseat", "screening": "a", "seeds": 2}))
+        self.assertIn(answer.get("reason"), (None, "no improvement"))
+        self.assertEqual(len(self.service.screenings["a"].bookings), 3)
+
+    def test_error_answer(self):
+        async def session():
+            async def fail(request):
+                if request["op"] == "fail":
+                    raise RuntimeError("broken")
+                return await BookingService.handle(self.service, request)
+            self.service.handle = fail
+
+            server = await asyncio.start_server(self.service.client, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            answers = []
+            for request in ({"op": "fail"}, {"op": "seat", "screening": "a", "size": 1, "id": 7}):
+                writer.write(json.dumps(request).encode() + b"\n")
+                await writer.drain()
+                answers.append(json.loads(await reader.readline()))
+            writer.close()
+            await writer.wait_closed()
+            server.close()
+            await server.wait_closed()
+            return answers
+
+        failed, seated = run(session())
+        self.assertFalse(failed["ok"])
+        self.assertIn("broken", failed["reason"])
+        self.assertTrue(seated["ok"])
+        self.assertEqual(seated["id"], 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
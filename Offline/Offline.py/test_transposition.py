@@ -0,0 +1,70 @@
+import unittest
+import numpy as np
+
+from seating import Seating
+from testing import random_hall, random_people
+from transposition import TranspositionTable
+from utils import count_seated
+
+
+class TestTranspositionTable(unittest.TestCase):
+    """Checks for TranspositionTable eviction and its use in Seating.dfs"""
+
+    @staticmethod
+    def table(entries, sample=4):
+        # A budget of entries (equally sized) entries
+        size = TranspositionTable.size((bytes(8), 0, None), (0, 0))
+        return TranspositionTable((entries + 0.5) * size / 2 ** 20, sample)
+
+    def key(self, i):
+        return (i.to_bytes(8, "little"), 0, None)
+
+    def test_evicts_least_work_of_oldest(self):
+        table = self.table(4, sample=3)
+        for i, work in enumerate([5, 1, 7, 9]):
+            table.put(self.key(i), 10, work)
+        table.put(self.key(4), 10, 3)
+        # Oldest three are 0, 1 and 2, entry 1 has the least work left
+        self.assertEqual(len(table), 4)
+        self.assertIsNone(table.get(self.key(1)))
+        self.assertEqual(table.get(self.key(0)), 10)
+        self.assertEqual(table.evictions, 1)
+        self.assertLessEqual(table.bytes, table.budget)
+
+    def test_get_refreshes(self):
+        table = self.table(2, sample=1)
+        table.put(self.key(0), 1, 0)
+        table.put(self.key(1), 1, 0)
+        table.get(self.key(0))
+        table.put(self.key(2), 1, 0)
+        self.assertIsNone(table.get(self.key(1)))
+        self.assertEqual(table.get(self.key(0)), 1)
+        self.assertEqual(table.get(self.key(2)), 1)
+
+    def test_newest_stays(self):
+        table = self.table(1)
+        table.put(self.key(0), 1, 9)
+        table.put(self.key(1), 2, 0)
+        self.assertEqual(table.get(self.key(1)), 2)
+        self.assertEqual(len(table), 1)
+
+    def test_keeps_the_lowest_bound(self):
+        table = self.table(4)
+        table.put(self.key(0), 5, 1)
+        table.put(self.key(0), 3, 1)
+        table.put(self.key(0), 4, 1)
+        self.assertEqual(table.get(self.key(0)), 3)
+
+    def test_dfs_with_small_table(self):
+        rng = np.random.default_rng(5)
+        for _ in range(20):
+            ys, xs = rng.integers(2, 5), rng.integers(4, 9)
+            hall = random_hall(rng, ys, xs)
+            people = random_people(rng, rng.integers(2, 8))
+            without, _ = Seating(hall, people, ys, xs).dfs(table=TranspositionTable(0))
+            small, _ = Seating(hall, people, ys, xs).dfs(table=self.table(3))
+            self.assertEqual(count_seated(small), count_seated(without))
+
+
+if __name__ == "__main__":
+    unittest.main()
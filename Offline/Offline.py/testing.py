@@ -0,0 +1,59 @@
+import numpy as np
+
+from freeruns import FreeRuns
+from utils import check_legal
+
+
+def exhaustive(hall, people):
+    """Most people that can be seated in a small hall, by trying every set of legal positions"""
+    runs = FreeRuns(hall)
+    options = [(size + 1, y, x) for size, amt in people.items() if amt > 0
+               for (y, x) in runs.legal_starts(size + 1)]
+    left = {size + 1: amt for size, amt in people.items()}
+
+    def best(i, placed):
+        if i == len(options):
+            return 0
+        size, y, x = options[i]
+        result = best(i + 1, placed)
+        if left[size] > 0 and all(
+                check_legal(size, other, x, ox, y, oy)[0] for (other, oy, ox) in placed):
+            left[size] -= 1
+            result = max(result, size + best(i + 1, placed + [(size, y, x)]))
+            left[size] += 1
+        return result
+
+    return best(0, [])
+
+
+def random_hall(rng, ys, xs, density=0.8):
+    """Random hall with about density of the cells a seat"""
+    return (rng.random((ys, xs)) < density).astype(np.uint8)
+
+
+def random_people(rng, groups, max_size=4):
+    """people dict (sizes 1..8) with groups random groups of at most max_size"""
+    people = {size: 0 for size in range(8)}
+    for size in rng.integers(0, max_size, groups):
+        people[int(size)] += 1
+    return people
+
+
+def take_seats(available, y, x, n):
+    """available (0/1 matrix) after seating a group of size n at (y, x), using the stencil"""
+    available = available.copy()
+    ys, xs = available.shape
+    available[y, max(x - 2, 0): x + n + 2] = 0
+    for row in (y - 1, y + 1):
+        if 0 <= row < ys:
+            available[row, max(x - 1, 0): x + n + 1] = 0
+    return available
+
+
+def write_instance(filename, hall, people):
+    """Writes hall and people (people[i] groups of size i + 1) as an offline instance"""
+    with open(filename, "w") as f:
+        f.write("{}\n{}\n".format(*hall.shape))
+        for row in hall:
+            f.write("".join(str(int(seat)) for seat in row) + "\n")
+        f.write(" ".join(str(people[size]) for size in range(len(people))) + "\n")
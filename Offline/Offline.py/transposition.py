@@ -0,0 +1,89 @@
+import sys
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    def __init__(self, memory=64, sample=4):
+        """
+        Bounded table of search states for Seating.dfs, with LRU eviction that
+        prefers to keep shallow entries, which save the most search when they are
+        hit: when the table is full, the entry with the least work left (the
+        deepest one) of the sample least recently used entries is evicted.
+
+        Every entry is (bound, work): bound is the most people that can still be
+        seated from the state, work the amount of groups still waiting there.
+
+        Args:
+            memory: Budget in MB (keys, values and the dict itself), 0 disables the table
+            sample: Amount of least recently used entries to choose the evicted one from
+        """
+        self.budget = int(memory * 2 ** 20)
+        self.sample = sample
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(rows, width, index, after):
+        """
+        Compact state: the available seats of every row packed into bytes,
+        the index of the next group (the groups still waiting are groups[index:])
+        and the position the next group has to come after (None: anywhere)
+        """
+        packed = b"".join(row.to_bytes(width, "little") for row in rows)
+        return packed, index, after
+
+    @staticmethod
+    def size(key, value):
+        # Rough size of an entry in an OrderedDict: key, value and its links
+        return sys.getsizeof(key[0]) + sys.getsizeof(key) + sys.getsizeof(value) + 100
+
+    def get(self, key):
+        """bound of the state, None when it is not in the table"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, bound, work):
+        if self.budget <= 0:
+            return
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.entries[key] = (min(bound, self.entries[key][0]), work)
+            return
+        self.entries[key] = (bound, work)
+        self.bytes += self.size(key, self.entries[key])
+        self.stores += 1
+        while self.bytes > self.budget and len(self.entries) > 1:
+            self.evict()
+
+    def evict(self):
+        oldest = []
+        for key in self.entries:
+            if len(oldest) == self.sample:
+                break
+            oldest.append(key)
+        # The newest entry is never evicted right after storing it
+        candidates = oldest[:-1] if len(oldest) == len(self.entries) else oldest
+        victim = min(candidates, key=lambda key: self.entries[key][1])
+        self.bytes -= self.size(victim, self.entries.pop(victim))
+        self.evictions += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+    def counters(self):
+        return {
+            "tt_hits": self.hits,
+            "tt_misses": self.misses,
+            "tt_stores": self.stores,
+            "tt_evictions": self.evictions,
+            "tt_entries": len(self.entries),
+        }
@@ -1,33 +1,145 @@
+import os
+import mmap
+import tempfile
 import unittest
 import numpy as np
 from enum import Enum
+from collections import namedtuple
 
 
-def filter_people(cinema, people):
-    result = {}
-    for size in people:
-        if len(find_legal_start_positions(size, cinema)) > 0:
-            result[size] = people[size]
+def filter_people(cinema, people, legal_starts=None):
+    """
+    Only the group sizes that fit somewhere in cinema, people[i] is the amount
+    of groups of size i + 1
+    legal_starts: Function giving the legal start positions of a group size
+                  (find_legal_start_positions in cinema when None)
+    """
+    if legal_starts is None:
+        def legal_starts(n):
+            return find_legal_start_positions(n, cinema)
+    return {size: amt for size, amt in people.items() if len(legal_starts(size + 1)) > 0}
 
-    return result
 
+# Below this many bytes parsing is faster than loading the cache
+CACHE_MIN_BYTES = 2 ** 17
+
+
+def read_instance(filename="instances/instance.txt", cache=False):
+    """
+    Reads an offline instance. The hall is decoded straight from the memory mapped
+    file. With cache, big instances (CACHE_MIN_BYTES and up) are also stored next
+    to it in filename.npz so the next read skips parsing
+
+    Args:
+        cache: Use (and write) the .npz cache for big instances
+
+    Returns: (hall as uint8 matrix, 1 where there is a seat, people, h, v)
+    people[i] is the amount of groups of size i + 1
+    """
+    cache = cache and os.path.getsize(filename) >= CACHE_MIN_BYTES
+    if cache:
+        cached = read_cache(filename)
+        if cached is not None:
+            return cached
 
-def read_instance(filename="instances/instance.txt"):
-    with open(filename, "r") as f:
-        lines = f.readlines()
-        h = int(lines[0].strip())
-        v = int(lines[1].strip())
-        people = {}
-        problem = np.zeros((h, v))
+    problem, h, v, rest = read_hall(filename)
 
-        for amt, i in enumerate(lines[-1].split()):
-            people[amt] = int(i)
-        for i, line in enumerate(lines[2:-1]):
-            problem[i, :] = np.array([bool(int(z)) for z in line.strip()])
+    people = {}
+    for amt, i in enumerate(rest[-1].split()):
+        people[amt] = int(i)
 
+    if cache:
+        write_cache(filename, problem, people)
+    return problem, people, h, v
+
+
+def read_hall(filename):
+    """
+    Decodes the hall straight from the memory mapped file, raises a ValueError
+    when it has fewer than h seat rows or a row shorter than v seats
+    Returns: (hall as uint8 matrix, h, v, the (non empty) lines after the hall)
+    """
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        raw = np.frombuffer(data, dtype=np.uint8)
+        try:
+            # Start of every line
+            starts = np.concatenate(([0], np.flatnonzero(raw == ord("\n")) + 1))
+            if len(starts) < 3:
+                raise ValueError("{}: no hall size in the first two lines".format(filename))
+            h = int(data[starts[0]:starts[1]].strip())
+            v = int(data[starts[1]:starts[2]].strip())
+
+            # Every seat row needs v characters, the last one may end without a newline
+            if len(starts) < 2 + h:
+                raise ValueError("{}: {} seat rows instead of {}".format(
+                    filename, len(starts) - 2, h))
+            ends = np.append(starts[3:], len(raw) + 1)[:h]
+            short = np.flatnonzero(ends - starts[2: 2 + h] < v + 1)
+            if len(short) > 0:
+                raise ValueError("{}: seat row {} is shorter than {} seats".format(
+                    filename, int(short[0]) + 1, v))
+
+            # Character x of seat row y, for all seats at once
+            index = starts[2: 2 + h, None] + np.arange(v)
+            problem = (raw[index] != ord("0")).astype(np.uint8)
+            rest = bytes(data[starts[2 + h]:]) if len(starts) > 2 + h else b""
+        finally:
+            # The mmap only closes without views on it, also when the file is malformed
+            del raw
+
+    return problem, h, v, [line for line in rest.splitlines() if line.strip() != b""]
+
+
+def read_online_instance(filename="instances/instance.txt"):
+    """
+    Reads an online instance: the hall, followed by the group sizes in order of
+    arrival, ending with 0. Offline instances (amounts of groups per size) are
+    turned into arrivals in a random order.
+
+    Returns: (hall as uint8 matrix, 1 where there is a seat, list of group sizes, h, v)
+    """
+    problem, h, v, rest = read_hall(filename)
+    numbers = [int(i) for line in rest for i in line.split()]
+
+    if len(numbers) > 0 and numbers[-1] == 0:
+        groups = numbers[: numbers.index(0)]
+    else:
+        groups = list(np.random.permutation(
+            np.repeat(np.arange(1, len(numbers) + 1), numbers)))
+        groups = [int(g) for g in groups]
+    return problem, groups, h, v
+
+
+def cache_file(filename):
+    return filename + ".npz"
+
+
+def read_cache(filename):
+    """(problem, people, h, v) from the cache, None when it is missing or older than the file"""
+    try:
+        stat = os.stat(filename)
+        with np.load(cache_file(filename)) as cached:
+            if (cached["mtime"], cached["size"]) != (stat.st_mtime_ns, stat.st_size):
+                return None
+            problem = cached["problem"]
+            people = dict(enumerate(int(amt) for amt in cached["people"]))
+    except (OSError, KeyError, ValueError):
+        return None
+    h, v = problem.shape
     return problem, people, h, v
 
 
+def write_cache(filename, problem, people):
+    stat = os.stat(filename)
+    try:
+        with open(cache_file(filename), "wb") as f:
+            np.savez(f, problem=problem, people=np.array([people[i] for i in range(len(people))]),
+                     mtime=stat.st_mtime_ns, size=stat.st_size)
+    except OSError:
+        # Read-only folder, just parse the next time
+        pass
+
+
 def count_seated(matrix):
     return np.count_nonzero(matrix == 2)
 
@@ -78,7 +190,6 @@ def get_invalid_seats(x1, y1, g1, g2, xdim, ydim):
     result = []
     g_size1 = g1 - 1
     g_size2 = g2 - 1
-    last_seat = x1 + g_size1
 
     for x2 in range(x1 - 2 - g_size2, x1 + g_size1 + 3):
         # only add inbounds
@@ -95,61 +206,162 @@ def get_invalid_seats(x1, y1, g1, g2, xdim, ydim):
     return result
 
 
-def verify_cinema(cinema, xlen, ylen):
-    seated_groups = dict()
-    group_size = 0
-    first_person = (-1, -1)
-
-    for y in range(0, ylen):
-        for x in range(0, xlen):
-            if cinema[y, x] == 2:
-                # We have found our first person of the group
-                if first_person == (-1, -1):
-                    first_person = (x, y)
-                    group_size += 1
-                # This is not the first person, so we only increase group size
-                else:
-                    group_size += 1
-            else:
-                # We have reached the end of the group, lets store it
-                if first_person != (-1, -1):
-                    seated_groups[first_person] = group_size
-                    group_size = 0
-                    first_person = (-1, -1)
-        # This makes sure we store the group at the edge of the cinema
-        if first_person != (-1, -1):
-            seated_groups[first_person] = group_size
-            group_size = 0
-            first_person = (-1, -1)
-
-    cinema_meets_corona_guidelines = True
+def get_invalid_offsets(g1, g2):
+    """
+    Same neighbourhood as get_invalid_seats, but as (dx, dy) offsets from the
+    start position of group 1 so it can be applied to many positions at once
+    """
+    g_size1 = g1 - 1
+    g_size2 = g2 - 1
+
+    same_row = np.arange(-2 - g_size2, g_size1 + 3)
+    other_row = np.arange(-2 - g_size2 + 1, g_size1 + 2)
+
+    dx = np.concatenate([same_row, other_row, other_row])
+    dy = np.concatenate(
+        [
+            np.zeros(len(same_row), dtype=int),
+            np.ones(len(other_row), dtype=int),
+            -np.ones(len(other_row), dtype=int),
+        ]
+    )
+    return dx, dy
+
+
+def conflicting_positions(legals, size1, size2, xs, ys):
+    """
+    Vectorized version of looping get_invalid_seats over legals[size1]
+    Returns two index arrays (into legals[size1] and legals[size2]) of start
+    positions that cannot both be used
+    """
+    starts1 = np.asarray(legals[size1], dtype=int).reshape(-1, 2)
+    starts2 = np.asarray(legals[size2], dtype=int).reshape(-1, 2)
+
+    # Position index of every legal start of size2, -1 everywhere else
+    lookup = np.full((ys, xs), -1)
+    lookup[starts2[:, 0], starts2[:, 1]] = np.arange(len(starts2))
+
+    dx, dy = get_invalid_offsets(size1, size2)
+    y2 = starts1[:, 0, None] + dy
+    x2 = starts1[:, 1, None] + dx
+    inside = (x2 >= 0) & (x2 < xs) & (y2 >= 0) & (y2 < ys)
+
+    first = np.broadcast_to(np.arange(len(starts1))[:, None], x2.shape)[inside]
+    second = lookup[y2[inside], x2[inside]]
+    keep = second >= 0
+
+    return first[keep], second[keep]
+
+
+# A pair of groups that are seated too close: kind is a LegalError,
+# first and second are the groups as ((x, y) of the first seat, size)
+Violation = namedtuple("Violation", ["kind", "first", "second"])
+
+
+def label_groups(seated):
+    """
+    Numbers the groups in a stack of seatings: a group is a run of seated people in a row
+    Returns: (labels, 0 where nobody is seated and the group number (from 1) otherwise,
+              (solution, y, x) of the first seat of every group, size of every group)
+    """
+    # A group starts where someone is seated, and the seat to the left is not taken
+    starts = seated.copy()
+    starts[..., 1:] &= ~seated[..., :-1]
+    labels = np.cumsum(starts, axis=None).reshape(seated.shape) * seated
+    first = np.nonzero(starts)
+    sizes = np.bincount(labels.ravel())[1:]
+    return labels, first, sizes
+
+
+def find_violations_batch(solutions):
+    """
+    Checks a stack of seatings of the same hall at once, in time linear in the hall:
+    every seated person is compared with the seats of the spacing stencil after it
+    (2 seats to the right, the 3 seats below it). Seats with someone of another group
+    in them are a violation, the stencil before a seat is covered by the other group.
+
+    Args:
+        solutions: array (amount, h, v), 2 where people are seated
+
+    Returns: for every solution the list of Violations, each pair of groups once
+    """
+    seated = np.asarray(solutions) == 2
+    amount = seated.shape[0]
+    labels, (which, ys, xs), sizes = label_groups(seated)
+
+    pairs = []
+    # Same row, one empty seat in between (next to each other is the same group)
+    pairs.append((labels[:, :, :-2], labels[:, :, 2:]))
+    # Row below: left, same and right column
+    pairs.append((labels[:, :-1, 1:], labels[:, 1:, :-1]))
+    pairs.append((labels[:, :-1, :], labels[:, 1:, :]))
+    pairs.append((labels[:, :-1, :-1], labels[:, 1:, 1:]))
+
+    conflicts = []
+    for a, b in pairs:
+        clash = (a > 0) & (b > 0) & (a != b)
+        conflicts.append(np.stack([a[clash], b[clash]], axis=1))
+    conflicts = np.concatenate(conflicts)
+    conflicts = np.unique(np.sort(conflicts, axis=1), axis=0) - 1
+
+    violations = [[] for _ in range(amount)]
+    for g1, g2 in conflicts:
+        x1, y1, x2, y2 = xs[g1], ys[g1], xs[g2], ys[g2]
+        if y1 == y2:
+            kind = LegalError.horizontal
+        elif x1 == x2:
+            kind = LegalError.vertical
+        else:
+            kind = LegalError.diagnol
+        violations[which[g1]].append(Violation(
+            kind, ((int(x1), int(y1)), int(sizes[g1])), ((int(x2), int(y2)), int(sizes[g2]))))
+    return violations
+
+
+def find_violations(cinema):
+    """Violations of one seating (2 where people are seated), see find_violations_batch"""
+    return find_violations_batch(np.asarray(cinema)[None])[0]
+
+
+def verify_batch(solutions):
+    """
+    Violations of every seating in solutions (list of matrices, any shapes),
+    seatings of the same shape are checked together
+    """
+    result = [None] * len(solutions)
+    shapes = {}
+    for i, solution in enumerate(solutions):
+        shapes.setdefault(np.shape(solution), []).append(i)
+    for indices in shapes.values():
+        stacked = np.stack([solutions[i] for i in indices])
+        for i, violations in zip(indices, find_violations_batch(stacked)):
+            result[i] = violations
+    return result
+
+
+def verify_cinema(cinema, xlen, ylen, shown=10):
+    """
+    Checks a seating, prints a summary and the first shown violations
+    Returns: True when it meets the guidelines
+    """
+    violations = find_violations(cinema[:ylen, :xlen])
 
     print("---- VERIFYING CINEMA ----")
-    for (x1, y1), g1 in seated_groups.items():
-        for (x2, y2), g2 in seated_groups.items():
-            if x1 != x2 and y1 != y2:
-                (is_legal, err) = check_legal(g1, g2, x1, x2, y1, y2)
-                if not is_legal:
-                    print("CORONA ALERT")
-                    print("{} guidline has been violated".format(str(err)))
-                    print(
-                        "Group seated at coordinates {} and size {}".format(
-                            (x1, y1), g1
-                        )
-                    )
-                    print(
-                        "Group seated at coordinates {} and size {}".format(
-                            (x2, y2), g2
-                        )
-                    )
-                    print("----")
-                    cinema_meets_corona_guidelines = False
-    if cinema_meets_corona_guidelines:
+    for kind, (pos1, g1), (pos2, g2) in violations[:shown]:
+        print("CORONA ALERT")
+        print("{} guidline has been violated".format(str(kind)))
+        print("Group seated at coordinates {} and size {}".format(pos1, g1))
+        print("Group seated at coordinates {} and size {}".format(pos2, g2))
+        print("----")
+    if len(violations) > shown:
+        print("... and {} more violations".format(len(violations) - shown))
+
+    if len(violations) == 0:
         print("CONGRATULATIONS! YOUR CINEMA SEATING MEETS THE CORONA GUIDELINES!")
     else:
         print("DOOOOH! YOUR CINEMA SEATING DOES NOT MEET THE CORONA GUIDELINES!")
 
-    return cinema_meets_corona_guidelines
+    return len(violations) == 0
 
 
 class TestCheckLegal(unittest.TestCase):
@@ -197,6 +409,61 @@ class TestCheckLegal(unittest.TestCase):
         self.assertEqual(check_legal(5, 5, x1=0, x2=0, y1=2, y2=1), False)
 
 
+class TestReadHall(unittest.TestCase):
+    """Checks for read_hall"""
+
+    def read(self, text):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, "instance.txt")
+            with open(filename, "w") as f:
+                f.write(text)
+            return read_hall(filename)
+
+    def test_hall(self):
+        problem, h, v, rest = self.read("2\n3\n101\n011\n1 2\n")
+        self.assertEqual(problem.tolist(), [[1, 0, 1], [0, 1, 1]])
+        self.assertEqual(rest, [b"1 2"])
+        # The last row without a newline
+        problem, _, _, rest = self.read("2\n3\n101\n011")
+        self.assertEqual(problem.tolist(), [[1, 0, 1], [0, 1, 1]])
+        self.assertEqual(rest, [])
+
+    def test_malformed(self):
+        for text in ["2\n3\n101\n", "2\n3\n101\n01\n1 2\n", "2\n3\n10\n011\n", "2\n3\n101\n01"]:
+            with self.assertRaisesRegex(ValueError, "instance.txt"):
+                self.read(text)
+
+
+class TestFindViolations(unittest.TestCase):
+    """Checks for find_violations"""
+
+    def test_legal(self):
+        cinema = np.array([[2, 2, 1, 1, 2], [1, 1, 1, 1, 1], [1, 2, 2, 2, 1]])
+        self.assertEqual(find_violations(cinema), [])
+
+    def test_horizontal(self):
+        cinema = np.array([[2, 2, 1, 2, 1]])
+        self.assertEqual(find_violations(cinema), [
+            Violation(LegalError.horizontal, ((0, 0), 2), ((3, 0), 1))])
+
+    def test_vertical(self):
+        cinema = np.array([[2, 1], [2, 1]])
+        self.assertEqual(find_violations(cinema), [
+            Violation(LegalError.vertical, ((0, 0), 1), ((0, 1), 1))])
+
+    def test_diagonal(self):
+        cinema = np.array([[1, 2, 2], [2, 1, 1]])
+        self.assertEqual(find_violations(cinema), [
+            Violation(LegalError.diagnol, ((1, 0), 2), ((0, 1), 1))])
+        self.assertEqual(find_violations(np.array([[1, 1, 2], [2, 1, 1]])), [])
+
+    def test_batch(self):
+        legal = np.array([[2, 1, 1, 2], [1, 1, 1, 1]])
+        illegal = np.array([[2, 1, 1, 2], [1, 1, 1, 2]])
+        result = verify_batch([legal, illegal, np.array([[2, 1, 2]])])
+        self.assertEqual([len(v) for v in result], [0, 1, 1])
+
+
 def ones(a):
     # Create an array that is 1 where a is 0
     # Pad with 0 at the end
@@ -207,6 +474,15 @@ def ones(a):
     return ranges
 
 
+def seated_groups(seats):
+    """(y, x, size) of every group in a seating, groups in a row never touch"""
+    groups = []
+    for y, row in enumerate(seats):
+        for start, end in ones((row == 2).astype(int)):
+            groups.append((y, int(start), int(end - start)))
+    return groups
+
+
 def find_legal_start_positions(n, seats):
     opts = []
     for i, row in enumerate(seats):